@@ -5,6 +5,7 @@ import dash_bootstrap_components as dbc
 from dash.dependencies import Input, Output
 from pages import home, pacientes, medicos, clinicas, consultas, analytics
 from dash import html
+import metrics
 
 # Importa página NoSQL (opcional - não quebra se não tiver Firebase configurado)
 try:
@@ -33,6 +34,10 @@ if NOSQL_ENABLED:
     except Exception:
         pass
 
+
+# Medição dos callbacks, /metrics (Prometheus) e /_stats/queries
+metrics.registrar(app)
+
 navbar = dbc.Navbar(
     dbc.Container([
         dbc.Row([
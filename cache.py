@@ -0,0 +1,387 @@
+"""
+Cache de resultados de consultas (memória + disco opcional)
+Sistema de Consultório Médico
+
+- Memória: LRU limitado por tamanho em bytes, TTL por entrada, seguro entre threads.
+- Disco (opcional, Config.CACHE_DIR): DataFrames em Parquet (se pyarrow estiver
+  instalado) ou pickle; sobrevive a reinícios e é compartilhado entre workers do gunicorn.
+- Chaves normalizadas por make_key(), para que filtros equivalentes ('' / None,
+  datas como texto ou date, multi-seleções em qualquer ordem) caiam na mesma entrada.
+- Invalidação por tabela: cada entrada declara as tabelas de que depende e é removida
+  quando Database.execute_query publica uma escrita numa delas (db.subscribe); entradas
+  sem tabelas declaradas caem em qualquer escrita. O TTL fica como rede de segurança
+  para escritas de outros processos.
+- Métricas (hits, misses, evictions...) por cache, reunidas em cache_stats().
+
+Uso:
+    from cache import get_cache, make_key
+    analytics_cache = get_cache('analytics', ttl=300)
+    df = analytics_cache.get_or_set(make_key(clinica, medico, inicio, fim),
+                                    lambda: db.fetch_frame(sql, params),
+                                    tables=('tabelaconsulta', 'tabelamedico'))
+
+Valores em cache são compartilhados entre callbacks: trate-os como somente leitura
+(copie um DataFrame antes de acrescentar colunas).
+"""
+
+import hashlib
+import logging
+import os
+import pickle
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+from typing import Any, Callable, Dict, FrozenSet, Hashable, Iterable, Optional, Tuple
+
+import pandas as pd
+
+from config import Config
+from db import db
+
+try:
+    import pyarrow  # noqa: F401  (habilita Parquet no cache em disco)
+    PARQUET_DISPONIVEL = True
+except ImportError:
+    PARQUET_DISPONIVEL = False
+
+logger = logging.getLogger("consultorio.cache")
+
+
+def _normalizar(valor: Any) -> Hashable:
+    if valor is None or (isinstance(valor, str) and not valor.strip()):
+        return None
+    if isinstance(valor, str):
+        return valor.strip()
+    if isinstance(valor, datetime):
+        return valor.isoformat(sep=' ')
+    if isinstance(valor, date):
+        return valor.isoformat()
+    if isinstance(valor, (list, tuple, set, frozenset)):
+        itens = [_normalizar(v) for v in valor]
+        if isinstance(valor, (set, frozenset)):
+            itens = sorted(itens, key=repr)
+        return tuple(itens) or None
+    if isinstance(valor, dict):
+        return tuple(sorted((str(k), _normalizar(v)) for k, v in valor.items()))
+    return valor
+
+
+def make_key(*partes: Any, **filtros: Any) -> Tuple:
+    """
+    Chave de cache normalizada: strings sem espaços nas pontas, '' vira None,
+    date/datetime viram ISO, sets são ordenados (passe multi-seleções como set) e
+    filtros nomeados entram em ordem alfabética.
+    Ex.: make_key('consultas', clinica='3', periodo=(d1, d2)).
+    """
+    return tuple(_normalizar(p) for p in partes) + tuple(
+        (nome, _normalizar(valor)) for nome, valor in sorted(filtros.items()))
+
+
+def tamanho_estimado(valor: Any) -> int:
+    """Tamanho aproximado em bytes (DataFrames pela memória real, inclusive strings)"""
+    if isinstance(valor, (pd.DataFrame, pd.Series)):
+        uso = valor.memory_usage(deep=True)
+        return int(uso.sum() if isinstance(uso, pd.Series) else uso)
+    if isinstance(valor, (list, tuple)):
+        return sys.getsizeof(valor) + sum(tamanho_estimado(v) for v in valor)
+    if isinstance(valor, dict):
+        return sys.getsizeof(valor) + sum(sys.getsizeof(k) + tamanho_estimado(v) for k, v in valor.items())
+    return sys.getsizeof(valor)
+
+
+class QueryCache:
+    """LRU em memória com orçamento em bytes e TTL por entrada, com camada em disco opcional"""
+
+    def __init__(self, nome: str, max_bytes: int, ttl: float, disk_dir: Optional[str] = None):
+        self.nome = nome
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.disk_dir = os.path.join(disk_dir, nome) if disk_dir else None
+        # chave -> (expira_em, tamanho, valor, tabelas); a ordem é a de uso (mais recente no fim)
+        self._entradas: "OrderedDict[Hashable, Tuple[float, int, Any, Optional[FrozenSet[str]]]]" = OrderedDict()
+        # incrementada a cada invalidação por tabela; get_or_set descarta resultados
+        # carregados durante uma escrita (poderiam conter o estado anterior)
+        self._geracao = 0
+        self._bytes = 0
+        self._lock = threading.RLock()
+        # chaves sendo carregadas por get_or_set (evita que vários callbacks rodem a mesma query)
+        self._carregando: Dict[Hashable, threading.Event] = {}
+        self.stats = {'hits': 0, 'misses': 0, 'disk_hits': 0, 'sets': 0, 'evictions': 0,
+                      'expirations': 0, 'invalidations': 0, 'rejected': 0, 'stale_loads': 0}
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    # ==================== MEMÓRIA ====================
+
+    def _remover(self, chave: Hashable):
+        tamanho = self._entradas.pop(chave)[1]
+        self._bytes -= tamanho
+
+    def _guardar(self, chave: Hashable, valor: Any, expira_em: float,
+                 tabelas: Optional[FrozenSet[str]]) -> bool:
+        tamanho = tamanho_estimado(valor)
+        with self._lock:
+            if chave in self._entradas:
+                self._remover(chave)
+            if tamanho > self.max_bytes:
+                self.stats['rejected'] += 1
+                logger.warning(f"Cache {self.nome}: valor de {tamanho} bytes excede o limite de "
+                               f"{self.max_bytes}; não armazenado em memória")
+                return False
+            while self._bytes + tamanho > self.max_bytes and self._entradas:
+                self._remover(next(iter(self._entradas)))
+                self.stats['evictions'] += 1
+            self._entradas[chave] = (expira_em, tamanho, valor, tabelas)
+            self._bytes += tamanho
+            return True
+
+    def get(self, chave: Hashable, default: Any = None) -> Any:
+        """Valor em cache (memória, depois disco) ou ``default``"""
+        agora = time.time()
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is not None:
+                if entrada[0] > agora:
+                    self._entradas.move_to_end(chave)
+                    self.stats['hits'] += 1
+                    return entrada[2]
+                self._remover(chave)
+                self.stats['expirations'] += 1
+
+        if self.disk_dir:
+            encontrado, valor, expira_em, tabelas = self._ler_disco(chave, agora)
+            if encontrado:
+                self._guardar(chave, valor, expira_em, tabelas)
+                with self._lock:
+                    self.stats['disk_hits'] += 1
+                return valor
+
+        with self._lock:
+            self.stats['misses'] += 1
+        return default
+
+    def set(self, chave: Hashable, valor: Any, ttl: Optional[float] = None,
+            tables: Optional[Iterable[str]] = None):
+        """
+        Armazena ``valor`` por ``ttl`` segundos (padrão: TTL do cache).
+
+        Args:
+            tables: Tabelas de que o valor depende; None = invalidar em qualquer escrita
+        """
+        expira_em = time.time() + (self.ttl if ttl is None else ttl)
+        tabelas = frozenset(t.lower() for t in tables) if tables is not None else None
+        self._guardar(chave, valor, expira_em, tabelas)
+        with self._lock:
+            self.stats['sets'] += 1
+        if self.disk_dir:
+            self._gravar_disco(chave, valor, expira_em, tabelas)
+
+    def get_or_set(self, chave: Hashable, loader: Callable[[], Any], ttl: Optional[float] = None,
+                   tables: Optional[Iterable[str]] = None) -> Any:
+        """
+        Retorna o valor em cache ou chama ``loader()`` e armazena o resultado.
+        Chamadas simultâneas com a mesma chave esperam a primeira em vez de repetir a query.
+        Exceções do loader propagam e nada é armazenado; por isso loaders que leem do banco
+        devem usar ``raise_errors=True`` (fetch_all/fetch_one/fetch_frame), senão a lista ou
+        DataFrame vazio de uma falha fica em cache como se fosse o resultado.
+        """
+        ausente = object()
+        while True:
+            valor = self.get(chave, ausente)
+            if valor is not ausente:
+                return valor
+            with self._lock:
+                evento = self._carregando.get(chave)
+                if evento is None:
+                    evento = self._carregando[chave] = threading.Event()
+                    break
+            evento.wait()
+        try:
+            with self._lock:
+                geracao = self._geracao
+            valor = loader()
+            with self._lock:
+                obsoleto = geracao != self._geracao
+                if obsoleto:
+                    self.stats['stale_loads'] += 1
+            if not obsoleto:
+                self.set(chave, valor, ttl, tables)
+            return valor
+        finally:
+            with self._lock:
+                self._carregando.pop(chave, None)
+            evento.set()
+
+    def invalidate(self, predicado: Optional[Callable[[Hashable], bool]] = None) -> int:
+        """
+        Remove as entradas cuja chave satisfaz ``predicado`` (todas, se None),
+        da memória e do disco.
+
+        Returns:
+            int: quantidade de entradas removidas da memória
+        """
+        return self._invalidar(lambda chave, tabelas: predicado is None or predicado(chave))
+
+    def invalidate_tables(self, tables: Iterable[str]) -> int:
+        """
+        Remove as entradas que dependem de alguma das ``tables`` (e as sem tabelas declaradas).
+
+        Returns:
+            int: quantidade de entradas removidas da memória
+        """
+        alteradas = frozenset(t.lower() for t in tables)
+        with self._lock:
+            self._geracao += 1
+        return self._invalidar(lambda chave, tabelas: tabelas is None or not tabelas.isdisjoint(alteradas))
+
+    def _invalidar(self, predicado: Callable[[Hashable, Optional[FrozenSet[str]]], bool]) -> int:
+        with self._lock:
+            chaves = [c for c, entrada in self._entradas.items() if predicado(c, entrada[3])]
+            for chave in chaves:
+                self._remover(chave)
+            self.stats['invalidations'] += len(chaves)
+        if self.disk_dir:
+            self._limpar_disco(predicado)
+        return len(chaves)
+
+    def clear(self):
+        self.invalidate()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Métricas do cache (contadores, ocupação e taxa de acerto)"""
+        with self._lock:
+            dados = dict(self.stats)
+            dados.update({
+                'entries': len(self._entradas),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+            })
+        consultas = dados['hits'] + dados['disk_hits'] + dados['misses']
+        dados['hit_ratio'] = (dados['hits'] + dados['disk_hits']) / consultas if consultas else 0.0
+        return dados
+
+    # ==================== DISCO ====================
+
+    def _arquivo(self, chave: Hashable) -> str:
+        nome = hashlib.sha1(repr(chave).encode('utf-8')).hexdigest()
+        return os.path.join(self.disk_dir, nome)
+
+    def _ler_disco(self, chave: Hashable, agora: float) -> Tuple[bool, Any, float, Optional[FrozenSet[str]]]:
+        base = self._arquivo(chave)
+        try:
+            with open(base + '.meta', 'rb') as f:
+                meta = pickle.load(f)
+            if meta['chave'] != chave:
+                return False, None, 0.0, None
+            if meta['expira_em'] <= agora:
+                self._apagar_arquivos(base)
+                return False, None, 0.0, None
+            if meta['formato'] == 'parquet':
+                valor = pd.read_parquet(base + '.parquet')
+            else:
+                with open(base + '.pkl', 'rb') as f:
+                    valor = pickle.load(f)
+            return True, valor, meta['expira_em'], meta.get('tabelas')
+        except FileNotFoundError:
+            return False, None, 0.0, None
+        except Exception as e:
+            logger.warning(f"Cache {self.nome}: entrada em disco ilegível ({e}); descartando")
+            self._apagar_arquivos(base)
+            return False, None, 0.0, None
+
+    def _gravar_disco(self, chave: Hashable, valor: Any, expira_em: float,
+                      tabelas: Optional[FrozenSet[str]]):
+        base = self._arquivo(chave)
+        formato = 'parquet' if PARQUET_DISPONIVEL and isinstance(valor, pd.DataFrame) else 'pkl'
+        temporario = None
+        try:
+            # dados primeiro, metadados por último (rename atômico): quem lê o .meta acha os dados
+            fd, temporario = tempfile.mkstemp(dir=self.disk_dir, prefix='.tmp_')
+            os.close(fd)
+            if formato == 'parquet':
+                valor.to_parquet(temporario)
+            else:
+                with open(temporario, 'wb') as f:
+                    pickle.dump(valor, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporario, f"{base}.{formato}")
+            fd, temporario = tempfile.mkstemp(dir=self.disk_dir, prefix='.tmp_')
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump({'chave': chave, 'expira_em': expira_em, 'formato': formato,
+                             'tabelas': tabelas}, f)
+            os.replace(temporario, base + '.meta')
+        except Exception as e:
+            logger.warning(f"Cache {self.nome}: não foi possível gravar em disco: {e}")
+            if temporario and os.path.exists(temporario):
+                os.unlink(temporario)
+
+    @staticmethod
+    def _apagar_arquivos(base: str):
+        for sufixo in ('.meta', '.parquet', '.pkl'):
+            try:
+                os.unlink(base + sufixo)
+            except FileNotFoundError:
+                pass
+
+    def _limpar_disco(self, predicado: Callable[[Hashable, Optional[FrozenSet[str]]], bool]):
+        for nome in os.listdir(self.disk_dir):
+            if not nome.endswith('.meta'):
+                continue
+            base = os.path.join(self.disk_dir, nome[:-len('.meta')])
+            try:
+                with open(base + '.meta', 'rb') as f:
+                    meta = pickle.load(f)
+                if not predicado(meta['chave'], meta.get('tabelas')):
+                    continue
+                self._apagar_arquivos(base)
+            except FileNotFoundError:
+                pass
+            except Exception:
+                self._apagar_arquivos(base)
+
+
+# ==================== REGISTRO ====================
+
+_caches: Dict[str, QueryCache] = {}
+_registro_lock = threading.Lock()
+
+
+def get_cache(nome: str, ttl: Optional[float] = None, max_bytes: Optional[int] = None,
+              disk: bool = True) -> QueryCache:
+    """
+    Cache nomeado (criado na primeira chamada). Padrões em Config: CACHE_TTL,
+    CACHE_MAX_BYTES e CACHE_DIR (camada em disco desligada se vazio ou ``disk=False``).
+    """
+    with _registro_lock:
+        cache = _caches.get(nome)
+        if cache is None:
+            cache = _caches[nome] = QueryCache(
+                nome,
+                max_bytes=Config.CACHE_MAX_BYTES if max_bytes is None else max_bytes,
+                ttl=Config.CACHE_TTL if ttl is None else ttl,
+                disk_dir=Config.CACHE_DIR if disk else None,
+            )
+        return cache
+
+
+def invalidar_tabelas(tabelas: Iterable[str]):
+    """Invalida, em todos os caches, as entradas que dependem das ``tabelas``"""
+    with _registro_lock:
+        caches = list(_caches.values())
+    for cache in caches:
+        removidas = cache.invalidate_tables(tabelas)
+        if removidas:
+            logger.debug(f"Cache {cache.nome}: {removidas} entrada(s) invalidada(s) por {sorted(tabelas)}")
+
+
+# escritas feitas por db.execute_query invalidam as entradas afetadas
+db.subscribe(invalidar_tabelas)
+
+
+def cache_stats() -> Dict[str, Dict[str, Any]]:
+    """Métricas de todos os caches registrados: {nome: snapshot}"""
+    with _registro_lock:
+        caches = list(_caches.values())
+    return {cache.nome: cache.snapshot() for cache in caches}
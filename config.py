@@ -16,6 +16,45 @@ class Config:
     DEMO = os.getenv('DEMO', 'false').lower() in ('1', 'true', 'yes')
     DB_USE_SQLITE_FALLBACK = os.getenv('DB_USE_SQLITE_FALLBACK', 'true').lower() in ('1', 'true', 'yes')
     SQLITE_PATH = os.getenv('SQLITE_PATH', os.path.join(os.path.dirname(__file__), 'demo.sqlite'))
+    # Pool de conexões MySQL (callbacks concorrentes do Dash / threads do gunicorn)
+    DB_POOL_ENABLED = os.getenv('DB_POOL_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    DB_POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN_SIZE', 1))
+    DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', 10))
+    # Tempo máximo (segundos) que um callback espera por uma conexão livre
+    DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 10))
+    # Conexões ociosas há mais que isso (segundos) recebem um ping antes do uso;
+    # as demais são usadas direto e só revalidadas se a query falhar
+    DB_IDLE_CHECK_SECONDS = float(os.getenv('DB_IDLE_CHECK_SECONDS', 30))
+    # Cache de resultados (cache.py): orçamento em memória por cache, TTL padrão (s)
+    # e diretório da camada em disco (vazio = só memória)
+    CACHE_MAX_BYTES = int(float(os.getenv('CACHE_MAX_MB', 128)) * 1024 * 1024)
+    CACHE_TTL = float(os.getenv('CACHE_TTL', 300))
+    CACHE_DIR = os.getenv('CACHE_DIR', '') or None
+    # Validade (s) dos indicadores do dashboard principal
+    HOME_CACHE_TTL = float(os.getenv('HOME_CACHE_TTL', 60))
+    # Consultas independentes de uma página em paralelo (fanout.py): threads e prazo (s)
+    # para o dashboard principal; o que não responder no prazo aparece como indisponível
+    FANOUT_WORKERS = int(os.getenv('FANOUT_WORKERS', DB_POOL_MAX_SIZE))
+    HOME_DEADLINE = float(os.getenv('HOME_DEADLINE', 5))
+    # Contagens dos cartões de KPI (db.table_counts): COUNT(*) exato ou estimativa do
+    # catálogo (information_schema/sqlite_stat1), e por quantos segundos ficam em cache
+    TABLE_COUNTS_EXACT = os.getenv('TABLE_COUNTS_EXACT', 'true').lower() in ('1', 'true', 'yes')
+    TABLE_COUNTS_TTL = float(os.getenv('TABLE_COUNTS_TTL', 30))
+    # Registro das formas de consulta (query_log.py) usado pelo index_advisor.py: liga/desliga,
+    # limite de formas por processo, arquivo JSON Lines (vazio = só memória) e intervalo de gravação (s)
+    QUERY_LOG_ENABLED = os.getenv('QUERY_LOG_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    QUERY_LOG_MAX_SHAPES = int(os.getenv('QUERY_LOG_MAX_SHAPES', 500))
+    QUERY_LOG_PATH = os.getenv('QUERY_LOG_PATH', '') or None
+    QUERY_LOG_FLUSH_SECONDS = float(os.getenv('QUERY_LOG_FLUSH_SECONDS', 300))
+    # Rotas operacionais (metrics.py): acumulado do registro de consultas em JSON e métricas
+    # no formato do Prometheus (vazio = desligada)
+    QUERY_STATS_ROUTE = os.getenv('QUERY_STATS_ROUTE', '/_stats/queries')
+    METRICS_ROUTE = os.getenv('METRICS_ROUTE', '/metrics')
+    # Log de consultas lentas: limite (ms; 0 = desligado), intervalo mínimo (s) entre dois
+    # EXPLAIN da mesma forma e arquivo próprio (vazio = só o log da aplicação)
+    SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', 500))
+    SLOW_QUERY_EXPLAIN_INTERVAL = float(os.getenv('SLOW_QUERY_EXPLAIN_INTERVAL', 60))
+    SLOW_QUERY_LOG_PATH = os.getenv('SLOW_QUERY_LOG_PATH', '') or None
     
     @staticmethod
     def get_connection_string():
@@ -0,0 +1,170 @@
+"""
+Tradução de filtros/ordenação do dash_table.DataTable para SQL
+Sistema de Consultório Médico
+
+Com ``filter_action='custom'``, ``sort_action='custom'`` e ``page_action='custom'`` a tabela
+não recebe todas as linhas: o callback recebe ``filter_query``, ``sort_by`` e a página atual,
+e busca no banco só a página visível. Este módulo converte ``filter_query`` (sintaxe do
+DataTable, ex. ``{NomePac} scontains ana && {Genero} s= F``) e ``sort_by`` em cláusulas
+WHERE/ORDER BY parametrizadas (placeholders %s, adaptados para o SQLite por db.py).
+
+Só colunas declaradas em ``colunas`` ({id da coluna no DataTable: expressão SQL}) são
+aceitas; o resto do filtro é ignorado (e logado), nunca interpolado no SQL.
+
+As páginas são lidas por chave (db.fetch_keyset) com ``buscar_pagina``, que guarda num
+dcc.Store o cursor de cada página visitada.
+"""
+
+import json
+import logging
+import re
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from db import db, encode_cursor
+
+logger = logging.getLogger("consultorio.datatable_sql")
+
+# {coluna} operador valor, com valor opcionalmente entre aspas (", ' ou `)
+_CONDICAO = re.compile(
+    r'^\s*\{(?P<coluna>[^}]+)\}\s+'
+    r'(?P<op>[si]?(?:contains|datestartswith|eq|ne|lt|le|gt|ge|!=|<=|>=|=|<|>)|is blank|is not blank)'
+    r'(?:\s+(?P<valor>.*?))?\s*$',
+    re.IGNORECASE)
+
+_COMPARACOES = {
+    'eq': '=', '=': '=', 'ne': '<>', '!=': '<>',
+    'lt': '<', '<': '<', 'le': '<=', '<=': '<=',
+    'gt': '>', '>': '>', 'ge': '>=', '>=': '>=',
+}
+
+
+def _sem_aspas(valor: Optional[str]) -> str:
+    valor = (valor or '').strip()
+    if len(valor) >= 2 and valor[0] == valor[-1] and valor[0] in '"\'`':
+        return valor[1:-1].replace('\\' + valor[0], valor[0])
+    return valor
+
+
+def _escapar_like(valor: str) -> str:
+    """Escapa os curingas de LIKE (usado com ESCAPE '!', válido em MySQL e SQLite)"""
+    return valor.replace('!', '!!').replace('%', '!%').replace('_', '!_')
+
+
+def filtro_para_sql(filter_query: Optional[str], colunas: Dict[str, str]) -> Tuple[List[str], List]:
+    """
+    Converte o ``filter_query`` do DataTable em condições SQL.
+
+    Args:
+        filter_query: Expressão do DataTable (condições unidas por ``&&``)
+        colunas: {id da coluna: expressão SQL} permitidas no filtro
+
+    Returns:
+        Tuple[List[str], List]: (condições para juntar com AND, parâmetros na mesma ordem)
+    """
+    condicoes: List[str] = []
+    params: List = []
+    if not filter_query:
+        return condicoes, params
+
+    for parte in filter_query.split(' && '):
+        match = _CONDICAO.match(parte)
+        if not match or match.group('coluna') not in colunas:
+            logger.warning(f"Filtro ignorado: {parte!r}")
+            continue
+        expressao = colunas[match.group('coluna')]
+        op = match.group('op').lower()
+        valor = _sem_aspas(match.group('valor'))
+
+        if op == 'is blank':
+            condicoes.append(f"({expressao} IS NULL OR {expressao} = '')")
+            continue
+        if op == 'is not blank':
+            condicoes.append(f"({expressao} IS NOT NULL AND {expressao} <> '')")
+            continue
+        if not valor:
+            continue
+
+        # prefixos s/i (sensível/insensível a maiúsculas) seguem a collation do banco
+        op = op[1:] if op[0] in 'si' and (op[1:] == 'contains' or op[1:] in _COMPARACOES) else op
+        if op == 'contains':
+            condicoes.append(f"{expressao} LIKE %s ESCAPE '!'")
+            params.append(f"%{_escapar_like(valor)}%")
+        elif op == 'datestartswith':
+            condicoes.append(f"{expressao} LIKE %s ESCAPE '!'")
+            params.append(f"{_escapar_like(valor)}%")
+        else:
+            condicoes.append(f"{expressao} {_COMPARACOES[op]} %s")
+            params.append(valor)
+    return condicoes, params
+
+
+def ordenacao_para_sql(sort_by: Optional[Sequence[Dict]], colunas: Dict[str, str],
+                       desempate: Sequence[str] = ()) -> List[str]:
+    """
+    Converte o ``sort_by`` do DataTable em termos de ORDER BY.
+
+    Args:
+        sort_by: [{'column_id': ..., 'direction': 'asc'|'desc'}, ...]
+        colunas: {id da coluna: expressão SQL} permitidas na ordenação
+        desempate: Expressões acrescentadas ao final (chave única) para a ordem ser estável,
+                   na direção do último termo
+
+    Returns:
+        List[str]: termos ``expressão ASC|DESC``
+    """
+    termos: List[str] = []
+    usadas = set()
+    direcao = 'ASC'
+    for item in sort_by or []:
+        expressao = colunas.get(item.get('column_id'))
+        if expressao is None or expressao in usadas:
+            continue
+        usadas.add(expressao)
+        direcao = 'DESC' if item.get('direction') == 'desc' else 'ASC'
+        termos.append(f"{expressao} {direcao}")
+    # desempate na direção do último termo: um índice (coluna, chave) serve a ordem inteira,
+    # percorrido de trás para frente quando DESC
+    for expressao in desempate:
+        if expressao not in usadas:
+            termos.append(f"{expressao} {direcao}")
+    return termos
+
+
+def where_sql(condicoes: Sequence[str]) -> str:
+    """`` WHERE a AND b`` (ou string vazia)"""
+    return f" WHERE {' AND '.join(condicoes)}" if condicoes else ""
+
+
+def buscar_pagina(query: str, params: Sequence, ordem: Sequence[str], page_current: int,
+                  page_size: int, estado: Optional[Dict], nullable: Sequence[str] = ()
+                  ) -> Tuple[List[Dict[str, Any]], Dict]:
+    """
+    Linhas da página ``page_current`` por chave (db.fetch_keyset), a partir do cursor
+    guardado em ``estado`` para ela. Páginas ainda não visitadas (salto pelo número da
+    página) usam OFFSET uma vez e passam a ter cursor para a seguinte.
+
+    Args:
+        query: SELECT sem ORDER BY/LIMIT (ver db.fetch_keyset)
+        ordem: Termos "Coluna ASC|DESC" terminando numa chave única
+        estado: Conteúdo do dcc.Store da tabela ({'assinatura': ..., 'cursores': {...}})
+        nullable: Colunas de ``ordem`` que admitem NULL
+
+    Returns:
+        Tuple[List[dict], dict]: (linhas, novo estado para o dcc.Store)
+    """
+    # cursores só valem para a mesma consulta/ordem/tamanho de página; escritas não os invalidam
+    assinatura = json.dumps([query, list(params), list(ordem), page_size], default=str)
+    estado = estado or {}
+    cursores = dict(estado.get('cursores', {})) if estado.get('assinatura') == assinatura else {}
+
+    chave = str(page_current)
+    if page_current == 0 or chave in cursores:
+        linhas, proximo = db.fetch_keyset(query, params, ordem, limit=page_size,
+                                          cursor=cursores.get(chave), nullable=nullable)
+    else:
+        linhas = db.fetch_all_paginated(f"SELECT * FROM ({query}) AS pagina ORDER BY {', '.join(ordem)}", params,
+                                        limit=page_size, offset=page_current * page_size)
+        proximo = encode_cursor(linhas[-1], ordem) if len(linhas) == page_size else None
+    if proximo:
+        cursores[str(page_current + 1)] = proximo
+    return linhas, {'assinatura': assinatura, 'cursores': cursores}
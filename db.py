@@ -1,10 +1,23 @@
+import base64
+import hashlib
+import json
 import logging
 import os
+import re
 import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
 from datetime import datetime
+from functools import wraps
 import mysql.connector
+import pandas as pd
 from mysql.connector import Error
 from config import Config
+import query_log
+from query_log import QUERY_LOG
 
 # logging
 logger = logging.getLogger("consultorio.db")
@@ -15,30 +28,434 @@ if not logger.handlers:
     logger.addHandler(h)
 logger.setLevel(logging.INFO)
 
+# consultas lentas (ver Database._slow_query); arquivo próprio opcional
+slow_logger = logging.getLogger("consultorio.slow_query")
+if Config.SLOW_QUERY_LOG_PATH and not slow_logger.handlers:
+    _slow_handler = logging.FileHandler(Config.SLOW_QUERY_LOG_PATH, encoding='utf-8')
+    _slow_handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
+    slow_logger.addHandler(_slow_handler)
+
+
+# Tabela alvo de um comando de escrita (INSERT/REPLACE/UPDATE/DELETE/TRUNCATE)
+_WRITE_TARGET = re.compile(
+    r"^\s*(?:INSERT\s+(?:OR\s+\w+\s+|IGNORE\s+)?(?:INTO\s+)?|REPLACE\s+(?:INTO\s+)?"
+    r"|UPDATE\s+(?:IGNORE\s+)?|DELETE\s+FROM\s+|TRUNCATE\s+(?:TABLE\s+)?)`?(\w+)`?",
+    re.IGNORECASE)
+
+# FKs ON DELETE/UPDATE CASCADE: alterar a tabela da chave altera também as dependentes
+CASCADE_TABLES = {
+    'tabelapaciente': ('tabelaconsulta',),
+    'tabelamedico': ('tabelaconsulta',),
+    'tabelaclinica': ('tabelaconsulta',),
+}
+
+
+def tables_written(query):
+    """Tabelas alteradas por um comando (alvo + cascatas); conjunto vazio se não for escrita"""
+    match = _WRITE_TARGET.match(query)
+    if not match:
+        return frozenset()
+    tabela = match.group(1).lower()
+    if match.group(0).lstrip()[:6].upper() == 'INSERT':
+        return frozenset((tabela,))
+    return frozenset((tabela,) + CASCADE_TABLES.get(tabela, ()))
+
+
+# LIMIT no fim do comando (não em subconsultas nem dentro de nomes/valores)
+_TRAILING_LIMIT = re.compile(
+    r"\bLIMIT\s+(?:\d+|%s|\?)(?:\s*(?:,|\bOFFSET\b)\s*(?:\d+|%s|\?))?\s*;?\s*$", re.IGNORECASE)
+
+# Termo de ordenação da paginação por chave: "Coluna" ou "Coluna ASC|DESC"
+_ORDER_TERM = re.compile(r"^\s*(\w+)(?:\s+(ASC|DESC))?\s*$", re.IGNORECASE)
+
+
+def _parse_order(order_by):
+    """[(coluna, descendente)] a partir de termos "Coluna [ASC|DESC]"; ValueError se inválido"""
+    termos = []
+    for termo in order_by:
+        match = _ORDER_TERM.match(termo)
+        if not match:
+            raise ValueError(f"Termo de ordenação inválido para paginação por chave: {termo!r}")
+        termos.append((match.group(1), (match.group(2) or 'ASC').upper() == 'DESC'))
+    if not termos:
+        raise ValueError("Paginação por chave exige ao menos uma coluna de ordenação")
+    return termos
+
+
+def _order_signature(termos):
+    texto = ','.join(f"{col}:{'d' if desc else 'a'}" for col, desc in termos)
+    return hashlib.sha1(texto.encode('utf-8')).hexdigest()[:8]
+
+
+def encode_cursor(row, order_by):
+    """Token opaco (base64 url-safe) com os valores da chave de ordenação de ``row``"""
+    termos = _parse_order(order_by)
+    valores = [row[col] for col, _ in termos]
+    dados = json.dumps({'o': _order_signature(termos), 'k': valores}, default=str, separators=(',', ':'))
+    return base64.urlsafe_b64encode(dados.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, order_by):
+    """Valores da chave contidos no token; ValueError se malformado ou de outra ordenação"""
+    termos = _parse_order(order_by)
+    try:
+        dados = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode('utf-8'))
+        valores = dados['k']
+        assinatura = dados['o']
+    except Exception as e:
+        raise ValueError(f"Cursor de paginação inválido: {e}")
+    if assinatura != _order_signature(termos) or len(valores) != len(termos):
+        raise ValueError("Cursor de paginação gerado para outra ordenação")
+    return valores
+
+
+def _seek_condition(termos, valores, nullable=(), row_values=False):
+    """
+    Condição "linha vem depois da chave ``valores``" na ordem ``termos``.
+
+    Forma geral: limite na primeira coluna (abre um range no índice) E a expansão
+    (a > ?) OR (a = ? AND b > ?) OR ..., que aceita direções mistas. Com ``row_values``
+    (SQLite), direção única e chave sem NULLs, usa (a, b, ...) > (?, ?, ...), que o
+    SQLite resolve como um único SEARCH no índice. Colunas em ``nullable`` (ou com valor
+    NULL no cursor) seguem a regra comum a MySQL e SQLite: NULLs primeiro em ASC e por
+    último em DESC.
+    """
+    colunas = [col for col, _ in termos]
+    anulaveis = set(nullable) | {col for col, valor in zip(colunas, valores) if valor is None}
+    if row_values and len({desc for _, desc in termos}) == 1 and not anulaveis & set(colunas):
+        op = '<' if termos[0][1] else '>'
+        return f"({', '.join(colunas)}) {op} ({', '.join(['%s'] * len(colunas))})", list(valores)
+
+    def depois(col, desc, valor, inclusivo=False):
+        if valor is None:
+            return ("1 = 0", []) if desc else (f"{col} IS NOT NULL", [])
+        op = ('<' if desc else '>') + ('=' if inclusivo else '')
+        if desc and col in anulaveis:
+            return f"({col} {op} %s OR {col} IS NULL)", [valor]
+        return f"{col} {op} %s", [valor]
+
+    def igual(col, valor):
+        return (f"{col} IS NULL", []) if valor is None else (f"{col} = %s", [valor])
+
+    ramos, params = [], []
+    for i, (col, desc) in enumerate(termos):
+        partes = []
+        for col_anterior, valor in zip(colunas[:i], valores[:i]):
+            sql, p = igual(col_anterior, valor)
+            partes.append(sql)
+            params += p
+        sql, p = depois(col, desc, valores[i])
+        partes.append(sql)
+        params += p
+        ramos.append(f"({' AND '.join(partes)})")
+    condicao = ' OR '.join(ramos)
+    if len(termos) > 1 and valores[0] is not None:
+        limite, p = depois(colunas[0], termos[0][1], valores[0], inclusivo=True)
+        return f"{limite} AND ({condicao})", p + params
+    return condicao, params
+
+
+# Leituras registradas no contexto atual (ver capture_queries)
+_capture = ContextVar('consultorio_db_capture', default=None)
+
+
+@contextmanager
+def capture_queries():
+    """
+    Registra (query, params) de cada leitura feita neste contexto, inclusive nas tarefas
+    de fanout.fan_out (que copiam o contexto). Usado pela auditoria de planos
+    (explain_audit.py); fora do bloco não há custo além de uma consulta ao ContextVar.
+    """
+    registro = []
+    token = _capture.set(registro)
+    try:
+        yield registro
+    finally:
+        _capture.reset(token)
+
+
+def _record(query, params):
+    registro = _capture.get()
+    if registro is not None:
+        registro.append((query, tuple(params or ())))
+
+
+# Linhas afetadas pelo comando de escrita em andamento (execute_query -> _timed)
+_affected = ContextVar('consultorio_db_affected', default=None)
+
+
+def _timed(method):
+    """
+    Instrumenta um comando: duração, linhas (devolvidas ou afetadas), bytes aproximados
+    e callback de origem vão para o registro de consultas (query_log.py); acima de
+    Config.SLOW_QUERY_MS o comando vai também para o log de consultas lentas.
+    """
+    @wraps(method)
+    def wrapper(self, query, params=None, *args, **kwargs):
+        inicio = time.perf_counter()
+        token = _affected.set(None)
+        resultado = None
+        try:
+            resultado = method(self, query, params, *args, **kwargs)
+            return resultado
+        finally:
+            duracao = time.perf_counter() - inicio
+            afetadas = _affected.get()
+            _affected.reset(token)
+            if afetadas is not None:
+                linhas, tamanho = max(afetadas, 0), 0
+            else:
+                linhas, tamanho = query_log.tamanho_resultado(resultado) or (0, 0)
+            QUERY_LOG.registrar(query, params, duracao, linhas, tamanho)
+            if 0 < Config.SLOW_QUERY_MS <= duracao * 1000:
+                self._slow_query(query, params, duracao, linhas, tamanho)
+    return wrapper
+
+
+# Tabelas dos cartões de KPI (ver Database.table_counts)
+KPI_TABLES = ('tabelapaciente', 'tabelamedico', 'tabelaclinica', 'tabelaconsulta')
+_IDENTIFIER = re.compile(r'^\w+$')
+
+
+# Tipos aplicados por fetch_frame às colunas conhecidas do esquema
+FRAME_DTYPES = {
+    'Data_Hora': 'datetime64[ns]',
+    'DataNascimento': 'datetime64[ns]',
+    'Genero': 'category',
+    'GeneroPac': 'category',
+    'Especialidade': 'category',
+}
+
+
+def _build_frame(columns, rows, dtypes):
+    """Monta um DataFrame coluna a coluna a partir das tuplas do cursor."""
+    if not rows:
+        return pd.DataFrame(columns=columns)
+
+    data = {}
+    for name, values in zip(columns, zip(*rows)):
+        dtype = dtypes.get(name)
+        if dtype is None:
+            data[name] = values
+        elif str(dtype).startswith('datetime64'):
+            data[name] = pd.to_datetime(pd.Series(values, dtype=object), errors='coerce').astype(dtype)
+        elif dtype == 'category':
+            data[name] = pd.Categorical(values)
+        else:
+            data[name] = pd.Series(values).astype(dtype)
+    return pd.DataFrame(data, columns=columns)
+
+
+def _is_connection_error(error):
+    """Erros que indicam conexão perdida/inutilizável, e não erro da query."""
+    return isinstance(error, (mysql.connector.errors.InterfaceError,
+                              mysql.connector.errors.OperationalError))
+
+
+class PoolTimeoutError(Exception):
+    """Nenhuma conexão do pool ficou livre dentro de Config.DB_POOL_TIMEOUT."""
+
+
+class ConnectionPool:
+    """Pool de conexões MySQL thread-safe.
+
+    Mantém entre ``min_size`` e ``max_size`` conexões abertas. Cada chamada de
+    ``Database`` pega uma conexão (checkout), usa e devolve (checkin), de modo
+    que callbacks concorrentes rodam em paralelo no MySQL em vez de disputar
+    uma única conexão compartilhada.
+    """
+
+    def __init__(self, factory, min_size=1, max_size=10, timeout=10.0, idle_check=30.0):
+        self._factory = factory
+        self.max_size = max(1, max_size)
+        self.min_size = min(max(0, min_size), self.max_size)
+        self.timeout = timeout
+        # só conexões ociosas há mais de ``idle_check`` segundos recebem ping no checkout
+        self.idle_check = idle_check
+        self._idle = deque()  # (conexão, instante da última devolução)
+        self._size = 0  # conexões abertas (livres + emprestadas)
+        self._cond = threading.Condition()
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+            'timeouts': 0,
+            'created': 0,
+            'discarded': 0,
+            'pings': 0,
+            'health_check_failures': 0,
+        }
+        for _ in range(self.min_size):
+            conn = self._factory()
+            self._size += 1
+            self._stats['created'] += 1
+            self._idle.append((conn, time.monotonic()))
+
+    def _healthy(self, conn, last_used):
+        if time.monotonic() - last_used < self.idle_check:
+            return True
+        with self._cond:
+            self._stats['pings'] += 1
+        try:
+            conn.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    def _close(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def get_connection(self):
+        """Empresta uma conexão, aguardando até ``timeout`` se o pool estiver cheio."""
+        start = time.monotonic()
+        waited = False
+        while True:
+            with self._cond:
+                while not self._idle and self._size >= self.max_size:
+                    remaining = self.timeout - (time.monotonic() - start)
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise PoolTimeoutError(
+                            f"Nenhuma conexão livre no pool após {self.timeout:.1f}s "
+                            f"({self._size}/{self.max_size} em uso)"
+                        )
+                    waited = True
+                    self._cond.wait(remaining)
+
+                conn, last_used = self._idle.pop() if self._idle else (None, None)
+                if conn is None:
+                    # reserva a vaga antes de abrir a conexão fora do lock
+                    self._size += 1
+
+            if conn is None:
+                try:
+                    conn = self._factory()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._stats['created'] += 1
+            elif not self._healthy(conn, last_used):
+                # conexão morta (timeout do servidor, restart): descarta e tenta outra
+                logger.warning("Conexão do pool falhou no health check; descartando")
+                self._close(conn)
+                with self._cond:
+                    self._size -= 1
+                    self._stats['health_check_failures'] += 1
+                    self._stats['discarded'] += 1
+                    self._cond.notify()
+                continue
+
+            waited_for = time.monotonic() - start
+            with self._cond:
+                self._stats['checkouts'] += 1
+                if waited:
+                    self._stats['waits'] += 1
+                    self._stats['wait_time_total'] += waited_for
+                    self._stats['wait_time_max'] = max(self._stats['wait_time_max'], waited_for)
+            return conn
+
+    def release(self, conn, discard=False):
+        """Devolve uma conexão ao pool; ``discard=True`` fecha em vez de reutilizar."""
+        if discard:
+            self._close(conn)
+        with self._cond:
+            if discard:
+                self._size -= 1
+                self._stats['discarded'] += 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def stats(self):
+        """Retorna tamanho, uso e tempos de espera do pool."""
+        with self._cond:
+            in_use = self._size - len(self._idle)
+            data = dict(self._stats)
+            data.update({
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': in_use,
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'utilization': in_use / self.max_size,
+            })
+        data['wait_time_avg'] = data['wait_time_total'] / data['waits'] if data['waits'] else 0.0
+        return data
+
+    def close(self):
+        with self._cond:
+            while self._idle:
+                self._close(self._idle.pop()[0])
+                self._size -= 1
+
 
 class Database:
     def __init__(self):
         self.connection = None
         self.use_sqlite = False
         self.sqlite_conn = None
+        self.pool = None
+        # serializa o uso da conexão direta (sem pool) e da conexão SQLite entre threads
+        self._lock = threading.RLock()
+        self._last_used = 0.0  # monotonic do último uso da conexão direta
+        self._liveness = {'pings': 0, 'reconnects': 0, 'read_retries': 0, 'connection_errors': 0}
+        self._connected_once = False
+        # assinantes de alterações de tabelas (ver subscribe)
+        self._subscribers = []
+        # contagens por tabela: {(tabela, exata): (total, expira_em)} (ver table_counts)
+        self._counts = {}
+        self._counts_lock = threading.Lock()
+        self._counts_generation = 0
+        # forma normalizada -> monotonic do último EXPLAIN de consulta lenta (ver _slow_query)
+        self._slow_explained = {}
+        self._slow_lock = threading.Lock()
+
+    def _new_mysql_connection(self, autocommit=False):
+        return mysql.connector.connect(
+            host=Config.DB_HOST,
+            port=Config.DB_PORT,
+            user=Config.DB_USER,
+            password=Config.DB_PASSWORD,
+            database=Config.DB_NAME,
+            autocommit=autocommit,
+            connect_timeout=15,
+            use_pure=False,  # Usar C extension para melhor performance
+            charset='utf8mb4',
+            collation='utf8mb4_unicode_ci',
+            get_warnings=True,
+            raise_on_warnings=False
+        )
 
     def _connect_mysql(self):
         try:
-            # Não usar pool, criar conexão direta para evitar problemas
-            self.connection = mysql.connector.connect(
-                host=Config.DB_HOST,
-                port=Config.DB_PORT,
-                user=Config.DB_USER,
-                password=Config.DB_PASSWORD,
-                database=Config.DB_NAME,
-                autocommit=False,  # Melhor controle de transações
-                connect_timeout=15,
-                use_pure=False,  # Usar C extension para melhor performance
-                charset='utf8mb4',
-                collation='utf8mb4_unicode_ci',
-                get_warnings=True,
-                raise_on_warnings=False
-            )
+            if Config.DB_POOL_ENABLED:
+                # Conexões do pool usam autocommit: cada leitura enxerga dados atuais
+                # e nenhuma transação aberta vaza para o próximo callback no checkin.
+                # execute_query continua chamando commit() explicitamente.
+                pool = ConnectionPool(
+                    lambda: self._new_mysql_connection(autocommit=True),
+                    min_size=Config.DB_POOL_MIN_SIZE,
+                    max_size=Config.DB_POOL_MAX_SIZE,
+                    timeout=Config.DB_POOL_TIMEOUT,
+                    idle_check=Config.DB_IDLE_CHECK_SECONDS,
+                )
+                # valida credenciais mesmo com DB_POOL_MIN_SIZE=0
+                pool.release(pool.get_connection())
+                self.pool = pool
+                logger.info(
+                    f"Pool MySQL ({pool.min_size}-{pool.max_size} conexões) em "
+                    f"{Config.DB_NAME}@{Config.DB_HOST}:{Config.DB_PORT} como {Config.DB_USER}"
+                )
+                return self.pool
+
+            self.connection = self._new_mysql_connection(autocommit=False)  # Melhor controle de transações
             logger.info(f"Conectado ao banco {Config.DB_NAME}@{Config.DB_HOST}:{Config.DB_PORT} como {Config.DB_USER}")
             return self.connection
         except Error as e:
@@ -119,6 +536,14 @@ class Database:
             c.close()
         except Exception as e:
             logger.error(f"Erro ao criar esquema SQLite: {e}")
+            return
+
+        # mesmos índices secundários do MySQL (declarados em index_manager.py)
+        try:
+            import index_manager
+            index_manager.sincronizar(self.sqlite_conn, sqlite=True)
+        except Exception as e:
+            logger.error(f"Erro ao sincronizar índices SQLite: {e}")
 
     def connect(self):
         # tenta conectar MySQL primeiro, a menos que DEMO force sqlite
@@ -142,13 +567,21 @@ class Database:
             if self.use_sqlite and self.sqlite_conn:
                 return True
 
+            if self.pool is not None:
+                # o pool valida cada conexão no checkout
+                return True
+
             if self.connection:
-                # Verifica se está conectado
+                # Conexão usada recentemente: confia nela sem round trip; se tiver
+                # caído, a query falha e as leituras reconectam e repetem.
+                if time.monotonic() - self._last_used < Config.DB_IDLE_CHECK_SECONDS:
+                    return True
                 try:
-                    if self.connection.is_connected():
-                        # Testa a conexão com ping
-                        self.connection.ping(reconnect=True, attempts=1, delay=0)
-                        return True
+                    # Ociosa há muito tempo (wait_timeout do servidor): um único ping
+                    self._liveness['pings'] += 1
+                    self.connection.ping(reconnect=True, attempts=1, delay=0)
+                    self._last_used = time.monotonic()
+                    return True
                 except Exception as e:
                     logger.warning(f"Conexão perdida: {e}")
                     # Fecha conexão antiga
@@ -162,12 +595,18 @@ class Database:
 
         # tentar reconectar
         logger.info("Reconectando ao banco...")
+        if self._connected_once:
+            self._liveness['reconnects'] += 1
         conn = self.connect()
         ok = False
         if self.use_sqlite:
             ok = self.sqlite_conn is not None
+        elif self.pool is not None:
+            ok = True
         else:
-            ok = conn is not None and self.connection.is_connected()
+            ok = conn is not None
+            self._last_used = time.monotonic()
+        self._connected_once = self._connected_once or ok
 
         if ok:
             logger.info("Conexão restabelecida")
@@ -179,148 +618,494 @@ class Database:
         # substitui placeholders %s por ? para sqlite
         return query.replace('%s', '?')
 
-    def execute_query(self, query, params=None):
+    @contextmanager
+    def _mysql_conn(self):
+        """Empresta uma conexão MySQL: do pool (checkout/checkin) ou a conexão direta sob lock."""
+        if self.pool is None:
+            with self._lock:
+                if self.connection is None:
+                    # derrubada por outra thread após erro de conexão
+                    self.ensure_connected()
+                if self.connection is None:
+                    raise mysql.connector.errors.InterfaceError(msg="Sem conexão com o MySQL")
+                try:
+                    yield self.connection
+                except Error as e:
+                    if _is_connection_error(e):
+                        self._drop_direct_connection()
+                    raise
+                finally:
+                    self._last_used = time.monotonic()
+            return
+
+        conn = self.pool.get_connection()
+        discard = False
+        try:
+            yield conn
+        except Error as e:
+            # conexão quebrada (2006/2013/2055...) não deve voltar ao pool
+            discard = _is_connection_error(e)
+            raise
+        finally:
+            self.pool.release(conn, discard=discard)
+
+    @contextmanager
+    def raw_connection(self):
+        """
+        Empresta a conexão DB-API para trabalhos com vários comandos (DDL, manutenção):
+        o SQLite sob o lock interno, o MySQL do pool (ou a conexão direta sob lock).
+        Commit/rollback ficam a cargo de quem chama; placeholders não são adaptados.
+        """
+        if not self.ensure_connected():
+            raise mysql.connector.errors.InterfaceError(msg="Sem conexão com o banco de dados")
+        if self.use_sqlite:
+            with self._lock:
+                yield self.sqlite_conn
+            return
+        with self._mysql_conn() as conn:
+            yield conn
+
+    def explain(self, query, params=None):
+        """
+        Plano de execução do comando, sem executá-lo: dicts do ``EXPLAIN`` no MySQL,
+        textos do ``EXPLAIN QUERY PLAN`` no SQLite.
+        """
+        with self.raw_connection() as conn:
+            if self.use_sqlite:
+                cursor = conn.execute(f"EXPLAIN QUERY PLAN {self._adapt_query_for_sqlite(query)}", params or ())
+                try:
+                    return [linha[3] for linha in cursor.fetchall()]
+                finally:
+                    cursor.close()
+            cursor = conn.cursor(dictionary=True, buffered=True)
+            try:
+                cursor.execute(f"EXPLAIN {query}", params or ())
+                return cursor.fetchall()
+            finally:
+                cursor.close()
+
+    def _slow_query(self, query, params, duracao, linhas, tamanho):
+        """
+        Registra um comando lento no logger consultorio.slow_query: SQL, parâmetros,
+        callback de origem e, no máximo uma vez por forma a cada
+        Config.SLOW_QUERY_EXPLAIN_INTERVAL segundos, o EXPLAIN (numa thread à parte,
+        para não atrasar mais o callback).
+        """
+        forma = query_log.normalizar(query)
+        cabecalho = (f"Consulta lenta: {duracao * 1000:.0f} ms, {linhas} linha(s), {tamanho} bytes, "
+                     f"callback {query_log.origem_atual() or '-'}\n"
+                     f"  SQL: {' '.join(query.split())}\n  params: {tuple(params or ())}")
+        agora = time.monotonic()
+        with self._slow_lock:
+            ultimo = self._slow_explained.get(forma)
+            explicar = (re.match(r'\s*(SELECT|WITH|INSERT|REPLACE|UPDATE|DELETE)\b', query, re.IGNORECASE)
+                        and (ultimo is None or agora - ultimo >= Config.SLOW_QUERY_EXPLAIN_INTERVAL))
+            if explicar:
+                self._slow_explained[forma] = agora
+        if not explicar:
+            slow_logger.warning(cabecalho)
+            return
+
+        def registrar():
+            try:
+                plano = self.explain(query, params)
+            except Exception as e:
+                slow_logger.warning(f"{cabecalho}\n  EXPLAIN falhou: {e}")
+                return
+            detalhes = '\n'.join(
+                f"    {linha}" if isinstance(linha, str) else
+                "    " + ', '.join(f"{k}={v}" for k, v in linha.items()
+                                   if k in ('table', 'type', 'key', 'rows', 'filtered', 'Extra') and v is not None)
+                for linha in plano)
+            slow_logger.warning(f"{cabecalho}\n  EXPLAIN:\n{detalhes}")
+
+        threading.Thread(target=registrar, name='slow-query-explain', daemon=True).start()
+
+    def _drop_direct_connection(self):
+        self._liveness['connection_errors'] += 1
+        try:
+            self.connection.close()
+        except Exception:
+            pass
+        self.connection = None
+
+    def _mysql_read(self, query, params, fetch, dictionary=True):
+        """Executa uma leitura no MySQL e aplica ``fetch`` ao cursor.
+
+        Leituras são idempotentes: se a conexão caiu (servidor reiniciado,
+        wait_timeout), reconecta e repete uma única vez de forma transparente.
+        """
+        for attempt in (1, 2):
+            try:
+                with self._mysql_conn() as conn:
+                    cursor = conn.cursor(dictionary=dictionary, buffered=True)
+                    try:
+                        cursor.execute(query, params or ())
+                        return fetch(cursor)
+                    finally:
+                        try:
+                            cursor.close()
+                        except Exception:
+                            pass
+            except Error as e:
+                if attempt == 2 or not _is_connection_error(e):
+                    raise
+                logger.warning(f"Conexão perdida durante leitura ({e}); repetindo a query")
+                self._liveness['read_retries'] += 1
+                if self.pool is not None:
+                    self._liveness['connection_errors'] += 1
+                elif not self.ensure_connected():
+                    raise
+
+    def connection_stats(self):
+        """Contadores de liveness: pings, reconexões e leituras repetidas."""
+        stats = dict(self._liveness)
+        if self.pool is not None:
+            pool = self.pool.stats()
+            stats['pings'] += pool['pings']
+            # cada conexão descartada é reaberta sob demanda no próximo checkout
+            stats['reconnects'] += pool['discarded']
+        return stats
+
+    def pool_stats(self):
+        """Estatísticas do pool (espera, utilização); dict vazio fora do modo pool."""
+        if self.pool is None:
+            return {}
+        return self.pool.stats()
+
+    def subscribe(self, callback):
+        """
+        Registra ``callback(tabelas)`` para ser chamado após cada escrita confirmada por
+        execute_query, com o frozenset das tabelas alteradas (nomes em minúsculas,
+        incluindo as que mudam por cascata). Erros no callback são logados e ignorados.
+
+        Returns:
+            Função que cancela a inscrição
+        """
+        with self._lock:
+            self._subscribers.append(callback)
+
+        def unsubscribe():
+            with self._lock:
+                if callback in self._subscribers:
+                    self._subscribers.remove(callback)
+        return unsubscribe
+
+    def notify_tables_changed(self, tables):
+        """Publica alteração nas ``tables`` (para escritas feitas fora de execute_query)"""
+        tabelas = frozenset(t.lower() for t in tables)
+        if not tabelas:
+            return
+        with self._counts_lock:
+            self._counts_generation += 1
+            for chave in [k for k in self._counts if k[0] in tabelas]:
+                del self._counts[chave]
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            try:
+                callback(tabelas)
+            except Exception as e:
+                logger.error(f"Erro em assinante de alterações ({sorted(tabelas)}): {e}")
+
+    @_timed
+    def execute_query(self, query, params=None, tables=None):
+        """
+        Executa um comando de escrita com commit e publica as tabelas alteradas
+        aos assinantes (ver subscribe).
+
+        Args:
+            tables: Tabelas alteradas, quando o alvo não é deduzível do SQL
+                    (somadas às detectadas em INSERT/UPDATE/DELETE)
+        """
         if not self.ensure_connected():
             logger.warning("Tentativa de executar query sem conexão")
             return False, "Sem conexão com o banco de dados"
 
+        alteradas = tables_written(query) | frozenset(tables or ())
+
         if self.use_sqlite:
             try:
                 q = self._adapt_query_for_sqlite(query)
-                cur = self.sqlite_conn.cursor()
-                cur.execute(q, params or ())
-                self.sqlite_conn.commit()
-                cur.close()
+                with self._lock:
+                    cur = self.sqlite_conn.cursor()
+                    cur.execute(q, params or ())
+                    _affected.set(cur.rowcount)
+                    self.sqlite_conn.commit()
+                    cur.close()
+                self.notify_tables_changed(alteradas)
                 return True, "Operação realizada com sucesso"
             except Exception as e:
                 logger.error(f"Erro SQLite ao executar query: {e}")
                 return False, str(e)
 
         # MySQL path
-        cursor = self.connection.cursor()
         try:
-            cursor.execute(query, params or ())
-            
-            # Captura warnings do MySQL (incluindo triggers)
-            warnings = []
-            try:
-                if cursor.warnings:
-                    cursor.execute("SHOW WARNINGS")
-                    for level, code, message in cursor.fetchall():
-                        warning_msg = f"{level} ({code}): {message}"
-                        warnings.append(warning_msg)
-                        logger.warning(f"MySQL Warning: {warning_msg}")
-            except:
-                pass
-            
-            # Commit explícito
-            self.connection.commit()
-            
+            with self._mysql_conn() as conn:
+                cursor = conn.cursor()
+                try:
+                    cursor.execute(query, params or ())
+                    _affected.set(cursor.rowcount)
+
+                    # Captura warnings do MySQL (incluindo triggers)
+                    warnings = []
+                    try:
+                        if cursor.warnings:
+                            cursor.execute("SHOW WARNINGS")
+                            for level, code, message in cursor.fetchall():
+                                warning_msg = f"{level} ({code}): {message}"
+                                warnings.append(warning_msg)
+                                logger.warning(f"MySQL Warning: {warning_msg}")
+                    except:
+                        pass
+
+                    # Commit explícito
+                    conn.commit()
+                except Error:
+                    try:
+                        conn.rollback()
+                    except:
+                        pass
+                    raise
+                finally:
+                    try:
+                        cursor.close()
+                    except Exception:
+                        pass
+
+            self.notify_tables_changed(alteradas)
             if warnings:
                 return True, "Operação realizada. Avisos: " + "; ".join(warnings)
             return True, "Operação realizada com sucesso"
         except Error as e:
             error_msg = str(e)
             logger.error(f"Erro ao executar query: {error_msg}")
-            try:
-                self.connection.rollback()
-            except:
-                pass
             return False, error_msg
-        finally:
-            try:
-                cursor.close()
-            except Exception:
-                pass
+        except Exception as e:
+            logger.error(f"Erro inesperado ao executar query: {e}")
+            return False, str(e)
 
-    def fetch_all(self, query, params=None):
+    @_timed
+    def fetch_all(self, query, params=None, raise_errors=False):
+        """Todas as linhas como dicts; em caso de erro retorna lista vazia, ou propaga
+        o erro com ``raise_errors=True`` (para quem guarda o resultado em cache)."""
         if not self.ensure_connected():
             logger.warning("Sem conexão com o banco ao buscar dados")
+            if raise_errors:
+                raise ConnectionError("Sem conexão com o banco de dados")
             return []
+        _record(query, params)
 
         if self.use_sqlite:
             try:
                 q = self._adapt_query_for_sqlite(query)
-                cur = self.sqlite_conn.cursor()
-                cur.execute(q, params or ())
-                rows = [dict(r) for r in cur.fetchall()]
-                cur.close()
+                with self._lock:
+                    cur = self.sqlite_conn.cursor()
+                    cur.execute(q, params or ())
+                    rows = [dict(r) for r in cur.fetchall()]
+                    cur.close()
                 return rows
             except Exception as e:
                 logger.error(f"Erro SQLite ao buscar dados: {e}")
+                if raise_errors:
+                    raise
                 return []
 
-        cursor = None
         try:
-            cursor = self.connection.cursor(dictionary=True, buffered=True)
-            cursor.execute(query, params or ())
             # Materializa completamente os resultados
-            rows = cursor.fetchall()
-            # Converte para dicionários Python nativos para evitar problemas de cursor
-            result = [dict(row) for row in rows]
-            return result
+            rows = self._mysql_read(query, params, lambda cur: cur.fetchall())
+            # Cursores dictionary já devolvem dicts; só copia se o driver devolver outro tipo
+            if rows and not isinstance(rows[0], dict):
+                rows = [dict(row) for row in rows]
+            return rows
         except Error as e:
             logger.error(f"Erro ao buscar dados: {e}")
-            # Tenta reconectar na próxima chamada
-            try:
-                self.connection.close()
-            except:
-                pass
-            self.connection = None
+            if raise_errors:
+                raise
             return []
         except Exception as e:
             logger.error(f"Erro inesperado ao buscar dados: {e}")
+            if raise_errors:
+                raise
             return []
-        finally:
-            if cursor:
-                try:
-                    cursor.close()
-                except Exception:
-                    pass
 
-    def fetch_one(self, query, params=None):
+    @_timed
+    def fetch_one(self, query, params=None, raise_errors=False):
+        """Primeira linha como dict (None se não houver); em caso de erro retorna None,
+        ou propaga o erro com ``raise_errors=True``."""
         if not self.ensure_connected():
             logger.warning("Sem conexão com o banco ao buscar dado único")
+            if raise_errors:
+                raise ConnectionError("Sem conexão com o banco de dados")
             return None
+        _record(query, params)
 
         if self.use_sqlite:
             try:
                 q = self._adapt_query_for_sqlite(query)
-                cur = self.sqlite_conn.cursor()
-                cur.execute(q, params or ())
-                row = cur.fetchone()
-                cur.close()
+                with self._lock:
+                    cur = self.sqlite_conn.cursor()
+                    cur.execute(q, params or ())
+                    row = cur.fetchone()
+                    cur.close()
                 return dict(row) if row else None
             except Exception as e:
                 logger.error(f"Erro SQLite ao buscar dado único: {e}")
+                if raise_errors:
+                    raise
                 return None
         
         # MySQL path
-        cursor = None
         try:
-            cursor = self.connection.cursor(dictionary=True, buffered=True)
-            cursor.execute(query, params or ())
-            row = cursor.fetchone()
+            row = self._mysql_read(query, params, lambda cur: cur.fetchone())
             # Converte para dicionário Python nativo
             return dict(row) if row else None
         except Error as e:
             logger.error(f"Erro ao buscar dado único: {e}")
+            if raise_errors:
+                raise
             return None
         except Exception as e:
             logger.error(f"Erro inesperado ao buscar dado único: {e}")
+            if raise_errors:
+                raise
             return None
+
+    @_timed
+    def fetch_frame(self, query, params=None, dtypes=None, raise_errors=False):
+        """Busca direto para um DataFrame, sem passar por um dict por linha.
+
+        As colunas são montadas a partir das tuplas do cursor e tipadas com
+        FRAME_DTYPES (``Data_Hora`` como datetime64, ``Genero``/``Especialidade``
+        como category), sobrescritos por ``dtypes``; use ``{'Coluna': None}``
+        para manter uma coluna sem conversão. Em caso de erro retorna um
+        DataFrame vazio, como fetch_all retorna lista vazia, ou propaga o erro
+        com ``raise_errors=True`` (para quem guarda o resultado em cache).
+        """
+        types = dict(FRAME_DTYPES)
+        if dtypes:
+            types.update(dtypes)
+
+        if not self.ensure_connected():
+            logger.warning("Sem conexão com o banco ao buscar DataFrame")
+            if raise_errors:
+                raise ConnectionError("Sem conexão com o banco de dados")
+            return pd.DataFrame()
+        _record(query, params)
+
+        def read(cur):
+            rows = cur.fetchall()
+            return [d[0] for d in cur.description or ()], rows
+
+        try:
+            if self.use_sqlite:
+                q = self._adapt_query_for_sqlite(query)
+                with self._lock:
+                    cur = self.sqlite_conn.cursor()
+                    cur.row_factory = None  # tuplas simples, sem sqlite3.Row
+                    try:
+                        cur.execute(q, params or ())
+                        columns, rows = read(cur)
+                    finally:
+                        cur.close()
+            else:
+                columns, rows = self._mysql_read(query, params, read, dictionary=False)
+            return _build_frame(columns, rows, types)
+        except Exception as e:
+            logger.error(f"Erro ao buscar DataFrame: {e}")
+            if raise_errors:
+                raise
+            return pd.DataFrame()
+
+    def stream(self, query, params=None, batch_size=1000, batches=False):
+        """Percorre um resultado grande em memória constante.
+
+        No MySQL usa cursor não-bufferizado (as linhas ficam no servidor e chegam
+        em lotes de ``batch_size``) numa conexão exclusiva durante a iteração; no
+        SQLite usa ``fetchmany``. Produz um dict por linha, ou uma lista de dicts
+        por lote quando ``batches=True``. Erros são registrados e propagados, para
+        que o chamador não confunda um resultado truncado com o fim dos dados —
+        inclusive a falta de conexão (``ConnectionError``), que não é um resultado vazio.
+        """
+        if not self.ensure_connected():
+            logger.error("Sem conexão com o banco ao iniciar streaming")
+            raise ConnectionError("Sem conexão com o banco de dados")
+        _record(query, params)
+
+        if self.use_sqlite:
+            yield from self._stream_sqlite(query, params, batch_size, batches)
+        else:
+            yield from self._stream_mysql(query, params, batch_size, batches)
+
+    def _stream_sqlite(self, query, params, batch_size, batches):
+        q = self._adapt_query_for_sqlite(query)
+        try:
+            with self._lock:
+                cur = self.sqlite_conn.cursor()
+                cur.execute(q, params or ())
+            try:
+                while True:
+                    with self._lock:
+                        chunk = cur.fetchmany(batch_size)
+                    if not chunk:
+                        break
+                    chunk = [dict(r) for r in chunk]
+                    if batches:
+                        yield chunk
+                    else:
+                        yield from chunk
+            finally:
+                cur.close()
+        except sqlite3.Error as e:
+            logger.error(f"Erro SQLite no streaming: {e}")
+            raise
+
+    def _stream_mysql(self, query, params, batch_size, batches):
+        # Um cursor não-bufferizado ocupa a conexão até a última linha ser lida,
+        # então o streaming nunca usa a conexão direta compartilhada.
+        if self.pool is not None:
+            conn = self.pool.get_connection()
+        else:
+            conn = self._new_mysql_connection(autocommit=True)
+        finished = False
+        cursor = None
+        try:
+            cursor = conn.cursor(dictionary=True, buffered=False)
+            cursor.execute(query, params or ())
+            while True:
+                chunk = cursor.fetchmany(batch_size)
+                if not chunk:
+                    break
+                if batches:
+                    yield chunk
+                else:
+                    yield from chunk
+            finished = True
+        except Error as e:
+            logger.error(f"Erro no streaming MySQL: {e}")
+            raise
         finally:
-            if cursor:
+            if finished:
                 try:
                     cursor.close()
+                except Exception:
+                    finished = False
+            # iteração interrompida deixa linhas pendentes no protocolo: a conexão é descartada
+            if self.pool is not None:
+                self.pool.release(conn, discard=not finished)
+            else:
+                try:
+                    conn.close()
                 except Exception:
                     pass
 
     def fetch_all_paginated(self, query, params=None, limit=None, offset=None):
         """Busca com suporte a LIMIT/OFFSET de forma portável entre MySQL e SQLite.
-        Se o query já contiver LIMIT, não adiciona nada.
+        Se o query já terminar em LIMIT, não adiciona nada.
+
+        O custo cresce com o OFFSET; para navegar por listas grandes use fetch_keyset.
         """
-        if 'LIMIT' in query.upper():
+        if _TRAILING_LIMIT.search(query):
             return self.fetch_all(query, params)
 
         q = query
@@ -341,6 +1126,120 @@ class Database:
 
         return self.fetch_all(q, final_params)
 
+    def table_counts(self, tables=KPI_TABLES, exact=None):
+        """
+        Número de linhas de cada tabela, numa única ida ao banco.
+
+        Exato: um SELECT com um COUNT(*) por tabela. Aproximado: TABLE_ROWS do
+        information_schema (MySQL; estimativa do InnoDB, que pode ficar defasada até
+        information_schema_stats_expiry) ou sqlite_stat1 (SQLite, após ANALYZE); tabelas
+        sem estimativa são contadas com COUNT(*). Os totais ficam em cache por
+        Config.TABLE_COUNTS_TTL segundos e são descartados quando a tabela é alterada
+        (ver notify_tables_changed).
+
+        Args:
+            tables: Nomes das tabelas (padrão: KPI_TABLES)
+            exact: True para COUNT(*), False para estimativa (padrão: Config.TABLE_COUNTS_EXACT)
+
+        Returns:
+            Dict[str, int]: {tabela: total}; tabelas que falharam ficam de fora
+        """
+        exata = Config.TABLE_COUNTS_EXACT if exact is None else bool(exact)
+        tabelas = [t.lower() for t in tables]
+        invalidas = [t for t in tabelas if not _IDENTIFIER.match(t)]
+        if invalidas:
+            raise ValueError(f"Nome de tabela inválido: {invalidas}")
+
+        agora = time.monotonic()
+        totais = {}
+        with self._counts_lock:
+            geracao = self._counts_generation
+            for tabela in tabelas:
+                em_cache = self._counts.get((tabela, exata))
+                if em_cache and em_cache[1] > agora:
+                    totais[tabela] = em_cache[0]
+        faltando = [t for t in tabelas if t not in totais]
+        if not faltando:
+            return totais
+
+        lidos = {} if exata else self._estimated_counts(faltando)
+        restantes = [t for t in faltando if t not in lidos]
+        if restantes:
+            linha = self.fetch_one("SELECT " + ", ".join(
+                f"(SELECT COUNT(*) FROM {t}) AS {t}" for t in restantes))
+            if linha:
+                lidos.update(linha)
+
+        lidos = {t: int(n) for t, n in lidos.items() if n is not None}
+        expira_em = agora + Config.TABLE_COUNTS_TTL
+        with self._counts_lock:
+            # uma escrita durante a leitura invalida o resultado para o cache (não para quem pediu)
+            if geracao == self._counts_generation:
+                for tabela, total in lidos.items():
+                    self._counts[(tabela, exata)] = (total, expira_em)
+        totais.update(lidos)
+        return {t: totais[t] for t in tabelas if t in totais}
+
+    def _estimated_counts(self, tables):
+        """Estimativas de linhas do catálogo (sem varrer as tabelas); {} se indisponíveis"""
+        marcadores = ", ".join(["%s"] * len(tables))
+        if self.use_sqlite:
+            existe = self.fetch_one(
+                "SELECT 1 AS ok FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+            if not existe:
+                return {}
+            # a primeira posição de stat é o número de linhas da tabela (igual em todos os índices)
+            linhas = self.fetch_all(
+                f"SELECT tbl AS tabela, MAX(CAST(stat AS INTEGER)) AS total FROM sqlite_stat1 "
+                f"WHERE tbl IN ({marcadores}) GROUP BY tbl", tuple(tables))
+        else:
+            linhas = self.fetch_all(
+                f"SELECT LOWER(TABLE_NAME) AS tabela, TABLE_ROWS AS total FROM information_schema.TABLES "
+                f"WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME IN ({marcadores})", tuple(tables))
+        return {linha['tabela']: linha['total'] for linha in linhas if linha['total'] is not None}
+
+    def fetch_keyset(self, query, params=None, order_by=(), limit=20, cursor=None, nullable=()):
+        """
+        Paginação por chave (seek): em vez de pular OFFSET linhas, continua a partir da
+        última linha da página anterior, então cada página custa o mesmo com um índice
+        que cubra ``order_by``.
+
+        Args:
+            query: SELECT sem ORDER BY/LIMIT, com nomes de coluna únicos; é envolvido
+                   como tabela derivada, que MySQL e SQLite incorporam à consulta
+                   externa (os índices continuam valendo)
+            order_by: Termos "Coluna [ASC|DESC]" com nomes de colunas do resultado; os
+                      últimos devem formar uma chave única (ex.: Data_Hora, CodCli,
+                      CodMed, CpfPaciente em tabelaconsulta)
+            limit: Linhas por página
+            cursor: Token devolvido pela página anterior (None = primeira página)
+            nullable: Colunas de ``order_by`` que admitem NULL
+
+        Returns:
+            Tuple[List[dict], Optional[str]]: (linhas, cursor da próxima página ou None)
+        """
+        termos = _parse_order(order_by)
+        condicao, final_params = "", list(params) if params else []
+        if cursor:
+            try:
+                valores = decode_cursor(cursor, order_by)
+            except ValueError as e:
+                logger.warning(f"{e}; voltando à primeira página")
+            else:
+                sql, seek_params = _seek_condition(termos, valores, nullable, row_values=self.use_sqlite)
+                condicao = f" WHERE {sql}"
+                final_params += seek_params
+
+        ordem = ', '.join(f"{col} {'DESC' if desc else 'ASC'}" for col, desc in termos)
+        q = (f"SELECT * FROM ({query.rstrip().rstrip(';')}) AS pagina{condicao} "
+             f"ORDER BY {ordem} LIMIT %s")
+        # uma linha a mais indica se há próxima página
+        rows = self.fetch_all(q, final_params + [limit + 1])
+        if len(rows) <= limit:
+            return rows, None
+        rows = rows[:limit]
+        return rows, encode_cursor(rows[-1], order_by)
+
     def get_clinicas(self):
         return self.fetch_all('SELECT CodCli, NomeCli FROM tabelaclinica ORDER BY NomeCli')
 
@@ -354,6 +1253,8 @@ class Database:
                 self.sqlite_conn.close()
         except Exception:
             pass
+        if self.pool is not None:
+            self.pool.close()
 
 
 db = Database()
\ No newline at end of file
@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+"""
+Auditoria de planos de execução das consultas das páginas
+
+Executa as funções de carga de cada página com filtros representativos, registra todas
+as leituras que elas fazem (db.capture_queries) e roda EXPLAIN em cada uma:
+
+- MySQL: ``EXPLAIN`` (type=ALL/index = varredura, Extra com Using filesort/temporary)
+- SQLite: ``EXPLAIN QUERY PLAN`` (SCAN, USE TEMP B-TREE FOR ORDER BY/GROUP BY)
+
+Varredura completa só conta como problema quando a consulta tem WHERE ou LIMIT (algo que
+um índice poderia servir) e a tabela passa de ``--min-rows`` linhas; contagens e
+listagens sem filtro leem a tabela inteira por definição e aparecem só com ``--verbose``.
+Percorrer um índice na ordem do ORDER BY até o LIMIT também não conta (lê só a página).
+
+    python explain_audit.py              # resumo; código de saída 2 se houver problemas
+    python explain_audit.py --verbose    # plano completo de cada consulta
+"""
+
+import argparse
+import logging
+import re
+import sys
+from datetime import date, timedelta
+
+from db import db, capture_queries, KPI_TABLES
+
+logger = logging.getLogger("consultorio.explain_audit")
+
+# Tabelas (e apelidos) citadas em FROM/JOIN
+_TABELA = re.compile(
+    r'\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(?!(?:ON|WHERE|JOIN|INNER|LEFT|RIGHT|CROSS|GROUP|ORDER|LIMIT|USING)\b)(\w+))?',
+    re.IGNORECASE)
+_FILTRA = re.compile(r'\b(?:WHERE|LIMIT|MATCH)\b', re.IGNORECASE)
+_LIMIT = re.compile(r'\bLIMIT\b', re.IGNORECASE)
+_SCAN_SQLITE = re.compile(r'^SCAN (\w+)', re.IGNORECASE)
+_LEITURA_SQLITE = re.compile(r'^(?:SCAN|SEARCH) (\w+)', re.IGNORECASE)
+_DERIVADA_SQLITE = re.compile(r'^(?:MATERIALIZE|CO-ROUTINE) (\w+)', re.IGNORECASE)
+
+# Achados conhecidos e aceitos: {cenário: tipos}. O ranking da busca ordena no máximo
+# search.CANDIDATOS_RANKING candidatos vindos do índice de texto; Genero tem dois valores,
+# então a contagem filtrada por ele varre a tabela (índice retirado, ver index_advisor.py).
+ACEITOS = {
+    'consultas: busca de paciente': {'filesort'},
+    'pacientes: busca por nome': {'filesort'},
+    'pacientes: filtro e ordenação': {'varredura'},
+    'medicos: busca': {'filesort'},
+}
+
+
+def cenarios():
+    """
+    [(nome, função)] que exercitam as leituras das páginas. Importa as páginas aqui
+    (registram callbacks no Dash) para o módulo poder ser importado sem elas.
+    """
+    import search
+    from pages import analytics, clinicas, consultas, home, medicos, pacientes
+
+    hoje = date.today()
+    noventa_dias = (hoje - timedelta(days=90)).isoformat()
+    mes = ((hoje - timedelta(days=30)).isoformat(), hoje.isoformat())
+    amostra = db.fetch_one("SELECT CodCli, CodMed FROM tabelaconsulta LIMIT 1") or {}
+    medico, clinica = amostra.get('CodMed'), amostra.get('CodCli')
+
+    def paginas_consultas(data_ini=None, data_fim=None, medico_filtro=None):
+        def executar():
+            _, _, _, _, estado = consultas.carregar_pagina(0, data_ini, data_fim, medico_filtro, None)
+            consultas.carregar_pagina(1, data_ini, data_fim, medico_filtro, estado)   # por chave
+            consultas.carregar_pagina(3, data_ini, data_fim, medico_filtro, estado)   # salto (OFFSET)
+        return executar
+
+    def paginas_pacientes(sort_by=None, filter_query=None, filtro=None):
+        def executar():
+            args = (pacientes.PAGE_SIZE, sort_by, filter_query, filtro)
+            _, _, _, _, estado = pacientes.carregar_pagina(0, *args, None)
+            pacientes.carregar_pagina(1, *args, estado)
+        return executar
+
+    return [
+        ('home: dashboard', home.build_layout),
+        ('home: agregados sem rollups', lambda: [t() for t in home._tarefas_agregados(hoje).values()]),
+        ('consultas: sem filtro', paginas_consultas()),
+        ('consultas: período', paginas_consultas(*mes)),
+        ('consultas: período + médico', paginas_consultas(*mes, medico)),
+        ('consultas: só médico', paginas_consultas(medico_filtro=medico)),
+        ('consultas: opções de médico', consultas._opcoes_medicos),
+        ('consultas: busca de paciente', lambda: (search.buscar_pacientes('ana'), search.buscar_pacientes('123'))),
+        ('pacientes: sem filtro', paginas_pacientes()),
+        ('pacientes: busca por nome', paginas_pacientes(filtro='maria')),
+        ('pacientes: filtro e ordenação', paginas_pacientes(
+            sort_by=[{'column_id': 'DataNascimento', 'direction': 'desc'}], filter_query='{Genero} s= F')),
+        ('medicos: listagem', lambda: medicos.atualizar_tabela(None, 0)),
+        ('medicos: busca', lambda: medicos.atualizar_tabela('cardio', 0)),
+        ('clinicas: listagem', lambda: clinicas.atualizar_tabela(0)),
+        ('analytics: últimos 90 dias', lambda: analytics.carregar_consultas(start_date=noventa_dias)),
+        ('analytics: clínica + médico + período', lambda: analytics.carregar_consultas(clinica, medico, *mes)),
+    ]
+
+
+def capturar(nome, funcao):
+    """Executa ``funcao`` sem caches e devolve as leituras (query, params) que ela fez"""
+    # descarta contagens de db.table_counts e entradas do cache.py: tudo chega ao banco
+    import rollups
+    db.notify_tables_changed(KPI_TABLES + rollups.ROLLUP_TABLES)
+    with capture_queries() as registro:
+        try:
+            funcao()
+        except Exception as e:
+            logger.error(f"Cenário '{nome}' falhou: {e}")
+    return registro
+
+
+def _tabelas(query):
+    """{apelido ou nome: tabela} das tabelas citadas em FROM/JOIN"""
+    tabelas = {}
+    for nome, apelido in _TABELA.findall(query):
+        tabelas[nome.lower()] = nome.lower()
+        if apelido:
+            tabelas[apelido.lower()] = nome.lower()
+    return tabelas
+
+
+def explicar(query, params):
+    """Linhas do plano: dicts do EXPLAIN (MySQL) ou textos do EXPLAIN QUERY PLAN (SQLite)"""
+    return db.explain(query, params)
+
+
+def achados(query, plano):
+    """
+    Problemas do plano: [(tipo, tabela)] com tipo em 'varredura', 'varredura de índice',
+    'filesort' e 'temporária' (tabela None quando o plano não a identifica)
+    """
+    apelidos = _tabelas(query)
+    resultado = []
+    if db.use_sqlite:
+        derivadas = {m.group(1).lower() for m in map(_DERIVADA_SQLITE.match, plano) if m}
+        # ordenação/agrupamento temporário é atribuído à primeira tabela lida (a que dirige a junção)
+        leituras = [m.group(1).lower() for m in map(_LEITURA_SQLITE.match, plano) if m]
+        principal = apelidos.get(leituras[0], leituras[0]) if leituras and leituras[0] not in derivadas else None
+        for detalhe in plano:
+            scan = _SCAN_SQLITE.match(detalhe)
+            if scan and 'VIRTUAL TABLE' not in detalhe and scan.group(1).upper() != 'CONSTANT':
+                alvo = scan.group(1).lower()
+                if alvo not in derivadas:
+                    tipo = 'varredura de índice' if 'INDEX' in detalhe else 'varredura'
+                    resultado.append((tipo, apelidos.get(alvo, alvo)))
+            elif 'USE TEMP B-TREE FOR' in detalhe:
+                resultado.append(('filesort' if 'ORDER BY' in detalhe else 'temporária', principal))
+        return resultado
+
+    for linha in plano:
+        alvo = str(linha.get('table') or '')
+        tabela = apelidos.get(alvo.lower(), alvo) if alvo and not alvo.startswith('<') else None
+        extra = linha.get('Extra') or ''
+        if tabela and linha.get('type') == 'ALL':
+            resultado.append(('varredura', tabela))
+        elif tabela and linha.get('type') == 'index':
+            resultado.append(('varredura de índice', tabela))
+        if 'Using filesort' in extra:
+            resultado.append(('filesort', tabela))
+        if 'Using temporary' in extra:
+            resultado.append(('temporária', tabela))
+    return resultado
+
+
+def tabelas_pequenas(min_rows=1000):
+    """Função tabela -> bool: a tabela tem menos de ``min_rows`` linhas (estimativa do catálogo)"""
+    tamanhos = {}
+
+    def pequena(tabela):
+        if tabela is None:
+            return False
+        if tabela not in tamanhos:
+            tamanhos[tabela] = db.table_counts((tabela,), exact=False).get(tabela, min_rows)
+        return tamanhos[tabela] < min_rows
+    return pequena
+
+
+def classificar(query, encontrados, pequena, aceitos=()):
+    """
+    Separa os achados do plano em (problemas, avisos): varreduras de tabelas pequenas,
+    de consultas sem filtro, de índice na ordem pedida até o LIMIT e os tipos em
+    ``aceitos`` são só avisos.
+    """
+    filtra = bool(_FILTRA.search(query))
+    # índice percorrido na ordem pedida até o LIMIT (sem ordenar à parte) lê só a página
+    ordenado = _LIMIT.search(query) and not any(t in ('filesort', 'temporária') for t, _ in encontrados)
+    problemas, avisos = [], []
+    for tipo, tabela in encontrados:
+        if (pequena(tabela) or (tipo.startswith('varredura') and not filtra)
+                or (tipo == 'varredura de índice' and ordenado)
+                or tipo in aceitos):
+            avisos.append((tipo, tabela))
+        else:
+            problemas.append((tipo, tabela))
+    return problemas, avisos
+
+
+def auditar(min_rows=1000):
+    """
+    Roda todos os cenários e audita cada leitura distinta.
+
+    Returns:
+        List[dict]: {'cenario', 'query', 'params', 'plano', 'problemas', 'avisos'}
+    """
+    pequena = tabelas_pequenas(min_rows)
+    relatorio = []
+    vistas = set()
+    for nome, funcao in cenarios():
+        for query, params in capturar(nome, funcao):
+            if (query, params) in vistas:
+                continue
+            vistas.add((query, params))
+            try:
+                plano = explicar(query, params)
+            except Exception as e:
+                logger.error(f"EXPLAIN falhou ({nome}): {e}")
+                continue
+            problemas, avisos = classificar(query, achados(query, plano), pequena, ACEITOS.get(nome, ()))
+            relatorio.append({'cenario': nome, 'query': query, 'params': params, 'plano': plano,
+                              'problemas': problemas, 'avisos': avisos})
+    return relatorio
+
+
+def _resumo(query, limite=110):
+    texto = ' '.join(query.split())
+    return texto if len(texto) <= limite else texto[:limite - 3] + '...'
+
+
+def _descrever(itens):
+    return ', '.join(f"{tipo}{f' em {tabela}' if tabela else ''}" for tipo, tabela in itens)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Auditoria (EXPLAIN) das consultas das páginas')
+    parser.add_argument('--min-rows', type=int, default=1000,
+                        help='Tabelas menores que isso podem ser varridas sem alerta (padrão: 1000)')
+    parser.add_argument('--verbose', action='store_true', help='Mostra SQL e plano de todas as consultas')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
+
+    if not db.ensure_connected():
+        logger.error("Sem conexão com o banco de dados")
+        return 1
+
+    relatorio = auditar(min_rows=args.min_rows)
+    for item in relatorio:
+        if not (item['problemas'] or args.verbose):
+            continue
+        marca = '✗' if item['problemas'] else '✓'
+        logger.info(f"{marca} [{item['cenario']}] {_resumo(item['query'])}")
+        if item['problemas']:
+            logger.warning(f"   {_descrever(item['problemas'])}")
+        if args.verbose:
+            if item['avisos']:
+                logger.info(f"   aceitável: {_descrever(item['avisos'])}")
+            logger.info(f"   params: {item['params']}")
+            for linha in item['plano']:
+                logger.info(f"   {linha}")
+
+    com_problema = [item for item in relatorio if item['problemas']]
+    backend = 'SQLite' if db.use_sqlite else 'MySQL'
+    if com_problema:
+        logger.error(f"✗ {len(com_problema)} de {len(relatorio)} consulta(s) com varredura/filesort ({backend})")
+        return 2
+    logger.info(f"✓ {len(relatorio)} consulta(s) auditadas sem varredura/filesort ({backend})")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
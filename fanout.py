@@ -0,0 +1,98 @@
+"""
+Execução concorrente de consultas independentes (fan-out) com prazo
+Sistema de Consultório Médico
+
+Cada tarefa roda numa thread de um executor compartilhado e pega sua própria conexão
+do pool (db.py), então a latência de uma página com N consultas independentes fica
+próxima à da mais lenta. Tarefas que não terminam até o prazo (ou que falham) recebem
+o valor padrão informado; as atrasadas continuam rodando em segundo plano e, se usam
+o cache, deixam o resultado pronto para o próximo acesso.
+
+Uso:
+    dados, pendentes = fan_out({
+        'pacientes': lambda: db.fetch_one("SELECT COUNT(*) AS n FROM tabelapaciente")['n'],
+        'top': lambda: db.fetch_all("..."),
+    }, timeout=5, defaults={'pacientes': None, 'top': []})
+"""
+
+import contextvars
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from config import Config
+
+logger = logging.getLogger("consultorio.fanout")
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+_stats = {'calls': 0, 'tasks': 0, 'timeouts': 0, 'errors': 0, 'partial_calls': 0}
+_stats_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=Config.FANOUT_WORKERS, thread_name_prefix='fanout')
+        return _executor
+
+
+def fan_out(tarefas: Dict[str, Callable[[], Any]], timeout: Optional[float] = None,
+            defaults: Optional[Dict[str, Any]] = None) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    Executa as ``tarefas`` concorrentemente e espera no máximo ``timeout`` segundos no total.
+
+    Args:
+        tarefas: {nome: função sem argumentos}
+        timeout: Prazo total em segundos (None = sem prazo)
+        defaults: Valor usado para tarefas atrasadas ou com erro (None se ausente)
+
+    Returns:
+        Tuple[Dict, List[str]]: (resultados por nome, nomes que usaram o valor padrão)
+    """
+    defaults = defaults or {}
+    inicio = time.perf_counter()
+    executor = _get_executor()
+    # cada tarefa roda numa cópia do contexto de quem chamou (contextvars do callback atual)
+    futuros = {nome: executor.submit(contextvars.copy_context().run, func) for nome, func in tarefas.items()}
+    wait(list(futuros.values()), timeout=timeout)
+
+    resultados: Dict[str, Any] = {}
+    pendentes: List[str] = []
+    atrasadas = erros = 0
+    for nome, futuro in futuros.items():
+        if not futuro.done():
+            atrasadas += 1
+            pendentes.append(nome)
+            resultados[nome] = defaults.get(nome)
+            continue
+        try:
+            resultados[nome] = futuro.result()
+        except Exception as e:
+            erros += 1
+            pendentes.append(nome)
+            resultados[nome] = defaults.get(nome)
+            logger.error(f"Tarefa '{nome}' falhou: {e}")
+
+    duracao = time.perf_counter() - inicio
+    if atrasadas:
+        logger.warning(f"{atrasadas} de {len(futuros)} tarefa(s) sem resposta em {timeout}s: "
+                       f"{', '.join(n for n in pendentes if not futuros[n].done())}")
+    with _stats_lock:
+        _stats['calls'] += 1
+        _stats['tasks'] += len(futuros)
+        _stats['timeouts'] += atrasadas
+        _stats['errors'] += erros
+        if pendentes:
+            _stats['partial_calls'] += 1
+    logger.debug(f"fan-out de {len(futuros)} tarefa(s) em {duracao:.3f}s")
+    return resultados, pendentes
+
+
+def fanout_stats() -> Dict[str, int]:
+    """Contadores acumulados: chamadas, tarefas, prazos estourados, erros, chamadas parciais"""
+    with _stats_lock:
+        return dict(_stats)
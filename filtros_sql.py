@@ -0,0 +1,105 @@
+"""
+Montagem de filtros SQL (WHERE) para as listagens e relatórios
+Sistema de Consultório Médico
+
+Filtros de período viram intervalos semiabertos sobre a coluna crua:
+
+    periodo('c.Data_Hora', '2024-03-01', '2024-03-31')
+    -> c.Data_Hora >= '2024-03-01' AND c.Data_Hora < '2024-04-01'
+
+em vez de ``DATE(c.Data_Hora) BETWEEN ...``: função aplicada à coluna impede o uso dos
+índices (idx_consulta_data, idx_consulta_medico_data), e comparar DATETIME com a data final
+(``<= '2024-03-31'``) perde as consultas do último dia depois da meia-noite. Os limites
+vão como texto ISO, que o MySQL converte para DATETIME e o SQLite compara como texto
+(Data_Hora é gravado como 'AAAA-MM-DD HH:MM:SS').
+
+Uso:
+    filtros = filtros_consultas(data_ini, data_fim, medico=cod_med)
+    db.fetch_all(f"SELECT ... FROM tabelaconsulta c{filtros.where()}", filtros.params)
+"""
+
+import logging
+from datetime import date, datetime, timedelta
+from typing import Any, List, Optional, Union
+
+logger = logging.getLogger("consultorio.filtros_sql")
+
+Data = Union[str, date, datetime, None]
+
+
+def para_data(valor: Data) -> Optional[date]:
+    """Converte 'AAAA-MM-DD' (ou ISO com hora, como o DatePickerRange pode enviar), date ou datetime em date"""
+    if valor is None or (isinstance(valor, date) and not isinstance(valor, datetime)):
+        return valor
+    if isinstance(valor, datetime):
+        return valor.date()
+    texto = str(valor).strip()
+    if not texto:
+        return None
+    try:
+        return date.fromisoformat(texto[:10])
+    except ValueError:
+        logger.warning(f"Data inválida ignorada no filtro: {valor!r}")
+        return None
+
+
+class Filtros:
+    """Condições unidas por AND, com parâmetros na mesma ordem (placeholders %s)"""
+
+    def __init__(self):
+        self.condicoes: List[str] = []
+        self.params: List[Any] = []
+
+    def __bool__(self):
+        return bool(self.condicoes)
+
+    def condicao(self, sql: str, *params: Any) -> 'Filtros':
+        """Acrescenta uma condição pronta (``sql`` com um %s por parâmetro)"""
+        self.condicoes.append(sql)
+        self.params.extend(params)
+        return self
+
+    def igual(self, coluna: str, valor: Any) -> 'Filtros':
+        """``coluna = valor``; valores vazios (None/'') não filtram"""
+        if valor is None or (isinstance(valor, str) and not valor.strip()):
+            return self
+        return self.condicao(f"{coluna} = %s", valor)
+
+    def periodo(self, coluna: str, inicio: Data = None, fim: Data = None) -> 'Filtros':
+        """
+        Dias de ``inicio`` a ``fim`` (inclusive) como intervalo semiaberto
+        ``coluna >= inicio AND coluna < fim + 1 dia``; qualquer um dos lados pode faltar.
+        """
+        inicio, fim = para_data(inicio), para_data(fim)
+        if inicio:
+            self.condicao(f"{coluna} >= %s", inicio.isoformat())
+        if fim:
+            self.condicao(f"{coluna} < %s", (fim + timedelta(days=1)).isoformat())
+        return self
+
+    def dia(self, coluna: str, dia: Data) -> 'Filtros':
+        """Um único dia (substitui ``DATE(coluna) = dia``)"""
+        return self.periodo(coluna, dia, dia)
+
+    def desde(self, coluna: str, instante: Union[date, datetime]) -> 'Filtros':
+        """``coluna >= instante`` (datetime com hora ou date à meia-noite)"""
+        if isinstance(instante, datetime):
+            return self.condicao(f"{coluna} >= %s", instante.strftime('%Y-%m-%d %H:%M:%S'))
+        return self.condicao(f"{coluna} >= %s", instante.isoformat())
+
+    def where(self) -> str:
+        """`` WHERE a AND b`` (ou string vazia)"""
+        return f" WHERE {' AND '.join(self.condicoes)}" if self.condicoes else ""
+
+
+def filtros_consultas(data_ini: Data = None, data_fim: Data = None, medico: Optional[str] = None,
+                      clinica: Optional[str] = None, alias: str = 'c') -> Filtros:
+    """
+    Filtros das telas de consultas (listagem e analytics) sobre ``tabelaconsulta AS alias``;
+    parâmetros vazios não filtram.
+    """
+    prefixo = f"{alias}." if alias else ""
+    return (Filtros()
+            .igual(f"{prefixo}CodCli", clinica)
+            .igual(f"{prefixo}CodMed", medico)
+            .periodo(f"{prefixo}Data_Hora", data_ini, data_fim))
@@ -0,0 +1,504 @@
+# -*- coding: utf-8 -*-
+"""
+Sugestão de índices a partir da carga real de consultas
+Sistema de Consultório Médico
+
+Lê as formas de consulta registradas por query_log.py (frequência e latência de cada
+SELECT normalizado) e, para cada uma, roda EXPLAIN sobre o exemplo guardado
+(explain_audit.explicar/achados):
+
+- consultas com varredura/filesort/temporária em tabela grande recebem um índice
+  composto candidato: colunas de igualdade, depois as do ORDER BY (ou a primeira de
+  intervalo) e, se couberem, as demais colunas lidas da tabela (índice de cobertura).
+  No SQLite o candidato é criado dentro de um SAVEPOINT, o plano é refeito e o índice
+  desfeito: só fica a sugestão que de fato melhora o plano. O MySQL não tem índices
+  hipotéticos, então lá a sugestão sai como "não verificada";
+- índices que nenhuma consulta da carga usou são apontados para remoção (MySQL: também
+  sys.schema_unused_indexes, que conta desde o início do servidor), assim como os de
+  baixa seletividade (ex.: Genero), que custam em toda escrita e não evitam ler boa
+  parte da tabela. PK, UNIQUE, FULLTEXT, o único índice de uma FK e índices de tabelas
+  menores que ``--min-rows`` (onde o planejador prefere varrer) nunca são removidos.
+
+A saída é um script de migração (DDL online do index_manager.py) com o motivo de cada
+mudança; para a sincronização não desfazê-la, leve o resultado para
+index_manager.INDICES / OBSOLETOS (o script lista as linhas).
+
+    python index_advisor.py                          # carga de Config.QUERY_LOG_PATH
+    python index_advisor.py --log queries.jsonl      # outro(s) arquivo(s)
+    python index_advisor.py --cenarios               # gera a carga com os cenários do explain_audit
+    python index_advisor.py --output migracao.sql
+"""
+
+import argparse
+import logging
+import os
+import re
+import sys
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+import explain_audit
+import index_manager
+import query_log
+from config import Config
+from db import db
+from index_manager import Existente, Indice
+
+logger = logging.getLogger("consultorio.index_advisor")
+
+# Colunas no máximo num índice candidato (chave + cobertura)
+MAX_COLUNAS = 5
+# Distintos / linhas abaixo disso: índice de baixa seletividade
+MIN_SELETIVIDADE = 0.01
+
+_PREDICADO = re.compile(
+    r'(?<![\w.])(?:(\w+)\.)?(\w+)\s*(>=|<=|<>|!=|=|<|>|\bLIKE\b|\bIN\b|\bBETWEEN\b)', re.IGNORECASE)
+_COLUNA = re.compile(r'(?<![\w.])(?:(\w+)\.)?(\w+|\*)(?:\s+(ASC|DESC))?\s*$', re.IGNORECASE)
+_REFERENCIA = re.compile(r'(?<![\w.])(?:(\w+)\.)?(\w+|\*)')
+_CLAUSULA_FIM = r'(?=\bLIMIT\b|\bOFFSET\b|\bHAVING\b|\bORDER\s+BY\b|\bGROUP\s+BY\b|\)|$)'
+_ORDER_BY = re.compile(r'\bORDER\s+BY\s+(.+?)' + _CLAUSULA_FIM, re.IGNORECASE | re.DOTALL)
+_GROUP_BY = re.compile(r'\bGROUP\s+BY\s+(.+?)' + _CLAUSULA_FIM, re.IGNORECASE | re.DOTALL)
+_INDICE_SQLITE = re.compile(r'\bUSING (?:COVERING )?INDEX (\w+)', re.IGNORECASE)
+_PALAVRAS = {'and', 'or', 'not', 'null', 'is', 'as', 'on', 'select', 'from', 'where', 'join', 'inner',
+             'left', 'right', 'by', 'order', 'group', 'limit', 'offset', 'asc', 'desc', 'like', 'in',
+             'between', 'case', 'when', 'then', 'else', 'end', 'distinct', 'count', 'sum', 'avg', 'min',
+             'max', 'date', 'match', 'against', 'having', 'union', 'all', 'exists', 'cast', 'coalesce'}
+
+
+class Candidato(NamedTuple):
+    indice: Indice
+    formas: Tuple[str, ...]   # sql normalizado das formas atendidas
+    custo_ms: float           # latência acumulada dessas formas
+    execucoes: int
+    achados: Tuple[str, ...]  # ex.: 'varredura em tabelaconsulta'
+    verificado: Optional[bool]  # None = não dá para verificar (MySQL)
+
+
+class Remocao(NamedTuple):
+    indice: Existente
+    motivo: str
+    declarado: bool
+
+
+class Relatorio(NamedTuple):
+    criar: List[Candidato]
+    remover: List[Remocao]
+    atendidas: List[Tuple[str, str]]  # (sql, observação) de consultas sem candidato útil
+    formas: int
+    execucoes: int
+
+
+# ==================== CARGA ====================
+
+def carga_dos_cenarios() -> Dict[str, query_log.Forma]:
+    """Formas de consulta dos cenários do explain_audit (páginas com filtros representativos)"""
+    ativo, query_log.QUERY_LOG.ativo = query_log.QUERY_LOG.ativo, True
+    try:
+        lista = explain_audit.cenarios()  # consulta amostras de médico/clínica: fora da carga
+        query_log.QUERY_LOG.limpar()
+        for nome, funcao in lista:
+            explain_audit.capturar(nome, funcao)
+        return query_log.QUERY_LOG.formas()
+    finally:
+        query_log.QUERY_LOG.ativo = ativo
+        query_log.QUERY_LOG.limpar()
+
+
+# ==================== CATÁLOGO ====================
+
+def _tabelas_existentes(cursor, sqlite: bool) -> Set[str]:
+    if sqlite:
+        cursor.execute("SELECT LOWER(name) FROM sqlite_master WHERE type = 'table'")
+    else:
+        cursor.execute("SELECT LOWER(TABLE_NAME) FROM information_schema.TABLES "
+                       "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_TYPE = 'BASE TABLE'")
+    return {linha[0] for linha in cursor.fetchall()}
+
+
+def _colunas(cursor, sqlite: bool, tabela: str) -> Dict[str, str]:
+    """{nome em minúsculas: nome} das colunas da tabela"""
+    if sqlite:
+        cursor.execute(f"PRAGMA table_info({tabela})")
+        nomes = [linha[1] for linha in cursor.fetchall()]
+    else:
+        cursor.execute("SELECT COLUMN_NAME FROM information_schema.COLUMNS "
+                       "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s ORDER BY ORDINAL_POSITION", (tabela,))
+        nomes = [linha[0] for linha in cursor.fetchall()]
+    return {n.lower(): n for n in nomes}
+
+
+def _colunas_fk(cursor, sqlite: bool, tabela: str) -> Set[str]:
+    """Primeira coluna (minúsculas) de cada chave estrangeira da tabela"""
+    if sqlite:
+        cursor.execute(f"PRAGMA foreign_key_list({tabela})")
+        return {linha[3].lower() for linha in cursor.fetchall() if linha[1] == 0}
+    cursor.execute("SELECT COLUMN_NAME FROM information_schema.KEY_COLUMN_USAGE "
+                   "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s "
+                   "AND REFERENCED_TABLE_NAME IS NOT NULL AND ORDINAL_POSITION = 1", (tabela,))
+    return {linha[0].lower() for linha in cursor.fetchall()}
+
+
+def _seletividade(cursor, sqlite: bool, tabela: str, coluna: str) -> Tuple[int, int]:
+    """(valores distintos, linhas) da coluna; no MySQL pelas estatísticas do catálogo"""
+    if sqlite:
+        cursor.execute(f"SELECT COUNT(DISTINCT {coluna}), COUNT(*) FROM {tabela}")
+        distintos, linhas = cursor.fetchone()
+        return int(distintos or 0), int(linhas or 0)
+    cursor.execute("SELECT MAX(s.CARDINALITY), MAX(t.TABLE_ROWS) FROM information_schema.STATISTICS s "
+                   "JOIN information_schema.TABLES t ON t.TABLE_SCHEMA = s.TABLE_SCHEMA AND t.TABLE_NAME = s.TABLE_NAME "
+                   "WHERE s.TABLE_SCHEMA = DATABASE() AND s.TABLE_NAME = %s AND s.COLUMN_NAME = %s "
+                   "AND s.SEQ_IN_INDEX = 1", (tabela, coluna))
+    distintos, linhas = cursor.fetchone() or (0, 0)
+    return int(distintos or 0), int(linhas or 0)
+
+
+def _nao_usados_mysql(cursor) -> Optional[Set[Tuple[str, str]]]:
+    """(tabela, índice) sem uso desde o início do servidor, ou None sem performance_schema"""
+    try:
+        cursor.execute("SELECT LOWER(object_name), index_name FROM sys.schema_unused_indexes "
+                       "WHERE object_schema = DATABASE()")
+        return {(t, i.lower()) for t, i in cursor.fetchall()}
+    except Exception as e:
+        logger.warning(f"sys.schema_unused_indexes indisponível ({e}); usando só os planos da carga")
+        return None
+
+
+def _indices_do_plano(plano, sqlite: bool) -> Set[str]:
+    """Nomes (minúsculas) dos índices que o plano usa"""
+    if sqlite:
+        return {m.group(1).lower() for linha in plano for m in _INDICE_SQLITE.finditer(linha)}
+    usados = set()
+    for linha in plano:
+        usados.update(k.strip().lower() for k in str(linha.get('key') or '').split(',') if k.strip())
+    return usados
+
+
+# ==================== CANDIDATOS ====================
+
+def _coluna_da_tabela(apelido, coluna, tabela, apelidos, colunas) -> Optional[str]:
+    """Nome real da coluna se a referência (``apelido.coluna`` ou ``coluna``) é da tabela"""
+    if coluna.lower() in _PALAVRAS or coluna == '*':
+        return None
+    if apelido and apelidos.get(apelido.lower()) != tabela:
+        return None
+    return colunas.get(coluna.lower())
+
+
+def _termos(clausula, tabela, apelidos, colunas) -> Optional[List[str]]:
+    """Colunas de um ORDER BY/GROUP BY se todos os termos são colunas da tabela, senão None"""
+    resultado = []
+    for termo in clausula.split(','):
+        m = _COLUNA.match(termo.strip())
+        coluna = m and _coluna_da_tabela(m.group(1), m.group(2), tabela, apelidos, colunas)
+        if not coluna:
+            return None
+        if coluna not in resultado:
+            resultado.append(coluna)
+    return resultado
+
+
+def candidato_para(query: str, tabela: str, colunas: Dict[str, str]) -> Optional[Tuple[str, ...]]:
+    """
+    Colunas de um índice composto para ``tabela`` nesta consulta: igualdade, depois
+    ORDER BY (ou a primeira de intervalo, ou GROUP BY) e, até MAX_COLUNAS, as demais
+    colunas da tabela que a consulta lê (cobertura). None se nada filtra nem ordena.
+    """
+    apelidos = explain_audit._tabelas(query)
+    igualdade, intervalo = [], []
+    for apelido, coluna, operador in _PREDICADO.findall(query):
+        nome = _coluna_da_tabela(apelido, coluna, tabela, apelidos, colunas)
+        if not nome:
+            continue
+        destino = igualdade if operador.upper() in ('=', 'IN') else intervalo
+        if nome not in igualdade and nome not in destino:
+            destino.append(nome)
+    intervalo = [c for c in intervalo if c not in igualdade]
+
+    ordem = next((t for t in (_termos(m.group(1), tabela, apelidos, colunas)
+                              for m in _ORDER_BY.finditer(query)) if t), None)
+    grupo = next((t for t in (_termos(m.group(1), tabela, apelidos, colunas)
+                              for m in _GROUP_BY.finditer(query)) if t), None)
+
+    chave = list(igualdade)
+    if ordem and (not intervalo or intervalo[0] == ordem[0]):
+        chave += [c for c in ordem if c not in chave]
+    elif intervalo:
+        chave.append(intervalo[0])
+    elif grupo:
+        chave += [c for c in grupo if c not in chave]
+    if not chave:
+        return None
+
+    # cobertura: só se a consulta não lê a tabela inteira (SELECT * / apelido.*)
+    lidas = []
+    for apelido, coluna in _REFERENCIA.findall(query):
+        if coluna == '*' and (not apelido or apelidos.get(apelido.lower()) == tabela):
+            return tuple(chave)
+        nome = _coluna_da_tabela(apelido, coluna, tabela, apelidos, colunas)
+        if nome and nome not in chave and nome not in lidas:
+            lidas.append(nome)
+    if len(chave) + len(lidas) <= MAX_COLUNAS:
+        chave += lidas
+    return tuple(chave)
+
+
+def _nome(tabela: str, colunas: Sequence[str]) -> str:
+    base = tabela[len('tabela'):] if tabela.startswith('tabela') else tabela
+    return f"idx_{base}_{'_'.join(c.lower() for c in colunas)}"[:64]
+
+
+def _atende(existente_colunas: Sequence[str], colunas: Sequence[str]) -> bool:
+    return index_manager._chave(existente_colunas)[:len(colunas)] == index_manager._chave(colunas)
+
+
+def _testar(indice: Indice, query: str, params, pequena) -> Optional[bool]:
+    """
+    SQLite: cria o índice num SAVEPOINT, refaz o plano e desfaz; True se os problemas
+    da tabela diminuíram. MySQL: None (sem índices hipotéticos).
+    """
+    if not db.use_sqlite:
+        return None
+    antes = _problemas_da_tabela(query, explain_audit.explicar(query, params), pequena, indice.tabela)
+    with db.raw_connection() as conn:
+        conn.execute("SAVEPOINT index_advisor")
+        try:
+            conn.execute(index_manager.ddl_criar(indice, sqlite=True))
+            depois = _problemas_da_tabela(query, explain_audit.explicar(query, params), pequena, indice.tabela)
+        finally:
+            conn.execute("ROLLBACK TO index_advisor")
+            conn.execute("RELEASE index_advisor")
+    return len(depois) < len(antes)
+
+
+def _problemas_da_tabela(query, plano, pequena, tabela):
+    problemas, _ = explain_audit.classificar(query, explain_audit.achados(query, plano), pequena)
+    return [p for p in problemas if p[1] in (tabela, None)]
+
+
+# ==================== ANÁLISE ====================
+
+def analisar(formas: Dict[str, query_log.Forma], min_rows: int = 1000,
+             min_seletividade: float = MIN_SELETIVIDADE) -> Relatorio:
+    sqlite = db.use_sqlite
+    pequena = explain_audit.tabelas_pequenas(min_rows)
+    lidas = {sql: f for sql, f in formas.items()
+             if f.exemplo and f.exemplo.lstrip().upper().startswith(('SELECT', 'WITH', '('))}
+
+    with db.raw_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            existentes_tabelas = _tabelas_existentes(cursor, sqlite)
+            tabelas = sorted({t for f in lidas.values() for t in explain_audit._tabelas(f.exemplo).values()}
+                             & existentes_tabelas)
+            existentes, implicitas = (index_manager.catalogo_sqlite if sqlite
+                                      else index_manager.catalogo_mysql)(cursor, tabelas)
+            colunas = {t: _colunas(cursor, sqlite, t) for t in tabelas}
+            fks = {t: _colunas_fk(cursor, sqlite, t) for t in tabelas}
+            nao_usados = None if sqlite else _nao_usados_mysql(cursor)
+        finally:
+            cursor.close()
+
+    def efetivas(tabela, cols):
+        extra = implicitas.get(tabela, ())
+        return tuple(cols) + tuple(c for c in extra if c.lower() not in index_manager._chave(cols))
+
+    contagens: Dict[Tuple[str, str], Tuple[int, int]] = {}
+
+    def seletividade(tabela, coluna):
+        """(distintos, linhas) e se a coluna tem baixa seletividade"""
+        coluna = coluna.split('(')[0]
+        if (tabela, coluna) not in contagens:
+            with db.raw_connection() as conn:
+                cursor = conn.cursor()
+                try:
+                    contagens[(tabela, coluna)] = _seletividade(cursor, sqlite, tabela, coluna)
+                finally:
+                    cursor.close()
+        distintos, linhas = contagens[(tabela, coluna)]
+        return distintos, linhas, bool(linhas) and distintos / linhas < min_seletividade
+
+    usados: Set[str] = set()
+    propostas: Dict[Tuple[str, Tuple[str, ...]], dict] = {}
+    atendidas: List[Tuple[str, str]] = []
+    for sql, forma in sorted(lidas.items(), key=lambda item: -item[1].total_ms):
+        try:
+            plano = explain_audit.explicar(forma.exemplo, tuple(forma.params))
+        except Exception as e:
+            logger.warning(f"EXPLAIN falhou para '{explain_audit._resumo(sql, 80)}': {e}")
+            continue
+        usados |= _indices_do_plano(plano, sqlite)
+        problemas, _ = explain_audit.classificar(forma.exemplo, explain_audit.achados(forma.exemplo, plano), pequena)
+        for tabela in sorted({t for _, t in problemas if t in colunas}):
+            cols = candidato_para(forma.exemplo, tabela, colunas[tabela])
+            descricao = tuple(f"{tipo} em {t}" for tipo, t in problemas if t in (tabela, None))
+            if not cols:
+                atendidas.append((sql, f"{', '.join(descricao)}: sem coluna de filtro/ordenação indexável (função na coluna?)"))
+                continue
+            atual = next((e for e in existentes.get(tabela, ())
+                          if _atende(efetivas(tabela, e.colunas), cols)), None)
+            if atual is not None:
+                atendidas.append((sql, f"{', '.join(descricao)}: {atual.nome} já cobre ({', '.join(cols)})"))
+                continue
+            # mesma regra da remoção: índice de uma coluna quase constante não compensa
+            distintos, linhas, baixa = seletividade(tabela, cols[0]) if len(cols) == 1 else (0, 0, False)
+            if baixa:
+                atendidas.append((sql, f"{', '.join(descricao)}: {cols[0]} tem baixa seletividade "
+                                       f"({distintos} valor(es) em {linhas} linhas); sem índice"))
+                continue
+            indice = Indice(_nome(tabela, cols), tabela, cols)
+            try:
+                verificado = _testar(indice, forma.exemplo, tuple(forma.params), pequena)
+            except Exception as e:
+                logger.warning(f"Não foi possível testar {indice.nome}: {e}")
+                verificado = None
+            if verificado is False:
+                atendidas.append((sql, f"{', '.join(descricao)}: ({', '.join(cols)}) não melhora o plano"))
+                continue
+            proposta = propostas.setdefault((tabela, cols), {'indice': indice, 'formas': [], 'custo': 0.0,
+                                                             'execucoes': 0, 'achados': set(),
+                                                             'verificado': verificado})
+            proposta['formas'].append(sql)
+            proposta['custo'] += forma.total_ms
+            proposta['execucoes'] += forma.contagem
+            proposta['achados'].update(descricao)
+
+    # candidato que é prefixo de outro da mesma tabela é atendido por ele
+    for (tabela, cols), proposta in sorted(propostas.items(), key=lambda item: len(item[0][1])):
+        maior = next((p for (t, c), p in propostas.items()
+                      if t == tabela and len(c) > len(cols) and _atende(c, cols) and p is not proposta), None)
+        if maior is not None:
+            maior['formas'] += proposta['formas']
+            maior['custo'] += proposta['custo']
+            maior['execucoes'] += proposta['execucoes']
+            maior['achados'] |= proposta['achados']
+            proposta['formas'] = []
+    criar = [Candidato(p['indice'], tuple(p['formas']), p['custo'], p['execucoes'],
+                       tuple(sorted(p['achados'])), p['verificado'])
+             for p in propostas.values() if p['formas']]
+    criar.sort(key=lambda c: -c.custo_ms)
+
+    # em tabela pequena o planejador prefere varrer: não usar o índice ali não diz nada
+    grandes = [t for t in tabelas if not pequena(t)]
+    remover = _remocoes(grandes, existentes, usados, nao_usados, fks, seletividade)
+    return Relatorio(criar, remover, atendidas, len(lidas), sum(f.contagem for f in lidas.values()))
+
+
+def _remocoes(tabelas, existentes, usados, nao_usados, fks, seletividade) -> List[Remocao]:
+    declarados = {(i.tabela, i.nome.lower()) for i in index_manager.INDICES}
+    remover = []
+    for tabela in tabelas:
+        indices = existentes.get(tabela, [])
+        for e in indices:
+            if e.primario or e.unico or e.fulltext or e.parcial:
+                continue
+            nome = e.nome.lower()
+            # o único índice que começa pela coluna de uma FK fica (o InnoDB exige; sem ele
+            # excluir a linha referenciada varre a tabela)
+            primeira = index_manager._chave(e.colunas)[0].split('(')[0]
+            outros = [o for o in indices if o is not e and index_manager._chave(o.colunas)[0] == primeira]
+            if primeira in fks.get(tabela, ()) and not outros:
+                continue
+            usado = nome in usados or (nao_usados is not None and (tabela, nome) not in nao_usados)
+            distintos, linhas, baixa = seletividade(tabela, e.colunas[0])
+            baixa = baixa and len(e.colunas) == 1
+            if usado and not baixa:
+                continue
+            motivos = []
+            if not usado:
+                motivos.append("nenhuma consulta da carga usa")
+            if baixa:
+                motivos.append(f"baixa seletividade ({distintos} valor(es) em {linhas} linhas)")
+            remover.append(Remocao(e, '; '.join(motivos), (tabela, nome) in declarados))
+    return remover
+
+
+# ==================== SAÍDA ====================
+
+def migracao(relatorio: Relatorio, origem: str) -> str:
+    """Script SQL com as mudanças sugeridas e o motivo de cada uma"""
+    sqlite = db.use_sqlite
+    backend = 'SQLite' if sqlite else 'MySQL'
+    linhas = [f"-- Migração de índices sugerida por index_advisor.py em {datetime.now():%Y-%m-%d %H:%M} ({backend})",
+              f"-- Carga: {relatorio.formas} forma(s) de consulta, {relatorio.execucoes} execução(ões) ({origem})", ""]
+    if not (relatorio.criar or relatorio.remover):
+        linhas.append("-- Nenhuma mudança sugerida")
+        return '\n'.join(linhas) + '\n'
+
+    for c in relatorio.criar:
+        teste = {True: 'plano melhora (testado)', None: 'não verificado'}[c.verificado]
+        linhas.append(f"-- {c.indice.nome}: {', '.join(c.achados)}; {len(c.formas)} forma(s), "
+                      f"{c.execucoes} execução(ões), {c.custo_ms:.0f} ms no total; {teste}")
+        for sql in c.formas[:3]:
+            linhas.append(f"--   {explain_audit._resumo(sql, 100)}")
+        linhas.append(f"{index_manager.ddl_criar(c.indice, sqlite)};")
+        linhas.append("")
+    for r in relatorio.remover:
+        linhas.append(f"-- {r.indice.nome} ({r.indice.tabela}: {', '.join(r.indice.colunas)}): {r.motivo}")
+        linhas.append(f"{index_manager.ddl_remover(r.indice.tabela, r.indice.nome, sqlite)};")
+        linhas.append("")
+
+    linhas.append("-- Para a sincronização (index_manager.py) não desfazer a migração:")
+    for c in relatorio.criar:
+        linhas.append(f"--   INDICES: Indice({c.indice.nome!r}, {c.indice.tabela!r}, {c.indice.colunas!r}),")
+    for r in relatorio.remover:
+        if r.declarado:
+            linhas.append(f"--   retirar {r.indice.nome} de INDICES e acrescentá-lo a OBSOLETOS")
+        else:
+            linhas.append(f"--   OBSOLETOS: {r.indice.nome.lower()!r},")
+    return '\n'.join(linhas) + '\n'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Sugestão de índices a partir da carga registrada')
+    parser.add_argument('--log', nargs='+', default=None,
+                        help='Arquivo(s) JSON Lines do query_log (padrão: Config.QUERY_LOG_PATH)')
+    parser.add_argument('--cenarios', action='store_true',
+                        help='Gera a carga executando os cenários do explain_audit.py')
+    parser.add_argument('--min-rows', type=int, default=1000,
+                        help='Tabelas menores que isso podem ser varridas sem sugestão (padrão: 1000)')
+    parser.add_argument('--min-selectivity', type=float, default=MIN_SELETIVIDADE,
+                        help=f'Distintos/linhas abaixo disso marcam baixa seletividade (padrão: {MIN_SELETIVIDADE})')
+    parser.add_argument('--output', help='Grava o script de migração neste arquivo (padrão: saída padrão)')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
+
+    if not db.ensure_connected():
+        logger.error("Sem conexão com o banco de dados")
+        return 1
+
+    caminhos = args.log or ([Config.QUERY_LOG_PATH] if Config.QUERY_LOG_PATH else [])
+    caminhos = [c for c in caminhos if os.path.exists(c)] if not args.cenarios else []
+    if caminhos:
+        formas, origem = query_log.carregar(caminhos), ', '.join(caminhos)
+    else:
+        if not args.cenarios:
+            logger.info("Nenhum registro de consultas encontrado; usando os cenários do explain_audit")
+        formas, origem = carga_dos_cenarios(), 'cenários do explain_audit'
+    formas.pop(query_log.OUTRAS, None)
+    if not formas:
+        logger.error("Carga vazia: nada a analisar")
+        return 1
+
+    relatorio = analisar(formas, min_rows=args.min_rows, min_seletividade=args.min_selectivity)
+    for sql, observacao in relatorio.atendidas:
+        logger.info(f"  {explain_audit._resumo(sql, 90)}: {observacao}")
+
+    script = migracao(relatorio, origem)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as arquivo:
+            arquivo.write(script)
+        logger.info(f"Migração gravada em {args.output}")
+    else:
+        sys.stdout.write(script)
+
+    backend = 'SQLite' if db.use_sqlite else 'MySQL'
+    if relatorio.criar or relatorio.remover:
+        logger.warning(f"✗ {len(relatorio.criar)} índice(s) a criar, {len(relatorio.remover)} a remover ({backend})")
+        return 2
+    logger.info(f"✓ {relatorio.formas} forma(s) analisadas: índices adequados à carga ({backend})")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,362 @@
+# -*- coding: utf-8 -*-
+"""
+Índices secundários do banco, declarados uma única vez
+Sistema de Consultório Médico
+
+INDICES abaixo é a fonte única dos índices das tabelas principais, no MySQL e no SQLite.
+A sincronização compara a declaração com o catálogo (information_schema.STATISTICS /
+PRAGMA index_list) e:
+
+- cria os índices que faltam (MySQL: ALTER TABLE ... ALGORITHM=INPLACE, LOCK=NONE, sem
+  bloquear escritas; FULLTEXT exige LOCK=SHARED);
+- recria os que existem com o mesmo nome e colunas diferentes;
+- remove os redundantes: prefixo à esquerda de outro índice ou da chave primária (ex.:
+  idx_consulta_clinica (CodCli) é prefixo da PK (CodCli, CodMed, CpfPaciente, Data_Hora))
+  ou duplicatas exatas, e os listados em OBSOLETOS. Índices não declarados que não são
+  redundantes ficam como estão.
+
+No InnoDB todo índice secundário já termina com as colunas da PK, então
+idx_consulta_data (Data_Hora) equivale à declaração (Data_Hora, CodCli, CodMed, CpfPaciente);
+a comparação leva isso em conta e não recria o índice. No SQLite as colunas de desempate
+precisam estar no índice, por isso são declaradas explicitamente.
+
+No SQLite de demonstração a sincronização roda ao abrir o banco (db._ensure_sqlite_schema).
+
+    python index_manager.py --dry-run     # mostra o que seria feito
+    python index_manager.py --apply       # aplica (online no MySQL)
+    python index_manager.py --sql         # DDL completo para o cliente mysql (create_indexes.sql)
+"""
+
+import argparse
+import logging
+import sys
+from typing import Dict, List, NamedTuple, Sequence, Tuple
+
+import search
+from db import db
+
+logger = logging.getLogger("consultorio.index_manager")
+
+
+class Indice(NamedTuple):
+    nome: str
+    tabela: str
+    colunas: Tuple[str, ...]
+    fulltext: bool = False
+    sqlite: bool = True  # também criado no SQLite (FULLTEXT nunca: lá a busca usa FTS5)
+
+
+INDICES: List[Indice] = [
+    # Listagem de consultas (mais recentes primeiro, por chave), períodos, próximas consultas
+    Indice('idx_consulta_data', 'tabelaconsulta', ('Data_Hora', 'CodCli', 'CodMed', 'CpfPaciente')),
+    # Filtro por médico (com ou sem período), GROUP BY CodMed e a FK de CodMed
+    Indice('idx_consulta_medico_data', 'tabelaconsulta', ('CodMed', 'Data_Hora', 'CodCli', 'CpfPaciente')),
+    # FK de CpfPaciente (exclusão de paciente e trigger de rollup)
+    Indice('idx_consulta_paciente', 'tabelaconsulta', ('CpfPaciente',)),
+    # Ordenações da listagem de pacientes (desempate pela PK)
+    Indice('idx_paciente_nome', 'tabelapaciente', ('NomePac', 'CpfPaciente')),
+    Indice('idx_paciente_data_nasc', 'tabelapaciente', ('DataNascimento', 'CpfPaciente')),
+    Indice('idx_medico_nome', 'tabelamedico', ('NomeMed',)),
+    Indice('idx_medico_especialidade', 'tabelamedico', ('Especialidade',)),
+    Indice('idx_clinica_nome', 'tabelaclinica', ('NomeCli',)),
+] + [
+    # Busca por nome/especialidade (ver search.py)
+    Indice(indice, tabela, tuple(colunas), fulltext=True, sqlite=False)
+    for tabela, _, colunas, indice, _ in search.ENTIDADES.values()
+]
+
+# Índices de versões anteriores do create_indexes.sql que não são prefixo de outro mas
+# foram substituídos (idx_consulta_data_med (Data_Hora, CodMed) -> idx_consulta_medico_data)
+# ou retirados por sugestão do index_advisor.py (idx_paciente_genero: dois valores em toda a
+# tabela, não evita ler metade dela e pesa em toda escrita)
+OBSOLETOS = ('idx_consulta_data_med', 'idx_paciente_genero')
+
+# MySQL: operação não suportada com o ALGORITHM/LOCK pedido
+_ONLINE_NAO_SUPORTADO = (1845, 1846)
+
+
+class Existente(NamedTuple):
+    nome: str
+    tabela: str
+    colunas: Tuple[str, ...]
+    primario: bool = False
+    unico: bool = False
+    fulltext: bool = False
+    parcial: bool = False
+
+
+def _chave(colunas: Sequence[str]) -> Tuple[str, ...]:
+    return tuple(c.lower() for c in colunas)
+
+
+def declarados(sqlite: bool = False) -> List[Indice]:
+    """Índices declarados que valem para o backend"""
+    return [i for i in INDICES if not sqlite or (i.sqlite and not i.fulltext)]
+
+
+# ==================== CATÁLOGO ====================
+
+def catalogo_mysql(cursor, tabelas: Sequence[str]) -> Tuple[Dict[str, List[Existente]], Dict[str, Tuple[str, ...]]]:
+    """
+    Índices existentes por tabela e colunas implícitas no fim de cada índice secundário
+    (as da PK, no InnoDB).
+    """
+    marcadores = ', '.join(['%s'] * len(tabelas))
+    cursor.execute(
+        "SELECT LOWER(TABLE_NAME), INDEX_NAME, NON_UNIQUE, INDEX_TYPE, COLUMN_NAME, SUB_PART "
+        "FROM information_schema.STATISTICS "
+        f"WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME IN ({marcadores}) "
+        "ORDER BY TABLE_NAME, INDEX_NAME, SEQ_IN_INDEX", tuple(tabelas))
+    colunas: Dict[Tuple[str, str], List[str]] = {}
+    atributos = {}
+    for tabela, nome, nao_unico, tipo, coluna, sub_part in cursor.fetchall():
+        # índice de prefixo (coluna(10)) não equivale ao da coluna inteira
+        colunas.setdefault((tabela, nome), []).append(f"{coluna}({sub_part})" if sub_part else coluna)
+        atributos[(tabela, nome)] = (not int(nao_unico), tipo == 'FULLTEXT')
+    existentes: Dict[str, List[Existente]] = {t: [] for t in tabelas}
+    implicitas: Dict[str, Tuple[str, ...]] = {}
+    for (tabela, nome), cols in colunas.items():
+        unico, fulltext = atributos[(tabela, nome)]
+        existentes[tabela].append(Existente(nome, tabela, tuple(cols), primario=nome == 'PRIMARY',
+                                            unico=unico, fulltext=fulltext))
+        if nome == 'PRIMARY':
+            implicitas[tabela] = tuple(cols)
+    return existentes, implicitas
+
+
+def catalogo_sqlite(cursor, tabelas: Sequence[str]) -> Tuple[Dict[str, List[Existente]], Dict[str, Tuple[str, ...]]]:
+    """
+    Como catalogo_mysql, para o SQLite: a coluna implícita é o rowid, que só tem nome
+    quando a PK é INTEGER PRIMARY KEY (ex.: tabelaclinica.CodCli).
+    """
+    existentes: Dict[str, List[Existente]] = {}
+    implicitas: Dict[str, Tuple[str, ...]] = {}
+    for tabela in tabelas:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (tabela,))
+        if cursor.fetchone() is None:
+            continue
+        cursor.execute(f"PRAGMA table_info({tabela})")
+        pk = sorted((linha[5], linha[1], (linha[2] or '').upper()) for linha in cursor.fetchall() if linha[5])
+        existentes[tabela] = []
+        if len(pk) == 1 and pk[0][2] == 'INTEGER':
+            implicitas[tabela] = (pk[0][1],)
+            existentes[tabela].append(Existente('PRIMARY', tabela, (pk[0][1],), primario=True, unico=True))
+        cursor.execute(f"PRAGMA index_list({tabela})")
+        for _, nome, unico, origem, parcial in cursor.fetchall():
+            cursor.execute(f"PRAGMA index_info({nome})")
+            cols = tuple(linha[2] for linha in cursor.fetchall())
+            existentes[tabela].append(Existente(nome, tabela, cols, primario=origem == 'pk',
+                                                unico=bool(unico), parcial=bool(parcial)))
+    return existentes, implicitas
+
+
+# ==================== PLANO ====================
+
+class Plano(NamedTuple):
+    criar: List[Indice]
+    recriar: List[Indice]
+    remover: List[Existente]
+    motivos: Dict[str, str]  # nome do índice removido -> motivo
+
+
+def planejar(existentes: Dict[str, List[Existente]], implicitas: Dict[str, Tuple[str, ...]],
+             sqlite: bool = False) -> Plano:
+    """Diferença entre INDICES e o catálogo: o que criar, recriar e remover"""
+    def efetivas(tabela, colunas):
+        extra = implicitas.get(tabela, ())
+        return _chave(tuple(colunas) + tuple(c for c in extra if c.lower() not in _chave(colunas)))
+
+    criar, recriar, remover, motivos = [], [], [], {}
+    desejados = [i for i in declarados(sqlite) if i.tabela in existentes]
+    for indice in declarados(sqlite):
+        if indice.tabela not in existentes:
+            logger.warning(f"Tabela {indice.tabela} não existe; índice {indice.nome} ignorado")
+
+    nomes_declarados = {(i.tabela, i.nome.lower()) for i in desejados}
+    for indice in desejados:
+        atual = next((e for e in existentes[indice.tabela] if e.nome.lower() == indice.nome.lower()), None)
+        if atual is None:
+            criar.append(indice)
+        elif (atual.fulltext != indice.fulltext
+              or efetivas(indice.tabela, atual.colunas) != efetivas(indice.tabela, indice.colunas)):
+            recriar.append(indice)
+
+    # estado final: índices que ficam + declarados; procura redundâncias entre eles
+    for tabela in {i.tabela for i in desejados}:
+        finais = [(e.nome, e.colunas, e) for e in existentes[tabela]
+                  if (tabela, e.nome.lower()) not in nomes_declarados]
+        finais += [(i.nome, i.colunas, i) for i in desejados if i.tabela == tabela]
+        removiveis = [(nome, colunas, origem) for nome, colunas, origem in finais
+                      if isinstance(origem, Existente) and not (origem.primario or origem.unico
+                                                                or origem.fulltext or origem.parcial)]
+        for nome, _, origem in removiveis:
+            if nome.lower() in OBSOLETOS:
+                remover.append(origem)
+                motivos[nome] = "obsoleto"
+
+        for nome, colunas, origem in removiveis:
+            if nome in motivos:
+                continue
+            for outro_nome, outro_colunas, outro in finais:
+                if outro_nome == nome or outro_nome in motivos or getattr(outro, 'fulltext', False):
+                    continue
+                mesmo = (_chave(colunas) == _chave(outro_colunas)
+                         or efetivas(tabela, colunas) == efetivas(tabela, outro_colunas))
+                prefixo = (len(colunas) < len(outro_colunas)
+                           and _chave(outro_colunas)[:len(colunas)] == _chave(colunas))
+                # duplicata exata: fica o declarado, a PK/único ou, entre dois não declarados, o de menor nome
+                if prefixo or (mesmo and (not isinstance(outro, Existente) or outro.primario
+                                          or outro.unico or outro_nome < nome)):
+                    remover.append(origem)
+                    motivos[nome] = f"{'duplicata' if mesmo else 'prefixo'} de {outro_nome}"
+                    break
+    return Plano(criar, recriar, remover, motivos)
+
+
+# ==================== DDL ====================
+
+def _online(fulltext: bool = False) -> str:
+    # FULLTEXT não permite escritas concorrentes durante a criação
+    return f", ALGORITHM=INPLACE, LOCK={'SHARED' if fulltext else 'NONE'}"
+
+
+def ddl_criar(indice: Indice, sqlite: bool = False, online: bool = True) -> str:
+    colunas = ', '.join(indice.colunas)
+    if sqlite:
+        return f"CREATE INDEX IF NOT EXISTS {indice.nome} ON {indice.tabela} ({colunas})"
+    tipo = 'FULLTEXT INDEX' if indice.fulltext else 'INDEX'
+    return f"ALTER TABLE {indice.tabela} ADD {tipo} {indice.nome} ({colunas}){_online(indice.fulltext) if online else ''}"
+
+
+def ddl_recriar(indice: Indice, sqlite: bool = False, online: bool = True) -> List[str]:
+    if sqlite:
+        return [ddl_remover(indice.tabela, indice.nome, sqlite=True), ddl_criar(indice, sqlite=True)]
+    # numa única ALTER: o índice nunca some para as consultas
+    tipo = 'FULLTEXT INDEX' if indice.fulltext else 'INDEX'
+    return [f"ALTER TABLE {indice.tabela} DROP INDEX {indice.nome}, ADD {tipo} {indice.nome} "
+            f"({', '.join(indice.colunas)}){_online(indice.fulltext) if online else ''}"]
+
+
+def ddl_remover(tabela: str, nome: str, sqlite: bool = False, online: bool = True) -> str:
+    if sqlite:
+        return f"DROP INDEX IF EXISTS {nome}"
+    return f"ALTER TABLE {tabela} DROP INDEX `{nome}`{_online() if online else ''}"
+
+
+def comandos(plano: Plano, sqlite: bool = False, online: bool = True) -> List[Tuple[str, str]]:
+    """[(tabela, comando)] na ordem segura: cria antes de remover (FKs sempre têm um índice)"""
+    lista = [(i.tabela, ddl_criar(i, sqlite, online)) for i in plano.criar]
+    for indice in plano.recriar:
+        lista += [(indice.tabela, c) for c in ddl_recriar(indice, sqlite, online)]
+    lista += [(e.tabela, ddl_remover(e.tabela, e.nome, sqlite, online)) for e in plano.remover]
+    return lista
+
+
+# ==================== SINCRONIZAÇÃO ====================
+
+def sincronizar(conn, sqlite: bool = False, aplicar: bool = True, permitir_bloqueio: bool = False
+                ) -> Tuple[List[str], int]:
+    """
+    Lê o catálogo, planeja e (se ``aplicar``) executa as mudanças.
+
+    Args:
+        conn: Conexão DB-API (db.raw_connection())
+        permitir_bloqueio: MySQL: se a operação online não for suportada, repete sem
+                           ALGORITHM/LOCK (pode bloquear escritas na tabela)
+
+    Returns:
+        Tuple[List[str], int]: (comandos executados ou planejados, falhas)
+    """
+    tabelas = sorted({i.tabela for i in declarados(sqlite)})
+    cursor = conn.cursor()
+    try:
+        existentes, implicitas = (catalogo_sqlite if sqlite else catalogo_mysql)(cursor, tabelas)
+        plano = planejar(existentes, implicitas, sqlite)
+        for nome, motivo in plano.motivos.items():
+            logger.info(f"Índice {nome} será removido ({motivo})")
+        lista = comandos(plano, sqlite)
+        if not aplicar:
+            return [c for _, c in lista], 0
+
+        executados, falhas, alteradas = [], 0, set()
+        for tabela, comando in lista:
+            try:
+                _executar(cursor, comando, sqlite, permitir_bloqueio)
+                executados.append(comando)
+                alteradas.add(tabela)
+                logger.info(f"✓ {comando}")
+            except Exception as e:
+                falhas += 1
+                logger.error(f"✗ {comando}: {e}")
+        if sqlite and alteradas:
+            # estatísticas para o planejador e para db.table_counts(exact=False)
+            for tabela in sorted(alteradas):
+                cursor.execute(f"ANALYZE {tabela}")
+        conn.commit()
+        return executados, falhas
+    finally:
+        cursor.close()
+
+
+def _executar(cursor, comando: str, sqlite: bool, permitir_bloqueio: bool):
+    try:
+        cursor.execute(comando)
+    except Exception as e:
+        if sqlite or not permitir_bloqueio or getattr(e, 'errno', None) not in _ONLINE_NAO_SUPORTADO:
+            raise
+        logger.warning(f"Operação online não suportada ({e}); repetindo com bloqueio")
+        cursor.execute(comando.split(', ALGORITHM=')[0])
+
+
+def script_mysql() -> str:
+    """DDL de todos os índices declarados, para o cliente mysql (não idempotente)"""
+    linhas = ["-- Gerado por: python index_manager.py --sql",
+              "-- Para aplicar de forma idempotente e online: python index_manager.py --apply", ""]
+    for indice in declarados():
+        colunas = ', '.join(indice.colunas)
+        tipo = 'FULLTEXT INDEX' if indice.fulltext else 'INDEX'
+        linhas.append(f"CREATE {tipo} {indice.nome} ON {indice.tabela}({colunas});")
+    return '\n'.join(linhas) + '\n'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Índices secundários declarados (MySQL e SQLite)')
+    parser.add_argument('--apply', action='store_true', help='Cria/recria/remove índices conforme INDICES')
+    parser.add_argument('--dry-run', action='store_true', help='Mostra os comandos sem executar')
+    parser.add_argument('--sql', action='store_true', help='Imprime o DDL completo para o cliente mysql')
+    parser.add_argument('--allow-lock', action='store_true',
+                        help='MySQL: se a operação online não for suportada, executa com bloqueio')
+    args = parser.parse_args(argv)
+
+    if args.sql:
+        sys.stdout.write(script_mysql())
+        return 0
+
+    logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
+
+    if not (args.apply or args.dry_run):
+        parser.print_help()
+        return 1
+
+    if not db.ensure_connected():
+        logger.error("Sem conexão com o banco de dados")
+        return 1
+
+    with db.raw_connection() as conn:
+        lista, falhas = sincronizar(conn, sqlite=db.use_sqlite, aplicar=args.apply,
+                                    permitir_bloqueio=args.allow_lock)
+    backend = 'SQLite' if db.use_sqlite else 'MySQL'
+    if args.dry_run:
+        for comando in lista:
+            print(f"{comando};")
+        logger.info(f"{len(lista)} comando(s) pendente(s) ({backend})")
+        return 0
+    if falhas:
+        logger.error(f"✗ {falhas} comando(s) falharam ({backend})")
+        return 2
+    logger.info(f"✓ Índices sincronizados: {len(lista)} alteração(ões) ({backend})")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
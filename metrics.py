@@ -0,0 +1,310 @@
+"""
+Métricas operacionais no formato de exposição do Prometheus
+Sistema de Consultório Médico
+
+registrar(app) liga ao servidor Flask do Dash:
+
+- a medição de cada callback (/_dash-update-component): histograma de latência e erros
+  por callback (``modulo.funcao``, o mesmo nome que o query_log.py usa para atribuir as
+  consultas), que também passa a ser a origem das consultas feitas durante a requisição;
+- ``GET Config.METRICS_ROUTE`` (/metrics): callbacks, consultas ao banco (query_log.py,
+  por operação e por callback), pool de conexões, caches (cache.py), fan-out (fanout.py),
+  RPCs do Firestore e progresso da migração MySQL -> Firestore. As duas últimas só
+  aparecem se o módulo nosql já estiver carregado no processo (a rota não importa o
+  Firebase);
+- ``GET Config.QUERY_STATS_ROUTE`` (/_stats/queries): o acumulado do query_log em JSON.
+
+Os valores são do processo que responde: com vários workers do gunicorn, colete cada
+worker (ou use um único worker durante o teste de carga).
+
+    curl -s localhost:8050/metrics | grep consultorio_callback_duration_seconds
+"""
+
+import bisect
+import logging
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from flask import Response, g, jsonify, request
+
+import query_log
+from cache import cache_stats
+from config import Config
+from db import db
+from fanout import fanout_stats
+
+logger = logging.getLogger("consultorio.metrics")
+
+# Limites superiores (s) das faixas do histograma de callbacks
+LIMITES_CALLBACK = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Histograma:
+    """Contagens por faixa (não cumulativas), soma e total"""
+
+    __slots__ = ('limites', 'faixas', 'soma', 'total')
+
+    def __init__(self, limites):
+        self.limites = tuple(limites)
+        self.faixas = [0] * (len(self.limites) + 1)
+        self.soma = 0.0
+        self.total = 0
+
+    def observar(self, valor: float):
+        self.faixas[bisect.bisect_left(self.limites, valor)] += 1
+        self.soma += valor
+        self.total += 1
+
+
+_callbacks: Dict[str, Histograma] = {}
+_erros_callback: Dict[str, int] = {}
+_lock = threading.Lock()
+
+
+def observar_callback(nome: str, duracao: float, erro: bool = False):
+    """Soma uma execução do callback ``nome`` (``duracao`` em segundos)"""
+    with _lock:
+        histograma = _callbacks.get(nome)
+        if histograma is None:
+            histograma = _callbacks[nome] = Histograma(LIMITES_CALLBACK)
+        histograma.observar(duracao)
+        if erro:
+            _erros_callback[nome] = _erros_callback.get(nome, 0) + 1
+
+
+# ==================== EXPOSIÇÃO ====================
+
+def _escapar(valor: Any) -> str:
+    return str(valor).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _numero(valor: float) -> str:
+    if valor == float('inf'):
+        return '+Inf'
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class _Saida:
+    """Monta o texto de exposição: HELP/TYPE uma vez por métrica, depois as amostras"""
+
+    def __init__(self):
+        self.linhas: List[str] = []
+        self._declaradas = set()
+
+    def metrica(self, nome: str, tipo: str, ajuda: str):
+        if nome not in self._declaradas:
+            self._declaradas.add(nome)
+            self.linhas.append(f"# HELP {nome} {ajuda}")
+            self.linhas.append(f"# TYPE {nome} {tipo}")
+
+    def amostra(self, nome: str, valor: float, **rotulos):
+        texto = ','.join(f'{k}="{_escapar(v)}"' for k, v in rotulos.items())
+        self.linhas.append(f"{nome}{{{texto}}} {_numero(valor)}" if texto else f"{nome} {_numero(valor)}")
+
+    def histograma(self, nome: str, limites, faixas, soma: float, total: int, **rotulos):
+        """Faixas não cumulativas (len(limites) + 1, a última acima do maior limite)"""
+        acumulado = 0
+        for limite, quantidade in zip(tuple(limites) + (float('inf'),), faixas):
+            acumulado += quantidade
+            self.amostra(f"{nome}_bucket", acumulado, **rotulos, le=_numero(float(limite)))
+        self.amostra(f"{nome}_sum", soma, **rotulos)
+        self.amostra(f"{nome}_count", total, **rotulos)
+
+    def texto(self) -> str:
+        return '\n'.join(self.linhas) + '\n'
+
+
+def _metricas_callbacks(saida: _Saida):
+    with _lock:
+        callbacks = {nome: (h.faixas[:], h.soma, h.total) for nome, h in _callbacks.items()}
+        erros = dict(_erros_callback)
+    nome = 'consultorio_callback_duration_seconds'
+    saida.metrica(nome, 'histogram', 'Latência dos callbacks do Dash')
+    for callback, (faixas, soma, total) in sorted(callbacks.items()):
+        saida.histograma(nome, LIMITES_CALLBACK, faixas, soma, total, callback=callback)
+    saida.metrica('consultorio_callback_errors_total', 'counter', 'Callbacks que terminaram com erro (HTTP 5xx)')
+    for callback, quantidade in sorted(erros.items()):
+        saida.amostra('consultorio_callback_errors_total', quantidade, callback=callback)
+
+
+def _operacao(sql: str) -> str:
+    palavra = sql.split(' ', 1)[0].lower() if sql and sql != query_log.OUTRAS else ''
+    return palavra if palavra in ('select', 'insert', 'update', 'delete', 'replace', 'with') else 'outra'
+
+
+def _metricas_banco(saida: _Saida):
+    formas = query_log.QUERY_LOG.formas()
+    limites = tuple(l / 1000 for l in query_log.LIMITES_MS)
+    por_operacao: Dict[str, Dict[str, Any]] = {}
+    por_callback: Dict[str, List[float]] = {}
+    for forma in formas.values():
+        dados = por_operacao.setdefault(_operacao(forma.sql), {
+            'faixas': [0] * len(forma.histograma), 'soma': 0.0, 'total': 0, 'linhas': 0, 'bytes': 0})
+        dados['faixas'] = [a + b for a, b in zip(dados['faixas'], forma.histograma)]
+        dados['soma'] += forma.total_ms / 1000
+        dados['total'] += forma.contagem
+        dados['linhas'] += forma.linhas
+        dados['bytes'] += forma.bytes
+        for origem, (contagem, total_ms) in forma.origens.items():
+            acumulado = por_callback.setdefault(origem, [0, 0.0])
+            acumulado[0] += contagem
+            acumulado[1] += total_ms / 1000
+
+    nome = 'consultorio_db_query_duration_seconds'
+    saida.metrica(nome, 'histogram', 'Latência dos comandos ao banco (db.py), por operação')
+    for operacao, dados in sorted(por_operacao.items()):
+        saida.histograma(nome, limites, dados['faixas'], dados['soma'], dados['total'], operacao=operacao)
+    saida.metrica('consultorio_db_rows_total', 'counter', 'Linhas devolvidas (ou afetadas, nas escritas)')
+    saida.metrica('consultorio_db_bytes_total', 'counter', 'Bytes aproximados dos resultados')
+    for operacao, dados in sorted(por_operacao.items()):
+        saida.amostra('consultorio_db_rows_total', dados['linhas'], operacao=operacao)
+        saida.amostra('consultorio_db_bytes_total', dados['bytes'], operacao=operacao)
+    saida.metrica('consultorio_db_query_shapes', 'gauge', 'Formas de consulta distintas registradas')
+    saida.amostra('consultorio_db_query_shapes', len(formas))
+
+    saida.metrica('consultorio_db_callback_queries_total', 'counter', 'Comandos ao banco feitos por callback')
+    saida.metrica('consultorio_db_callback_query_seconds_total', 'counter', 'Tempo no banco por callback')
+    for origem, (contagem, segundos) in sorted(por_callback.items()):
+        saida.amostra('consultorio_db_callback_queries_total', contagem, callback=origem)
+        saida.amostra('consultorio_db_callback_query_seconds_total', segundos, callback=origem)
+
+    saida.metrica('consultorio_db_connection_events_total', 'counter',
+                  'Pings, reconexões, leituras repetidas e erros de conexão')
+    for evento, quantidade in sorted(db.connection_stats().items()):
+        saida.amostra('consultorio_db_connection_events_total', quantidade, evento=evento)
+
+    pool = db.pool_stats()
+    if pool:
+        saida.metrica('consultorio_db_pool_connections', 'gauge', 'Conexões do pool por estado')
+        for estado in ('size', 'idle', 'in_use', 'min_size', 'max_size'):
+            saida.amostra('consultorio_db_pool_connections', pool[estado], estado=estado)
+        saida.metrica('consultorio_db_pool_utilization', 'gauge', 'Conexões em uso / máximo do pool')
+        saida.amostra('consultorio_db_pool_utilization', pool['utilization'])
+        saida.metrica('consultorio_db_pool_wait_seconds_total', 'counter', 'Tempo esperando por uma conexão livre')
+        saida.amostra('consultorio_db_pool_wait_seconds_total', pool['wait_time_total'])
+        saida.metrica('consultorio_db_pool_wait_seconds_max', 'gauge', 'Maior espera por uma conexão livre')
+        saida.amostra('consultorio_db_pool_wait_seconds_max', pool['wait_time_max'])
+        saida.metrica('consultorio_db_pool_events_total', 'counter', 'Eventos do pool (checkouts, esperas, timeouts...)')
+        for evento in ('checkouts', 'waits', 'timeouts', 'created', 'discarded', 'pings', 'health_check_failures'):
+            if evento in pool:
+                saida.amostra('consultorio_db_pool_events_total', pool[evento], evento=evento)
+
+
+def _metricas_cache(saida: _Saida):
+    caches = cache_stats()
+    saida.metrica('consultorio_cache_events_total', 'counter', 'Eventos por cache (hits, misses, evictions...)')
+    for nome, dados in sorted(caches.items()):
+        for evento, valor in sorted(dados.items()):
+            if evento not in ('entries', 'bytes', 'max_bytes', 'hit_ratio'):
+                saida.amostra('consultorio_cache_events_total', valor, cache=nome, evento=evento)
+    saida.metrica('consultorio_cache_hit_ratio', 'gauge', 'Acertos (memória + disco) / consultas ao cache')
+    saida.metrica('consultorio_cache_entries', 'gauge', 'Entradas em memória')
+    saida.metrica('consultorio_cache_bytes', 'gauge', 'Bytes em memória e orçamento do cache')
+    for nome, dados in sorted(caches.items()):
+        saida.amostra('consultorio_cache_hit_ratio', dados['hit_ratio'], cache=nome)
+        saida.amostra('consultorio_cache_entries', dados['entries'], cache=nome)
+        saida.amostra('consultorio_cache_bytes', dados['bytes'], cache=nome, tipo='usado')
+        saida.amostra('consultorio_cache_bytes', dados['max_bytes'], cache=nome, tipo='maximo')
+
+    saida.metrica('consultorio_fanout_events_total', 'counter', 'Chamadas, tarefas, prazos estourados e erros do fan-out')
+    for evento, valor in sorted(fanout_stats().items()):
+        saida.amostra('consultorio_fanout_events_total', valor, evento=evento)
+
+
+def _metricas_firestore(saida: _Saida):
+    """RPCs e migração, só se o módulo nosql já foi carregado por alguma página/script"""
+    db_nosql = sys.modules.get('nosql.db_nosql')
+    if db_nosql is not None:
+        rpc = db_nosql.firebase_db.rpc_stats()
+        saida.metrica('consultorio_firestore_rpc_total', 'counter', 'RPCs ao Firestore por operação')
+        for operacao, quantidade in sorted(rpc['chamadas'].items()):
+            saida.amostra('consultorio_firestore_rpc_total', quantidade, operacao=operacao)
+        saida.metrica('consultorio_firestore_rpc_errors_total', 'counter', 'RPCs ao Firestore que falharam')
+        for operacao, quantidade in sorted(rpc['erros'].items()):
+            saida.amostra('consultorio_firestore_rpc_errors_total', quantidade, operacao=operacao)
+        saida.metrica('consultorio_firestore_documents_read_total', 'counter', 'Documentos lidos do Firestore')
+        saida.amostra('consultorio_firestore_documents_read_total', rpc['documentos_lidos'])
+        saida.metrica('consultorio_firestore_commit_retries_total', 'counter', 'Commits refeitos por erro transitório')
+        saida.amostra('consultorio_firestore_commit_retries_total', rpc['retentativas'])
+
+    migracao = sys.modules.get('nosql.migration')
+    if migracao is None:
+        return
+    progresso = migracao.MySQLToFirestoreMigration.get_progress()
+    saida.metrica('consultorio_migration_status', 'gauge', 'Estado da migração MySQL -> Firestore (1 no estado atual)')
+    saida.amostra('consultorio_migration_status', 1, status=progresso.get('status') or 'idle')
+    saida.metrica('consultorio_migration_elapsed_seconds', 'gauge', 'Duração da migração em andamento/última')
+    saida.amostra('consultorio_migration_elapsed_seconds', progresso.get('elapsed') or 0.0)
+    saida.metrica('consultorio_migration_throughput', 'gauge', 'Documentos migrados por segundo')
+    saida.amostra('consultorio_migration_throughput', progresso.get('throughput') or 0.0)
+    saida.metrica('consultorio_migration_documents', 'gauge', 'Documentos por etapa e situação')
+    for etapa in ('pacientes', 'medicos', 'clinicas', 'consultas'):
+        for situacao in ('total', 'migrados', 'erros', 'ignorados', 'removidos'):
+            saida.amostra('consultorio_migration_documents', (progresso.get(etapa) or {}).get(situacao, 0),
+                          etapa=etapa, situacao=situacao)
+
+
+def exposicao() -> str:
+    """Todas as métricas no formato texto do Prometheus"""
+    saida = _Saida()
+    for coletar in (_metricas_callbacks, _metricas_banco, _metricas_cache, _metricas_firestore):
+        try:
+            coletar(saida)
+        except Exception as e:
+            # uma fonte com problema não derruba as demais
+            logger.error(f"Erro ao coletar métricas ({coletar.__name__}): {e}")
+    return saida.texto()
+
+
+# ==================== SERVIDOR ====================
+
+def _nome_callback(app, corpo) -> Optional[str]:
+    output = (corpo or {}).get('output')
+    funcao = (app.callback_map.get(output) or {}).get('callback') if output else None
+    return f"{funcao.__module__}.{funcao.__name__}" if funcao else output
+
+
+def registrar(app):
+    """Liga a medição de callbacks e as rotas de métricas ao servidor Flask de ``app``"""
+    server = app.server
+
+    @server.before_request
+    def _iniciar_callback():
+        if request.method == 'POST' and request.path.endswith('/_dash-update-component'):
+            nome = _nome_callback(app, request.get_json(silent=True)) or 'desconhecido'
+            g.metrics_callback = (nome, time.perf_counter())
+            # consultas feitas durante a requisição são atribuídas ao callback (query_log.py)
+            g.query_origem = query_log.definir_origem(nome)
+
+    @server.after_request
+    def _concluir_callback(resposta):
+        medida = g.pop('metrics_callback', None)
+        if medida is not None:
+            nome, inicio = medida
+            observar_callback(nome, time.perf_counter() - inicio, erro=resposta.status_code >= 500)
+        return resposta
+
+    @server.teardown_request
+    def _limpar_callback(erro=None):
+        # exceção que escapou do Dash: after_request não rodou
+        medida = g.pop('metrics_callback', None)
+        if medida is not None:
+            nome, inicio = medida
+            observar_callback(nome, time.perf_counter() - inicio, erro=True)
+        token = g.pop('query_origem', None)
+        if token is not None:
+            query_log.restaurar_origem(token)
+
+    if Config.METRICS_ROUTE:
+        @server.route(Config.METRICS_ROUTE)
+        def metricas():
+            return Response(exposicao(), mimetype=None, content_type=_CONTENT_TYPE)
+
+    if Config.QUERY_STATS_ROUTE:
+        @server.route(Config.QUERY_STATS_ROUTE)
+        def exportar_consultas():
+            """Formas de consulta deste processo (JSON), das mais custosas para as menos; ?top=N limita"""
+            return jsonify(query_log.QUERY_LOG.exportar(request.args.get('top', type=int)))
@@ -0,0 +1,305 @@
+"""
+Contadores agregados de consultas no Firestore
+Sistema de Consultório Médico - NoSQL Integration
+
+Cada bucket (especialidade, médico, clínica ou dia) é um documento da coleção
+FirebaseConfig.COLLECTION_AGREGADOS com ID '<dimensao>__<chave>':
+
+    {'dimensao': 'especialidade', 'chave': 'Cardiologia', 'total': 42, 'updated_at': ...}
+
+Os contadores são atualizados com Increment(±1) no mesmo commit (batch ou transação)
+que cria/remove a consulta, então os painéis leem O(número de buckets) documentos em
+vez de varrer a coleção de consultas. Um documento por bucket (e não um mapa único
+por dimensão) espalha as escritas e evita o limite de ~1 escrita/s por documento.
+
+Escritas feitas fora do CRUD (migração em lote, console) não mexem nos contadores;
+a migração chama ``reconstruir()`` ao final e o mesmo pode ser feito manualmente:
+
+    python -m nosql.aggregations --rebuild
+    python -m nosql.aggregations --show especialidade
+"""
+
+import argparse
+import logging
+import sys
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+
+from google.cloud.firestore_v1 import Increment, SERVER_TIMESTAMP, transactional
+from google.cloud.firestore_v1.base_query import FieldFilter
+
+from nosql.db_nosql import firebase_db
+from nosql.config_nosql import FirebaseConfig
+
+logger = logging.getLogger("consultorio.firebase.aggregations")
+
+DIMENSOES = ('especialidade', 'medico', 'clinica', 'dia')
+
+# Consultas removidas por commit na exclusão em massa; cada commit leva também os
+# decrementos (no máximo 4 buckets por consulta), abaixo do limite de 500 operações
+DELETE_BATCH_SIZE = 100
+
+# Campos necessários para calcular os buckets (projeção no rebuild e nas exclusões)
+CAMPOS_BUCKETS = ['data_hora', 'medico.especialidade', 'medico.codigo', 'clinica.codigo',
+                  'medico_id', 'clinica_id']
+
+
+def bucket_doc_id(dimensao: str, chave: Any) -> str:
+    """ID do documento do bucket ('/' não é permitido em IDs do Firestore)"""
+    return f"{dimensao}__{str(chave).replace('/', '_')}"
+
+
+def buckets_da_consulta(consulta: Dict[str, Any], especialidade: Optional[str] = None) -> Dict[str, str]:
+    """
+    Buckets em que uma consulta é contada, nos dois modos de modelagem.
+
+    Args:
+        consulta: Documento da consulta (embedded ou referenced)
+        especialidade: Especialidade do médico, para o modo referenced
+                       (no embedded ela já vem em consulta['medico'])
+
+    Returns:
+        Dict[str, str]: {dimensao: chave}
+    """
+    medico = consulta.get('medico') or {}
+    clinica = consulta.get('clinica') or {}
+    buckets = {
+        'especialidade': medico.get('especialidade') or especialidade or 'Desconhecida',
+        'medico': medico.get('codigo') or consulta.get('medico_id'),
+        'clinica': clinica.get('codigo') or consulta.get('clinica_id'),
+        'dia': str(consulta.get('data_hora') or '')[:10],
+    }
+    return {dimensao: str(chave) for dimensao, chave in buckets.items() if chave}
+
+
+class ConsultaAggregates:
+    """Manutenção e leitura dos contadores agregados de consultas"""
+
+    def __init__(self):
+        self.db = firebase_db
+
+    def _agregados(self):
+        return self.db.get_collection(FirebaseConfig.COLLECTION_AGREGADOS)
+
+    def _aplicar(self, escrita, buckets: Dict[str, str], delta: int):
+        """Acrescenta os incrementos dos buckets a um WriteBatch ou Transaction"""
+        for dimensao, chave in buckets.items():
+            escrita.set(self._agregados().document(bucket_doc_id(dimensao, chave)), {
+                'dimensao': dimensao,
+                'chave': chave,
+                'total': Increment(delta),
+                'updated_at': SERVER_TIMESTAMP,
+            }, merge=True)
+
+    def _especialidades_por_medico(self) -> Dict[str, str]:
+        """codigo do médico -> especialidade (modo referenced)"""
+        medicos = self.db.get_collection('medicos').select(['especialidade']).stream()
+        return {doc.id: (doc.to_dict() or {}).get('especialidade') for doc in medicos}
+
+    # ==================== ESCRITA ====================
+
+    def criar_consulta(self, dados: Dict[str, Any],
+                       especialidade: Optional[str] = None) -> Tuple[bool, str, Optional[str]]:
+        """
+        Cria a consulta (ID automático) e incrementa seus buckets num único batch atômico.
+
+        Returns:
+            Tuple[bool, str, str]: (sucesso, mensagem, document_id)
+        """
+        try:
+            ref = self.db.get_collection('consultas').document()
+            batch = self.db.db.batch()
+            batch.set(ref, dados)
+            self._aplicar(batch, buckets_da_consulta(dados, especialidade), 1)
+            batch.commit()
+            self.db.write_generation += 1
+            logger.info(f"Documento criado com ID automático em consultas: {ref.id}")
+            return True, "Documento criado com sucesso", ref.id
+        except Exception as e:
+            logger.error(f"Erro ao criar consulta com contadores: {e}")
+            return False, str(e), None
+
+    def deletar_consulta(self, consulta_id: str) -> Tuple[bool, str]:
+        """
+        Remove a consulta e decrementa seus buckets numa transação: a leitura do documento
+        e as escritas são atômicas, então duas remoções simultâneas não decrementam duas vezes.
+
+        Returns:
+            Tuple[bool, str]: (sucesso, mensagem)
+        """
+        ref = self.db.get_collection('consultas').document(consulta_id)
+
+        @transactional
+        def remover(transaction):
+            snapshot = ref.get(transaction=transaction)
+            if not snapshot.exists:
+                return False
+            dados = snapshot.to_dict() or {}
+            especialidade = None
+            if not dados.get('medico') and dados.get('medico_id'):
+                medico = self.db.get_collection('medicos').document(str(dados['medico_id'])).get(
+                    transaction=transaction)
+                especialidade = (medico.to_dict() or {}).get('especialidade') if medico.exists else None
+            transaction.delete(ref)
+            self._aplicar(transaction, buckets_da_consulta(dados, especialidade), -1)
+            return True
+
+        try:
+            if not remover(self.db.db.transaction()):
+                return False, f"Consulta {consulta_id} não encontrada"
+            self.db.write_generation += 1
+            logger.info(f"Documento deletado de consultas: {consulta_id}")
+            return True, "Documento deletado com sucesso"
+        except Exception as e:
+            logger.error(f"Erro ao deletar consulta {consulta_id}: {e}")
+            return False, str(e)
+
+    def deletar_consultas(self, filters: List[tuple]) -> Tuple[bool, str, int]:
+        """
+        Remove as consultas que atendem aos filtros (CASCADE de paciente/médico/clínica),
+        com os decrementos no mesmo commit de cada lote.
+
+        Returns:
+            Tuple[bool, str, int]: (sucesso, mensagem, quantidade removida)
+        """
+        try:
+            query = self.db.get_collection('consultas')
+            for field, operator, value in filters:
+                query = query.where(filter=FieldFilter(field, operator, value))
+            consultas = list(query.select(CAMPOS_BUCKETS).stream())
+            if not consultas:
+                return True, "Nenhum documento encontrado", 0
+
+            especialidades = {}
+            if any(not (doc.to_dict() or {}).get('medico') for doc in consultas):
+                especialidades = self._especialidades_por_medico()
+
+            removidas = 0
+            for inicio in range(0, len(consultas), DELETE_BATCH_SIZE):
+                lote = consultas[inicio:inicio + DELETE_BATCH_SIZE]
+                deltas: Dict[Tuple[str, str], int] = {}
+                batch = self.db.db.batch()
+                for doc in lote:
+                    dados = doc.to_dict() or {}
+                    batch.delete(doc.reference)
+                    buckets = buckets_da_consulta(dados, especialidades.get(str(dados.get('medico_id'))))
+                    for bucket in buckets.items():
+                        deltas[bucket] = deltas.get(bucket, 0) - 1
+                for (dimensao, chave), delta in deltas.items():
+                    self._aplicar(batch, {dimensao: chave}, delta)
+                batch.commit()
+                self.db.write_generation += 1
+                removidas += len(lote)
+
+            logger.info(f"Deletados {removidas} documentos de consultas")
+            return True, f"{removidas} documentos deletados", removidas
+        except Exception as e:
+            logger.error(f"Erro ao deletar consultas por query: {e}")
+            return False, str(e), 0
+
+    # ==================== LEITURA ====================
+
+    def contagens(self, dimensao: str) -> Dict[str, int]:
+        """
+        Lê os contadores de uma dimensão (uma leitura por bucket).
+
+        Args:
+            dimensao: 'especialidade', 'medico', 'clinica' ou 'dia'
+
+        Returns:
+            Dict[str, int]: {chave: total}, sem os buckets zerados
+        """
+        if dimensao not in DIMENSOES:
+            raise ValueError(f"Dimensão inválida: {dimensao}. Use uma de {', '.join(DIMENSOES)}")
+        try:
+            query = self._agregados().where(filter=FieldFilter('dimensao', '==', dimensao))
+            contagem = {}
+            for doc in query.stream():
+                dados = doc.to_dict() or {}
+                if dados.get('total'):
+                    contagem[dados.get('chave', doc.id)] = int(dados['total'])
+            return contagem
+        except Exception as e:
+            logger.error(f"Erro ao ler contadores de {dimensao}: {e}")
+            return {}
+
+    # ==================== RECONSTRUÇÃO ====================
+
+    def reconstruir(self) -> Dict[str, int]:
+        """
+        Recalcula todos os contadores a partir da coleção de consultas (projeção só com os
+        campos dos buckets) e regrava os documentos com os totais exatos; buckets que não
+        existem mais são removidos. Custa uma leitura por consulta: use após cargas em lote
+        ou para corrigir divergências, com a aplicação parada (incrementos concorrentes
+        durante a varredura seriam sobrescritos).
+
+        Returns:
+            Dict[str, int]: quantidade de buckets por dimensão
+        """
+        contagens: Dict[str, Dict[str, int]] = {dimensao: {} for dimensao in DIMENSOES}
+        especialidades = None
+        total = 0
+        for doc in self.db.get_collection('consultas').select(CAMPOS_BUCKETS).stream():
+            dados = doc.to_dict() or {}
+            especialidade = None
+            if not dados.get('medico'):
+                if especialidades is None:
+                    especialidades = self._especialidades_por_medico()
+                especialidade = especialidades.get(str(dados.get('medico_id')))
+            for dimensao, chave in buckets_da_consulta(dados, especialidade).items():
+                contagens[dimensao][chave] = contagens[dimensao].get(chave, 0) + 1
+            total += 1
+
+        agora = datetime.now()
+        documentos = [
+            (bucket_doc_id(dimensao, chave), {'dimensao': dimensao, 'chave': chave,
+                                              'total': quantidade, 'updated_at': agora})
+            for dimensao, buckets in contagens.items()
+            for chave, quantidade in buckets.items()
+        ]
+        novos = {doc_id for doc_id, _ in documentos}
+        obsoletos = [doc_id for doc_id in self.db.query_ids(FirebaseConfig.COLLECTION_AGREGADOS, [])
+                     if doc_id not in novos]
+
+        resultados = self.db.upsert_documents(FirebaseConfig.COLLECTION_AGREGADOS, documentos)
+        resultados += self.db.delete_documents(FirebaseConfig.COLLECTION_AGREGADOS, obsoletos)
+        erros = sum(1 for r in resultados if not r['sucesso'])
+        if erros:
+            logger.error(f"Reconstrução dos contadores: {erros} documento(s) com erro")
+
+        resumo = {dimensao: len(buckets) for dimensao, buckets in contagens.items()}
+        logger.info(f"Contadores reconstruídos a partir de {total} consultas: {resumo} "
+                    f"({len(obsoletos)} bucket(s) obsoleto(s) removido(s))")
+        return resumo
+
+
+aggregates = ConsultaAggregates()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Contadores agregados de consultas no Firestore')
+    parser.add_argument('--rebuild', action='store_true', help='Recalcula todos os contadores do zero')
+    parser.add_argument('--show', choices=DIMENSOES, help='Mostra os contadores de uma dimensão')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(name)s: %(message)s')
+
+    if not args.rebuild and not args.show:
+        parser.print_help()
+        return 1
+    if not firebase_db.connect():
+        print("❌ Erro: Não foi possível conectar ao Firestore")
+        return 1
+
+    if args.rebuild:
+        aggregates.reconstruir()
+    if args.show:
+        contagem = aggregates.contagens(args.show)
+        for chave, total in sorted(contagem.items(), key=lambda item: -item[1]):
+            print(f"   {chave:<30} {total:>10}")
+        print(f"   {'TOTAL':<30} {sum(contagem.values()):>10}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,140 @@
+"""
+Checkpoint da migração incremental MySQL → Firestore
+Sistema de Consultório Médico - NoSQL Integration
+
+Guarda, entre execuções, o que já foi enviado ao Firestore:
+
+- pacientes/médicos/clínicas: hash do conteúdo de cada linha, por document_id;
+- consultas: por dia, (quantidade, XOR dos CRC32 das chaves primárias) e a maior
+  chave já enviada.
+
+Consultas não têm coluna de "alterado em" e Data_Hora não acompanha a ordem de
+inserção (agendamentos são feitos para datas futuras ou passadas), então uma marca
+d'água só em Data_Hora perderia linhas; o resumo por dia detecta inclusões e
+exclusões em qualquer data e limita o reenvio aos dias que mudaram.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import zlib
+from datetime import datetime
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger("consultorio.firebase.checkpoint")
+
+CHECKPOINT_VERSION = 1
+
+
+def hash_linha(linha: Dict[str, Any]) -> str:
+    """Hash estável do conteúdo de uma linha (independe da ordem das colunas)"""
+    conteudo = '\x1f'.join(f"{k}={linha[k]}" for k in sorted(linha))
+    return hashlib.blake2b(conteudo.encode('utf-8'), digest_size=8).hexdigest()
+
+
+def formatar_data_hora(valor: Any) -> str:
+    """Data_Hora como 'YYYY-MM-DD HH:MM:SS', venha como datetime (MySQL) ou texto (SQLite)"""
+    if isinstance(valor, datetime):
+        return valor.strftime('%Y-%m-%d %H:%M:%S')
+    return str(valor)[:19]
+
+
+def chave_consulta(cod_cli: Any, cod_med: Any, cpf: Any, data_hora: Any) -> str:
+    """
+    Chave primária da consulta no mesmo formato de
+    CONCAT_WS('|', CodCli, CodMed, CpfPaciente, CAST(Data_Hora AS CHAR)) no MySQL.
+    """
+    return f"{cod_cli}|{cod_med}|{cpf}|{formatar_data_hora(data_hora)}"
+
+
+def crc_chave(chave: str) -> int:
+    return zlib.crc32(chave.encode('utf-8'))
+
+
+class MigrationCheckpoint:
+    """Estado da migração incremental persistido num arquivo JSON local"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.data = self._vazio()
+        self.load()
+
+    @staticmethod
+    def _vazio() -> Dict[str, Any]:
+        return {
+            'version': CHECKPOINT_VERSION,
+            'updated_at': None,
+            'pacientes': {'hashes': {}},
+            'medicos': {'hashes': {}},
+            'clinicas': {'hashes': {}},
+            'consultas': {'dias': {}, 'ultimo': None},
+        }
+
+    def load(self) -> bool:
+        """Carrega o checkpoint; arquivo ausente ou de outra versão equivale a começar do zero"""
+        if not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') != CHECKPOINT_VERSION:
+                logger.warning(f"Checkpoint {self.path} de versão incompatível; ignorando")
+                return False
+            self.data = data
+            return True
+        except Exception as e:
+            logger.error(f"Erro ao ler checkpoint {self.path}: {e}")
+            return False
+
+    def save(self):
+        """Grava de forma atômica (arquivo temporário + rename), para sobreviver a interrupções"""
+        self.data['updated_at'] = datetime.now().isoformat(timespec='seconds')
+        diretorio = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(diretorio, exist_ok=True)
+        fd, temporario = tempfile.mkstemp(prefix='.checkpoint_', dir=diretorio)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(self.data, f, separators=(',', ':'))
+            os.replace(temporario, self.path)
+        except Exception:
+            if os.path.exists(temporario):
+                os.unlink(temporario)
+            raise
+
+    def reset(self):
+        self.data = self._vazio()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    # ==================== ENTIDADES ====================
+
+    def hashes(self, tipo: str) -> Dict[str, str]:
+        return self.data[tipo]['hashes']
+
+    def set_hashes(self, tipo: str, hashes: Dict[str, str]):
+        self.data[tipo]['hashes'] = hashes
+
+    # ==================== CONSULTAS ====================
+
+    def dias(self) -> Dict[str, list]:
+        """dia ('YYYY-MM-DD') -> [quantidade, xor dos crc32] já enviados"""
+        return self.data['consultas']['dias']
+
+    def clear_dias(self):
+        self.data['consultas']['dias'] = {}
+        self.data['consultas']['ultimo'] = None
+
+    def set_dia(self, dia: str, resumo: Optional[list]):
+        if resumo is None:
+            self.data['consultas']['dias'].pop(dia, None)
+        else:
+            self.data['consultas']['dias'][dia] = list(resumo)
+
+    def ultimo(self) -> Optional[str]:
+        """Maior chave de consulta já enviada, no formato 'YYYYmmddHHMMSS|CodCli|CodMed|CpfPaciente'"""
+        return self.data['consultas'].get('ultimo')
+
+    def set_ultimo(self, chave: Optional[str]):
+        self.data['consultas']['ultimo'] = chave
@@ -29,6 +29,8 @@ class FirebaseConfig:
     COLLECTION_MEDICOS = 'medicos'
     COLLECTION_CLINICAS = 'clinicas'
     COLLECTION_CONSULTAS = 'consultas'
+    # Contadores de consultas por especialidade/médico/clínica/dia (nosql/aggregations.py)
+    COLLECTION_AGREGADOS = 'agregados_consultas'
     
     # Modo de modelagem: 'embedded' ou 'referenced'
     # embedded: dados completos em cada documento de consulta
@@ -38,10 +40,33 @@ class FirebaseConfig:
     # Habilitar logs detalhados
     DEBUG = os.getenv('FIREBASE_DEBUG', 'false').lower() == 'true'
     
+    # Emulador local do Firestore (ex.: localhost:8080); dispensa credenciais
+    FIRESTORE_EMULATOR_HOST = os.getenv('FIRESTORE_EMULATOR_HOST', None)
+    
+    # Escrita em lote: máximo de operações por commit (limite do Firestore: 500),
+    # commits simultâneos e tentativas em caso de contenção
+    BATCH_SIZE = min(int(os.getenv('FIREBASE_BATCH_SIZE', '500')), 500)
+    MAX_IN_FLIGHT = int(os.getenv('FIREBASE_MAX_IN_FLIGHT', '4'))
+    MAX_RETRIES = int(os.getenv('FIREBASE_MAX_RETRIES', '5'))
+    
+    # Validade (s) do cache de estatísticas (contagens por coleção)
+    STATS_TTL = float(os.getenv('FIREBASE_STATS_TTL', '30'))
+    
+    # Arquivo de checkpoint da migração incremental (python -m nosql.migration --incremental)
+    MIGRATION_CHECKPOINT_PATH = os.getenv(
+        'FIREBASE_MIGRATION_CHECKPOINT',
+        str(Path(__file__).parent.parent / '.migration_checkpoint.json')
+    )
+    
+    # Limite de consultas migradas pela página de demonstração (vazio = todas)
+    MIGRATION_LIMIT = int(os.getenv('FIREBASE_MIGRATION_LIMIT')) if os.getenv('FIREBASE_MIGRATION_LIMIT') else None
+    
     @staticmethod
     def validate():
         """Valida se as configurações estão corretas"""
-        if not os.path.exists(FirebaseConfig.FIREBASE_CREDENTIALS_PATH):
+        if FirebaseConfig.FIRESTORE_EMULATOR_HOST:
+            pass
+        elif not os.path.exists(FirebaseConfig.FIREBASE_CREDENTIALS_PATH):
             return False, f"Arquivo de credenciais não encontrado: {FirebaseConfig.FIREBASE_CREDENTIALS_PATH}"
         
         if FirebaseConfig.MODELING_MODE not in ['embedded', 'referenced']:
@@ -3,8 +3,11 @@ Operações CRUD para Firebase Firestore
 Sistema de Consultório Médico - NoSQL Integration
 """
 
+import threading
+import time
 from typing import Dict, Any, List, Optional, Tuple
 from nosql.db_nosql import firebase_db
+from nosql.aggregations import aggregates
 from nosql.models_nosql import FirestoreModels, FirestoreQueries
 from nosql.config_nosql import FirebaseConfig
 import logging
@@ -17,6 +20,9 @@ class FirestoreCRUD:
     
     def __init__(self):
         self.db = firebase_db
+        # cache de estatisticas_gerais: (instante, write_generation, dados)
+        self._stats_cache: Optional[Tuple[float, int, Dict[str, Any]]] = None
+        self._stats_lock = threading.Lock()
     
     # ==================== PACIENTES ====================
     
@@ -99,9 +105,9 @@ class FirestoreCRUD:
             if FirebaseConfig.MODELING_MODE == 'embedded':
                 filters = [('paciente.cpf', '==', cpf)]
             else:
-                filters = [('cpf_paciente', '==', cpf)]
+                filters = FirestoreQueries.consultas_por_paciente_referenced(cpf)
             
-            sucesso_consultas, msg_consultas, count = self.db.delete_documents_by_query('consultas', filters)
+            sucesso_consultas, msg_consultas, count = aggregates.deletar_consultas(filters)
             if count > 0:
                 logger.info(f"Deletadas {count} consultas do paciente {cpf} (CASCADE)")
             
@@ -185,9 +191,9 @@ class FirestoreCRUD:
             if FirebaseConfig.MODELING_MODE == 'embedded':
                 filters = [('medico.codigo', '==', codigo)]
             else:
-                filters = [('cod_medico', '==', codigo)]
+                filters = FirestoreQueries.consultas_por_medico_referenced(codigo)
             
-            sucesso_consultas, msg_consultas, count = self.db.delete_documents_by_query('consultas', filters)
+            sucesso_consultas, msg_consultas, count = aggregates.deletar_consultas(filters)
             if count > 0:
                 logger.info(f"Deletadas {count} consultas do médico {codigo} (CASCADE)")
             
@@ -257,9 +263,9 @@ class FirestoreCRUD:
             if FirebaseConfig.MODELING_MODE == 'embedded':
                 filters = [('clinica.codigo', '==', codigo)]
             else:
-                filters = [('cod_clinica', '==', codigo)]
+                filters = [FirestoreQueries.build_filter('clinica_id', '==', codigo)]
             
-            sucesso_consultas, msg_consultas, count = self.db.delete_documents_by_query('consultas', filters)
+            sucesso_consultas, msg_consultas, count = aggregates.deletar_consultas(filters)
             if count > 0:
                 logger.info(f"Deletadas {count} consultas da clínica {codigo} (CASCADE)")
             
@@ -315,7 +321,8 @@ class FirestoreCRUD:
                 # Modo referenced - apenas verificar se existem
                 if not self.buscar_paciente(cpf_paciente):
                     return False, f"Paciente {cpf_paciente} não encontrado", None
-                if not self.buscar_medico(cod_medico):
+                medico_data = self.buscar_medico(cod_medico)
+                if not medico_data:
                     return False, f"Médico {cod_medico} não encontrado", None
                 if not self.buscar_clinica(cod_clinica):
                     return False, f"Clínica {cod_clinica} não encontrada", None
@@ -325,8 +332,8 @@ class FirestoreCRUD:
                     None, None, None, observacoes, status
                 )
             
-            # Criar com ID automático
-            return self.db.create_document_auto_id('consultas', doc_data)
+            # Criar com ID automático, incrementando os contadores no mesmo commit
+            return aggregates.criar_consulta(doc_data, especialidade=medico_data.get('especialidade'))
         
         except Exception as e:
             logger.error(f"Erro ao criar consulta: {e}")
@@ -383,46 +390,71 @@ class FirestoreCRUD:
         return self.db.update_document('consultas', consulta_id, dados, merge=True)
     
     def deletar_consulta(self, consulta_id: str) -> Tuple[bool, str]:
-        """Deleta uma consulta"""
-        return self.db.delete_document('consultas', consulta_id)
+        """Deleta uma consulta (e decrementa os contadores agregados, na mesma transação)"""
+        return aggregates.deletar_consulta(consulta_id)
     
     # ==================== OPERAÇÕES AVANÇADAS ====================
     
     def contar_consultas_por_especialidade(self) -> Dict[str, int]:
         """
         Conta quantas consultas existem por especialidade médica.
-        Funciona apenas em modo embedded.
+        Lê os contadores agregados (um documento por especialidade), nos dois modos.
         
         Returns:
             Dict[str, int]: {especialidade: quantidade}
         """
-        if FirebaseConfig.MODELING_MODE != 'embedded':
-            logger.warning("Agregação por especialidade funciona melhor em modo embedded")
-            return {}
-        
-        consultas = self.listar_consultas()
-        contagem = {}
-        
-        for consulta in consultas:
-            especialidade = consulta.get('medico', {}).get('especialidade', 'Desconhecida')
-            contagem[especialidade] = contagem.get(especialidade, 0) + 1
+        return aggregates.contagens('especialidade')
+    
+    def contar_consultas_por(self, dimensao: str) -> Dict[str, int]:
+        """
+        Conta consultas por 'especialidade', 'medico', 'clinica' ou 'dia'
+        a partir dos contadores agregados.
         
-        return contagem
+        Returns:
+            Dict[str, int]: {chave: quantidade}
+        """
+        return aggregates.contagens(dimensao)
     
-    def estatisticas_gerais(self) -> Dict[str, Any]:
+    def estatisticas_gerais(self, usar_cache: bool = True) -> Dict[str, Any]:
         """
         Retorna estatísticas gerais do sistema.
         
+        Cada contador é uma agregação count no servidor (um RPC pequeno por coleção).
+        O resultado fica em cache por FirebaseConfig.STATS_TTL segundos, ou até a
+        próxima escrita feita por este processo.
+        
+        Args:
+            usar_cache: Se False, ignora o cache e recalcula
+        
         Returns:
             Dict com contadores de cada coleção
-        """
-        return {
-            'total_pacientes': self.db.count_documents('pacientes'),
-            'total_medicos': self.db.count_documents('medicos'),
-            'total_clinicas': self.db.count_documents('clinicas'),
-            'total_consultas': self.db.count_documents('consultas'),
-            'modo_modelagem': FirebaseConfig.MODELING_MODE
-        }
+        
+        Raises:
+            Exception: erros do Firestore são propagados (e nada vai para o cache),
+                       para que uma falha não apareça como zero
+        """
+        with self._stats_lock:
+            agora = time.monotonic()
+            if usar_cache and self._stats_cache is not None:
+                instante, geracao, dados = self._stats_cache
+                if agora - instante < FirebaseConfig.STATS_TTL and geracao == self.db.write_generation:
+                    return dict(dados)
+            
+            geracao = self.db.write_generation
+            dados = {
+                'total_pacientes': self.db.aggregate('pacientes')['count'],
+                'total_medicos': self.db.aggregate('medicos')['count'],
+                'total_clinicas': self.db.aggregate('clinicas')['count'],
+                'total_consultas': self.db.aggregate('consultas')['count'],
+                'modo_modelagem': FirebaseConfig.MODELING_MODE
+            }
+            self._stats_cache = (agora, geracao, dados)
+            return dict(dados)
+    
+    def invalidar_estatisticas(self):
+        """Descarta o cache de estatisticas_gerais"""
+        with self._stats_lock:
+            self._stats_cache = None
 
 
 # Instância global
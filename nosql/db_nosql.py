@@ -4,9 +4,14 @@ Sistema de Consultório Médico - NoSQL Integration
 """
 
 import logging
-from typing import Optional, Dict, List, Any
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Optional, Dict, List, Any, Iterable, Callable
 import firebase_admin
 from firebase_admin import credentials, firestore
+from google.api_core import exceptions as google_exceptions
 from google.cloud.firestore_v1.base_query import FieldFilter
 from nosql.config_nosql import FirebaseConfig
 
@@ -19,6 +24,22 @@ if not logger.handlers:
     logger.addHandler(handler)
 logger.setLevel(logging.INFO if not FirebaseConfig.DEBUG else logging.DEBUG)
 
+# Erros transitórios (contenção, sobrecarga, timeout) em que o commit é refeito com backoff
+RETRYABLE_ERRORS = (
+    google_exceptions.Aborted,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.ResourceExhausted,
+    google_exceptions.InternalServerError,
+)
+
+# Erros em que o servidor pode já ter aplicado o commit (o prazo expira depois da gravação):
+# um create refeito depois deles pode falhar com AlreadyExists mesmo tendo dado certo
+AMBIGUOUS_ERRORS = (google_exceptions.DeadlineExceeded,)
+
+# Tolerância (s) entre o relógio local e o do servidor ao conferir um create ambíguo
+CLOCK_SKEW_SECONDS = 5.0
+
 
 class FirebaseDatabase:
     """
@@ -44,7 +65,14 @@ class FirebaseDatabase:
                 'medicos': FirebaseConfig.COLLECTION_MEDICOS,
                 'clinicas': FirebaseConfig.COLLECTION_CLINICAS,
                 'consultas': FirebaseConfig.COLLECTION_CONSULTAS,
+                'agregados': FirebaseConfig.COLLECTION_AGREGADOS,
             }
+            # incrementado a cada escrita que cria/remove documentos; caches de
+            # contagem comparam com ele para se invalidar após escritas locais
+            self.write_generation = 0
+            # RPCs feitos ao Firestore, por operação (ver rpc_stats)
+            self._rpc_lock = threading.Lock()
+            self._rpc = {'chamadas': {}, 'erros': {}, 'documentos_lidos': 0, 'retentativas': 0}
             FirebaseDatabase._initialized = True
     
     def connect(self) -> bool:
@@ -65,14 +93,20 @@ class FirebaseDatabase:
                 logger.error(f"Configuração inválida: {message}")
                 return False
             
-            # Inicializar Firebase Admin SDK
-            if not firebase_admin._apps:
-                cred = credentials.Certificate(FirebaseConfig.FIREBASE_CREDENTIALS_PATH)
-                firebase_admin.initialize_app(cred)
-                logger.info("Firebase Admin SDK inicializado")
-            
-            # Obter cliente Firestore
-            self.db = firestore.client()
+            if FirebaseConfig.FIRESTORE_EMULATOR_HOST:
+                # O cliente detecta FIRESTORE_EMULATOR_HOST e usa credenciais anônimas
+                from google.cloud import firestore as gcloud_firestore
+                self.db = gcloud_firestore.Client(project=FirebaseConfig.FIREBASE_PROJECT_ID or 'demo-consultorio')
+                logger.info(f"Usando emulador do Firestore em {FirebaseConfig.FIRESTORE_EMULATOR_HOST}")
+            else:
+                # Inicializar Firebase Admin SDK
+                if not firebase_admin._apps:
+                    cred = credentials.Certificate(FirebaseConfig.FIREBASE_CREDENTIALS_PATH)
+                    firebase_admin.initialize_app(cred)
+                    logger.info("Firebase Admin SDK inicializado")
+                
+                # Obter cliente Firestore
+                self.db = firestore.client()
             project_id = self.db.project
             logger.info(f"Conectado ao Firestore - Projeto: {project_id}")
             logger.info(f"Modo de modelagem: {FirebaseConfig.MODELING_MODE}")
@@ -91,6 +125,23 @@ class FirebaseDatabase:
         """Verifica se está conectado ao Firestore"""
         return self.db is not None
     
+    def _contar_rpc(self, operacao: str, erro: bool = False, documentos: int = 0):
+        with self._rpc_lock:
+            contadores = self._rpc['erros' if erro else 'chamadas']
+            contadores[operacao] = contadores.get(operacao, 0) + 1
+            self._rpc['documentos_lidos'] += documentos
+
+    def rpc_stats(self) -> Dict[str, Any]:
+        """
+        Contadores acumulados de RPCs: {'chamadas': {operação: n}, 'erros': {operação: n},
+        'documentos_lidos': n, 'retentativas': n}; operações: get, set, add, update,
+        delete, query, aggregate e commit (uma por tentativa).
+        """
+        with self._rpc_lock:
+            return {'chamadas': dict(self._rpc['chamadas']), 'erros': dict(self._rpc['erros']),
+                    'documentos_lidos': self._rpc['documentos_lidos'],
+                    'retentativas': self._rpc['retentativas']}
+
     def get_collection(self, collection_name: str):
         """
         Obtém referência para uma coleção.
@@ -123,10 +174,13 @@ class FirebaseDatabase:
         """
         try:
             collection = self.get_collection(collection_name)
+            self._contar_rpc('set')
             collection.document(document_id).set(data)
+            self.write_generation += 1
             logger.info(f"Documento criado: {collection_name}/{document_id}")
             return True, f"Documento criado com sucesso: {document_id}"
         except Exception as e:
+            self._contar_rpc('set', erro=True)
             logger.error(f"Erro ao criar documento: {e}")
             return False, str(e)
     
@@ -143,11 +197,14 @@ class FirebaseDatabase:
         """
         try:
             collection = self.get_collection(collection_name)
+            self._contar_rpc('add')
             doc_ref = collection.add(data)
             doc_id = doc_ref[1].id
+            self.write_generation += 1
             logger.info(f"Documento criado com ID automático: {collection_name}/{doc_id}")
             return True, f"Documento criado com sucesso", doc_id
         except Exception as e:
+            self._contar_rpc('add', erro=True)
             logger.error(f"Erro ao criar documento: {e}")
             return False, str(e), None
     
@@ -165,6 +222,7 @@ class FirebaseDatabase:
             Dict ou None: Dados do documento ou None se não encontrado
         """
         try:
+            self._contar_rpc('get')
             doc = self.get_collection(collection_name).document(document_id).get()
             if doc.exists:
                 data = doc.to_dict()
@@ -172,6 +230,7 @@ class FirebaseDatabase:
                 return data
             return None
         except Exception as e:
+            self._contar_rpc('get', erro=True)
             logger.error(f"Erro ao buscar documento: {e}")
             return None
     
@@ -197,10 +256,12 @@ class FirebaseDatabase:
                 data = doc.to_dict()
                 data['_id'] = doc.id
                 results.append(data)
+            self._contar_rpc('query', documentos=len(results))
             
             logger.debug(f"Buscados {len(results)} documentos de {collection_name}")
             return results
         except Exception as e:
+            self._contar_rpc('query', erro=True)
             logger.error(f"Erro ao buscar documentos: {e}")
             return []
     
@@ -240,13 +301,41 @@ class FirebaseDatabase:
                 data = doc.to_dict()
                 data['_id'] = doc.id
                 results.append(data)
+            self._contar_rpc('query', documentos=len(results))
             
             logger.debug(f"Query retornou {len(results)} documentos")
             return results
         except Exception as e:
+            self._contar_rpc('query', erro=True)
             logger.error(f"Erro ao fazer query: {e}")
             return []
     
+    def query_ids(self, collection_name: str, filters: List[tuple]) -> List[str]:
+        """
+        Busca apenas os IDs dos documentos que atendem aos filtros (projeção vazia,
+        sem transferir os campos).
+        
+        Args:
+            collection_name: Nome da coleção
+            filters: Lista de tuplas (campo, operador, valor)
+        
+        Returns:
+            List[str]: IDs dos documentos
+        
+        Raises:
+            Exception: erros do Firestore são propagados, para não confundir falha com vazio
+        """
+        query = self.get_collection(collection_name)
+        for field, operator, value in filters:
+            query = query.where(filter=FieldFilter(field, operator, value))
+        try:
+            ids = [doc.id for doc in query.select([]).stream()]
+        except Exception:
+            self._contar_rpc('query', erro=True)
+            raise
+        self._contar_rpc('query', documentos=len(ids))
+        return ids
+    
     # ==================== OPERAÇÕES UPDATE ====================
     
     def update_document(self, collection_name: str, document_id: str, 
@@ -265,6 +354,8 @@ class FirebaseDatabase:
         """
         try:
             doc_ref = self.get_collection(collection_name).document(document_id)
+            operacao = 'update' if merge else 'set'
+            self._contar_rpc(operacao)
             if merge:
                 doc_ref.update(data)
             else:
@@ -272,6 +363,7 @@ class FirebaseDatabase:
             logger.info(f"Documento atualizado: {collection_name}/{document_id}")
             return True, "Documento atualizado com sucesso"
         except Exception as e:
+            self._contar_rpc('update' if merge else 'set', erro=True)
             logger.error(f"Erro ao atualizar documento: {e}")
             return False, str(e)
     
@@ -289,10 +381,13 @@ class FirebaseDatabase:
             tuple[bool, str]: (sucesso, mensagem)
         """
         try:
+            self._contar_rpc('delete')
             self.get_collection(collection_name).document(document_id).delete()
+            self.write_generation += 1
             logger.info(f"Documento deletado: {collection_name}/{document_id}")
             return True, "Documento deletado com sucesso"
         except Exception as e:
+            self._contar_rpc('delete', erro=True)
             logger.error(f"Erro ao deletar documento: {e}")
             return False, str(e)
     
@@ -300,6 +395,8 @@ class FirebaseDatabase:
         """
         Deleta documentos que atendem aos filtros.
         
+        Busca apenas os IDs (sem os campos) e deleta em lote via delete_documents.
+        
         Args:
             collection_name: Nome da coleção
             filters: Lista de tuplas (campo, operador, valor)
@@ -308,37 +405,303 @@ class FirebaseDatabase:
             tuple[bool, str, int]: (sucesso, mensagem, quantidade deletada)
         """
         try:
-            docs = self.query_documents(collection_name, filters)
-            count = 0
-            for doc in docs:
-                self.delete_document(collection_name, doc['_id'])
-                count += 1
+            ids = self.query_ids(collection_name, filters)
+            resultados = self.delete_documents(collection_name, ids)
+            count = sum(1 for r in resultados if r['sucesso'])
+            falhas = len(resultados) - count
             
             logger.info(f"{count} documentos deletados de {collection_name}")
+            if falhas:
+                return False, f"{count} documentos deletados, {falhas} falharam", count
             return True, f"{count} documentos deletados", count
         except Exception as e:
             logger.error(f"Erro ao deletar documentos: {e}")
             return False, str(e), 0
     
+    # ==================== OPERAÇÕES EM LOTE ====================
+    
+    def create_documents(self, collection_name: str, documents: Iterable[tuple[Optional[str], Dict[str, Any]]],
+                         batch_size: Optional[int] = None, max_in_flight: Optional[int] = None,
+                         on_batch: Optional[Callable[[List[Dict[str, Any]]], None]] = None) -> List[Dict[str, Any]]:
+        """
+        Cria vários documentos em lotes (WriteBatch), falhando os que já existem.
+        Um lote refeito após um DeadlineExceeded que o servidor já tinha aplicado
+        conta como sucesso (ver _criados_desde), não como AlreadyExists.
+        
+        Args:
+            collection_name: Nome da coleção
+            documents: Pares (document_id, dados); document_id None gera ID automático
+            batch_size: Operações por commit (padrão: FirebaseConfig.BATCH_SIZE, máx. 500)
+            max_in_flight: Commits simultâneos (padrão: FirebaseConfig.MAX_IN_FLIGHT)
+            on_batch: Chamado com os resultados de cada commit assim que ele termina.
+                      Quando informado, os resultados não são acumulados (retorna [])
+        
+        Returns:
+            List[Dict]: Um resultado por documento, na ordem de entrada:
+                        {'id': str, 'sucesso': bool, 'mensagem': str}
+        """
+        return self._write_batches(collection_name, documents,
+                                   lambda batch, ref, data: batch.create(ref, data),
+                                   batch_size, max_in_flight, 'criados', on_batch)
+    
+    def upsert_documents(self, collection_name: str, documents: Iterable[tuple[Optional[str], Dict[str, Any]]],
+                         merge: bool = False, batch_size: Optional[int] = None,
+                         max_in_flight: Optional[int] = None,
+                         on_batch: Optional[Callable[[List[Dict[str, Any]]], None]] = None) -> List[Dict[str, Any]]:
+        """
+        Cria ou sobrescreve vários documentos em lotes (WriteBatch.set).
+        
+        Args:
+            collection_name: Nome da coleção
+            documents: Pares (document_id, dados); document_id None gera ID automático
+            merge: Se True, faz merge com os dados existentes. Se False, substitui.
+            batch_size: Operações por commit (padrão: FirebaseConfig.BATCH_SIZE, máx. 500)
+            max_in_flight: Commits simultâneos (padrão: FirebaseConfig.MAX_IN_FLIGHT)
+            on_batch: Callback por commit (ver create_documents)
+        
+        Returns:
+            List[Dict]: Um resultado por documento (ver create_documents)
+        """
+        return self._write_batches(collection_name, documents,
+                                   lambda batch, ref, data: batch.set(ref, data, merge=merge),
+                                   batch_size, max_in_flight, 'gravados', on_batch)
+    
+    def delete_documents(self, collection_name: str, document_ids: Iterable[str],
+                         batch_size: Optional[int] = None, max_in_flight: Optional[int] = None,
+                         on_batch: Optional[Callable[[List[Dict[str, Any]]], None]] = None) -> List[Dict[str, Any]]:
+        """
+        Deleta vários documentos em lotes (WriteBatch.delete).
+        
+        Args:
+            collection_name: Nome da coleção
+            document_ids: IDs dos documentos
+            batch_size: Operações por commit (padrão: FirebaseConfig.BATCH_SIZE, máx. 500)
+            max_in_flight: Commits simultâneos (padrão: FirebaseConfig.MAX_IN_FLIGHT)
+            on_batch: Callback por commit (ver create_documents)
+        
+        Returns:
+            List[Dict]: Um resultado por documento (ver create_documents)
+        """
+        return self._write_batches(collection_name, ((doc_id, None) for doc_id in document_ids),
+                                   lambda batch, ref, data: batch.delete(ref),
+                                   batch_size, max_in_flight, 'deletados', on_batch)
+    
+    def _write_batches(self, collection_name: str, documents: Iterable[tuple[Optional[str], Any]],
+                       apply: Callable, batch_size: Optional[int], max_in_flight: Optional[int],
+                       verbo: str, on_batch: Optional[Callable] = None) -> List[Dict[str, Any]]:
+        """
+        Agrupa as operações em commits de até ``batch_size`` e os executa em paralelo,
+        com no máximo ``max_in_flight`` commits em andamento (a entrada é consumida aos
+        poucos, então um gerador grande não é carregado inteiro em memória).
+        
+        ``on_batch`` roda na thread chamadora, então pode atualizar estado sem lock.
+        """
+        batch_size = max(1, min(batch_size or FirebaseConfig.BATCH_SIZE, 500))
+        max_in_flight = max(1, max_in_flight or FirebaseConfig.MAX_IN_FLIGHT)
+        collection = self.get_collection(collection_name)
+        
+        resultados: Dict[int, List[Dict[str, Any]]] = {}
+        contagem = {'commits': 0, 'ok': 0, 'total': 0}
+        
+        def concluir(indice, lote_resultados):
+            contagem['commits'] += 1
+            contagem['total'] += len(lote_resultados)
+            contagem['ok'] += sum(1 for r in lote_resultados if r['sucesso'])
+            if on_batch is not None:
+                on_batch(lote_resultados)
+            else:
+                resultados[indice] = lote_resultados
+        
+        def lotes():
+            lote = []
+            for doc_id, data in documents:
+                ref = collection.document(doc_id) if doc_id else collection.document()
+                lote.append((ref, data))
+                if len(lote) >= batch_size:
+                    yield lote
+                    lote = []
+            if lote:
+                yield lote
+        
+        with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+            pendentes = {}
+            for indice, lote in enumerate(lotes()):
+                if len(pendentes) >= max_in_flight:
+                    concluidos, _ = wait(pendentes, return_when=FIRST_COMPLETED)
+                    for futuro in concluidos:
+                        concluir(pendentes.pop(futuro), futuro.result())
+                pendentes[executor.submit(self._commit_batch, lote, apply)] = indice
+            for futuro, indice in pendentes.items():
+                concluir(indice, futuro.result())
+        
+        logger.info(f"{contagem['ok']}/{contagem['total']} documentos {verbo} em {collection_name} "
+                    f"({contagem['commits']} commits)")
+        return [r for indice in sorted(resultados) for r in resultados[indice]]
+    
+    def _commit_batch(self, lote: List[tuple], apply: Callable,
+                      incerto_desde: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        Faz o commit de um lote, refazendo com backoff exponencial (com jitter) em erros
+        transitórios. Commits de lote são atômicos: se o lote falhar por outro motivo
+        (ex.: documento já existente num create), cada documento é refeito sozinho
+        para que o resultado aponte exatamente quais falharam.
+        
+        ``incerto_desde``: instante (time.time()) da primeira tentativa que pode ter sido
+        aplicada sem resposta (ver AMBIGUOUS_ERRORS); repassado aos documentos refeitos.
+        """
+        estado = {'incerto_desde': incerto_desde}
+        try:
+            self._commit_with_retry(lote, apply, estado)
+            self.write_generation += 1
+            return [{'id': ref.id, 'sucesso': True, 'mensagem': 'OK'} for ref, _ in lote]
+        except Exception as e:
+            if len(lote) == 1:
+                ref = lote[0][0]
+                logger.error(f"Erro ao gravar documento {ref.id}: {e}")
+                return [{'id': ref.id, 'sucesso': False, 'mensagem': str(e)}]
+            logger.warning(f"Lote de {len(lote)} documentos falhou ({e}); refazendo individualmente")
+            resultados = []
+            for item in lote:
+                resultados.extend(self._commit_batch([item], apply, estado['incerto_desde']))
+            return resultados
+    
+    def _commit_with_retry(self, lote: List[tuple], apply: Callable, estado: Dict[str, Any]):
+        tentativa = 0
+        while True:
+            batch = self.db.batch()
+            for ref, data in lote:
+                apply(batch, ref, data)
+            self._contar_rpc('commit')
+            inicio = time.time()
+            try:
+                batch.commit()
+                return
+            except google_exceptions.AlreadyExists:
+                self._contar_rpc('commit', erro=True)
+                # depois de uma tentativa ambígua, AlreadyExists pode ser o nosso próprio create
+                if estado['incerto_desde'] is not None and self._criados_desde(lote, estado['incerto_desde']):
+                    logger.info(f"Commit de {len(lote)} documentos já aplicado por uma tentativa anterior")
+                    return
+                raise
+            except RETRYABLE_ERRORS as e:
+                self._contar_rpc('commit', erro=True)
+                if isinstance(e, AMBIGUOUS_ERRORS) and estado['incerto_desde'] is None:
+                    estado['incerto_desde'] = inicio
+                tentativa += 1
+                if tentativa > FirebaseConfig.MAX_RETRIES:
+                    raise
+                with self._rpc_lock:
+                    self._rpc['retentativas'] += 1
+                espera = min(0.2 * 2 ** (tentativa - 1), 10.0) * random.uniform(0.5, 1.0)
+                logger.warning(f"Commit de {len(lote)} documentos falhou ({type(e).__name__}); "
+                               f"tentativa {tentativa}/{FirebaseConfig.MAX_RETRIES} em {espera:.2f}s")
+                time.sleep(espera)
+    
+    def _criados_desde(self, lote: List[tuple], desde: float) -> bool:
+        """
+        True se todos os documentos do lote existem e foram criados num mesmo commit
+        (create_time igual, pois o lote é atômico) a partir de ``desde``: ou seja, por
+        uma tentativa anterior que expirou depois de aplicada, e não antes dela.
+        """
+        try:
+            self._contar_rpc('get')
+            snapshots = list(self.db.get_all([ref for ref, _ in lote]))
+        except Exception as e:
+            self._contar_rpc('get', erro=True)
+            logger.warning(f"Não foi possível conferir o commit ambíguo: {e}")
+            return False
+        if len(snapshots) != len(lote) or not all(s.exists for s in snapshots):
+            return False
+        criacoes = {s.create_time for s in snapshots}
+        if len(criacoes) != 1:
+            return False
+        return criacoes.pop().timestamp() >= desde - CLOCK_SKEW_SECONDS
+    
     # ==================== UTILIDADES ====================
     
     def collection_exists(self, collection_name: str) -> bool:
         """Verifica se uma coleção existe (tem documentos)"""
         try:
+            self._contar_rpc('query')
             docs = self.get_collection(collection_name).limit(1).stream()
             return len(list(docs)) > 0
         except Exception:
+            self._contar_rpc('query', erro=True)
             return False
     
-    def count_documents(self, collection_name: str) -> int:
-        """Conta o número de documentos em uma coleção"""
+    def aggregate(self, collection_name: str, filters: Optional[List[tuple]] = None,
+                  sum_fields: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Conta documentos e soma campos num único RPC de agregação (count/sum),
+        calculado no servidor sem transferir os documentos.
+        
+        Clientes sem a API de agregação (SDK antigo ou um substituto em memória) caem
+        num fallback que percorre a consulta projetando só os campos somados.
+        
+        Args:
+            collection_name: Nome da coleção
+            filters: Lista de tuplas (campo, operador, valor) (opcional)
+            sum_fields: Campos numéricos a somar (opcional)
+        
+        Returns:
+            Dict: {'count': int, <campo>: soma, ...}
+        
+        Raises:
+            Exception: erros do Firestore são propagados
+        """
+        query = self.get_collection(collection_name)
+        for field, operator, value in filters or []:
+            query = query.where(filter=FieldFilter(field, operator, value))
+        sum_fields = list(sum_fields or [])
+        
+        try:
+            agregacao = query.count(alias='count')
+            for i, field in enumerate(sum_fields):
+                agregacao = agregacao.sum(field, alias=f'sum_{i}')
+            self._contar_rpc('aggregate')
+            valores = {r.alias: r.value for linha in agregacao.get() for r in linha}
+            resultado = {'count': int(valores.get('count') or 0)}
+            for i, field in enumerate(sum_fields):
+                resultado[field] = valores.get(f'sum_{i}') or 0
+            return resultado
+        except (AttributeError, NotImplementedError) as e:
+            logger.debug(f"Agregação indisponível em {collection_name} ({e}); usando streaming")
+        except Exception:
+            self._contar_rpc('aggregate', erro=True)
+            raise
+        
+        resultado = {'count': 0, **{field: 0 for field in sum_fields}}
+        self._contar_rpc('query')
+        for doc in query.select(sum_fields).stream():
+            resultado['count'] += 1
+            if sum_fields:
+                data = doc.to_dict() or {}
+                for field in sum_fields:
+                    valor = data
+                    for parte in field.split('.'):
+                        valor = valor.get(parte) if isinstance(valor, dict) else None
+                    if isinstance(valor, (int, float)):
+                        resultado[field] += valor
+        with self._rpc_lock:
+            self._rpc['documentos_lidos'] += resultado['count']
+        return resultado
+    
+    def count_documents(self, collection_name: str, filters: Optional[List[tuple]] = None) -> int:
+        """Conta o número de documentos em uma coleção (agregação count no servidor)"""
         try:
-            docs = self.get_collection(collection_name).stream()
-            return len(list(docs))
+            return self.aggregate(collection_name, filters)['count']
         except Exception as e:
             logger.error(f"Erro ao contar documentos: {e}")
             return 0
     
+    def sum_documents(self, collection_name: str, field: str, filters: Optional[List[tuple]] = None) -> float:
+        """Soma um campo numérico dos documentos (agregação sum no servidor)"""
+        try:
+            return self.aggregate(collection_name, filters, [field])[field]
+        except Exception as e:
+            logger.error(f"Erro ao somar {field} em {collection_name}: {e}")
+            return 0
+    
     def close(self):
         """Fecha a conexão (Firebase Admin SDK não precisa de close explícito)"""
         logger.info("Conexão Firestore encerrada")
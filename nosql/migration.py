@@ -4,53 +4,316 @@ Sistema de Consultório Médico
 """
 
 import sys
+import time
 import logging
-from typing import Tuple
+from datetime import date, timedelta
+from typing import Tuple, Dict, Any, Callable, Optional, Iterable, List
 from db import db as mysql_db
 from nosql.db_nosql import firebase_db
-from nosql.crud_operations import crud
+from nosql.models_nosql import FirestoreModels
+from nosql.config_nosql import FirebaseConfig
+from nosql.aggregations import aggregates
+from nosql.checkpoint import MigrationCheckpoint, hash_linha, chave_consulta, crc_chave, formatar_data_hora
 
 logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
 logger = logging.getLogger(__name__)
 
+# Linhas buscadas por ida ao MySQL durante o streaming
+STREAM_BATCH_SIZE = 1000
 
-class MySQLToFirestoreMigration:
-    """Classe para migrar dados do MySQL para Firestore"""
-    
-    # Variável de classe para compartilhar progresso entre instâncias
-    _shared_progress = {
+# Intervalo mínimo entre gravações do checkpoint durante a etapa de consultas (s)
+CHECKPOINT_SAVE_INTERVAL = 30.0
+
+
+def _progresso_vazio():
+    etapa = {'total': 0, 'migrados': 0, 'erros': 0, 'ignorados': 0, 'removidos': 0,
+             'elapsed': 0.0, 'throughput': 0.0}
+    return {
         'status': 'idle',
         'current_step': '',
-        'pacientes': {'total': 0, 'migrados': 0, 'erros': 0},
-        'medicos': {'total': 0, 'migrados': 0, 'erros': 0},
-        'clinicas': {'total': 0, 'migrados': 0, 'erros': 0},
-        'consultas': {'total': 0, 'migrados': 0, 'erros': 0}
+        'incremental': False,
+        'started_at': None,
+        'elapsed': 0.0,
+        'throughput': 0.0,
+        'pacientes': dict(etapa),
+        'medicos': dict(etapa),
+        'clinicas': dict(etapa),
+        'consultas': dict(etapa)
     }
+
+
+class MySQLToFirestoreMigration:
+    """
+    Classe para migrar dados do MySQL para Firestore.
+    
+    Cada etapa lê a tabela em streaming do MySQL, converte as linhas em documentos
+    e grava em lotes concorrentes (firebase_db.upsert_documents). Pacientes, médicos
+    e clínicas migrados ficam num lookup em memória, usado para montar as consultas
+    (embedded) ou validar as referências (referenced) sem nenhuma leitura no Firestore.
+    
+    Consultas usam IDs determinísticos derivados da PK composta, então reexecutar não
+    duplica documentos. Toda execução atualiza o checkpoint (nosql/checkpoint.py); no
+    modo incremental ele é usado para enviar só as linhas novas/alteradas e remover do
+    Firestore as que sumiram do MySQL.
     
-    def __init__(self):
+    Limitação: no modo embedded, alterar um paciente/médico/clínica não reenvia as
+    consultas que embutem os dados antigos; rode uma migração completa nesse caso.
+    """
+    
+    # Variável de classe para compartilhar progresso entre instâncias
+    # (por etapa: total, migrados, erros, elapsed em s, throughput em docs/s)
+    _shared_progress = _progresso_vazio()
+    
+    def __init__(self, incremental: bool = False, checkpoint_path: Optional[str] = None):
+        self.incremental = incremental
+        self.checkpoint = MigrationCheckpoint(checkpoint_path or FirebaseConfig.MIGRATION_CHECKPOINT_PATH)
         self.stats = {
             'pacientes': {'migrados': 0, 'erros': 0},
             'medicos': {'migrados': 0, 'erros': 0},
             'clinicas': {'migrados': 0, 'erros': 0},
             'consultas': {'migrados': 0, 'erros': 0}
         }
+        # document_id -> documento Firestore, preenchido durante a migração de cada tabela
+        self._lookup: Dict[str, Dict[str, Dict[str, Any]]] = {'pacientes': {}, 'medicos': {}, 'clinicas': {}}
+        self._lookup_carregado = set()
     
     @classmethod
     def get_progress(cls):
         """Retorna o progresso atual da migração"""
-        return cls._shared_progress.copy()
+        progresso = cls._shared_progress.copy()
+        if progresso.get('status') == 'running' and progresso.get('started_at'):
+            progresso['elapsed'] = time.time() - progresso['started_at']
+        return progresso
     
     @classmethod
     def reset_progress(cls):
         """Reseta o progresso da migração"""
-        cls._shared_progress = {
-            'status': 'idle',
-            'current_step': '',
-            'pacientes': {'total': 0, 'migrados': 0, 'erros': 0},
-            'medicos': {'total': 0, 'migrados': 0, 'erros': 0},
-            'clinicas': {'total': 0, 'migrados': 0, 'erros': 0},
-            'consultas': {'total': 0, 'migrados': 0, 'erros': 0}
+        cls._shared_progress = _progresso_vazio()
+    
+    # ==================== CONVERSÃO DE LINHAS ====================
+    
+    @staticmethod
+    def _paciente_doc(pac: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+        cpf = str(pac.get('CpfPaciente'))
+        return cpf, FirestoreModels.paciente_to_firestore(
+            cpf, pac.get('NomePac', ''), str(pac.get('DataNascimento', '')),
+            pac.get('Genero', 'M'), pac.get('Telefone', ''), pac.get('Email', '')
+        )
+    
+    @staticmethod
+    def _medico_doc(med: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+        codigo = str(med.get('CodMed'))
+        return codigo, FirestoreModels.medico_to_firestore(
+            codigo, med.get('NomeMed', ''), med.get('Genero', 'M'),
+            med.get('Telefone', ''), med.get('Email', ''), med.get('Especialidade', '')
+        )
+    
+    @staticmethod
+    def _clinica_doc(cli: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+        codigo = str(cli.get('CodCli'))
+        return codigo, FirestoreModels.clinica_to_firestore(
+            codigo, cli.get('NomeCli', ''), cli.get('Endereco', ''),
+            cli.get('Telefone', ''), cli.get('Email', '')
+        )
+    
+    def _consulta_doc(self, cons: Dict[str, Any]) -> Tuple[Optional[str], Dict[str, Any]]:
+        cpf = str(cons.get('CpfPaciente'))
+        cod_med = str(cons.get('CodMed'))
+        cod_cli = str(cons.get('CodCli'))
+        
+        paciente = self._lookup['pacientes'].get(cpf)
+        medico = self._lookup['medicos'].get(cod_med)
+        clinica = self._lookup['clinicas'].get(cod_cli)
+        if paciente is None:
+            raise ValueError(f"Paciente {cpf} não encontrado")
+        if medico is None:
+            raise ValueError(f"Médico {cod_med} não encontrado")
+        if clinica is None:
+            raise ValueError(f"Clínica {cod_cli} não encontrada")
+        
+        data_hora = cons.get('Data_Hora', '')
+        doc_id = FirestoreModels.consulta_document_id(cod_cli, cod_med, cpf, data_hora)
+        return doc_id, FirestoreModels.get_consulta_model(
+            cpf, cod_med, cod_cli, formatar_data_hora(data_hora),
+            paciente, medico, clinica,
+            observacoes="Migrado do MySQL", status="realizada"
+        )
+    
+    # ==================== PIPELINE ====================
+    
+    def _migrar(self, tipo: str, rotulo: str, linhas: Iterable[Dict[str, Any]], total: int,
+                converter: Callable[[Dict[str, Any]], Tuple[Optional[str], Dict[str, Any]]],
+                filtro: Optional[Callable[[str, Dict[str, Any]], bool]] = None,
+                ao_gravar: Optional[Callable[[List[Dict[str, Any]]], None]] = None) -> Tuple[bool, int, int, bool]:
+        """
+        Converte as ``linhas`` (lidas em streaming) e grava em lotes concorrentes.
+        O progresso (migrados, erros, ignorados, elapsed, throughput) é atualizado a cada commit.
+        
+        Args:
+            filtro: Decide, por (document_id, linha), se a linha é enviada; as não enviadas
+                    contam como ignoradas (o lookup é preenchido de qualquer forma)
+            ao_gravar: Recebe os resultados de cada commit (para o checkpoint)
+        
+        Returns:
+            Tuple[bool, int, int, bool]: (sucesso, migrados, erros, leitura completa)
+        """
+        progresso = MySQLToFirestoreMigration._shared_progress
+        etapa = progresso[tipo]
+        etapa['total'] = total
+        logger.info(f"Encontrados {total} {rotulo} no MySQL")
+        
+        lookup = self._lookup.get(tipo)
+        estado = {'migrados': 0, 'erros': 0, 'ignorados': 0}
+        inicio = time.perf_counter()
+        
+        def atualizar():
+            decorrido = time.perf_counter() - inicio
+            etapa['migrados'] = estado['migrados']
+            etapa['erros'] = estado['erros']
+            etapa['ignorados'] = estado['ignorados']
+            etapa['elapsed'] = decorrido
+            etapa['throughput'] = estado['migrados'] / decorrido if decorrido else 0.0
+            if progresso.get('started_at'):
+                total_decorrido = time.time() - progresso['started_at']
+                migrados = sum(progresso[t]['migrados'] for t in ('pacientes', 'medicos', 'clinicas', 'consultas'))
+                progresso['elapsed'] = total_decorrido
+                progresso['throughput'] = migrados / total_decorrido if total_decorrido else 0.0
+        
+        def documentos():
+            for linha in linhas:
+                try:
+                    doc_id, data = converter(linha)
+                except Exception as e:
+                    estado['erros'] += 1
+                    logger.error(f"✗ Erro ao converter {rotulo[:-1]}: {e}")
+                    continue
+                if lookup is not None:
+                    lookup[doc_id] = data
+                if filtro is not None and not filtro(doc_id, linha):
+                    estado['ignorados'] += 1
+                    continue
+                yield doc_id, data
+        
+        def ao_concluir_lote(resultados):
+            for r in resultados:
+                if r['sucesso']:
+                    estado['migrados'] += 1
+                else:
+                    estado['erros'] += 1
+                    logger.error(f"✗ Erro ao migrar {rotulo[:-1]} {r['id']}: {r['mensagem']}")
+            if ao_gravar is not None:
+                ao_gravar(resultados)
+            atualizar()
+        
+        completo = False
+        try:
+            firebase_db.upsert_documents(tipo, documentos(), on_batch=ao_concluir_lote)
+            completo = True
+            if lookup is not None:
+                self._lookup_carregado.add(tipo)
+        except Exception as e:
+            # leitura ou escrita interrompida no meio: o restante não foi migrado
+            estado['erros'] += 1
+            logger.error(f"✗ Erro ao migrar {rotulo}: {e}")
+        atualizar()
+        
+        self.stats[tipo]['migrados'] = estado['migrados']
+        self.stats[tipo]['erros'] = estado['erros']
+        
+        ignorados = f", {estado['ignorados']} sem alteração" if estado['ignorados'] else ""
+        logger.info(f"{rotulo.capitalize()}: {estado['migrados']} migrados, {estado['erros']} erros{ignorados} "
+                    f"({etapa['throughput']:.0f} docs/s em {etapa['elapsed']:.1f}s)")
+        return estado['erros'] == 0, estado['migrados'], estado['erros'], completo
+    
+    def _remover(self, tipo: str, ids: List[str]) -> List[str]:
+        """Remove do Firestore documentos que sumiram do MySQL; devolve os IDs que falharam"""
+        if not ids:
+            return []
+        resultados = firebase_db.delete_documents(tipo, ids)
+        removidos = sum(1 for r in resultados if r['sucesso'])
+        MySQLToFirestoreMigration._shared_progress[tipo]['removidos'] += removidos
+        logger.info(f"{removidos} {tipo} removidos do Firestore (não existem mais no MySQL)")
+        return [r['id'] for r in resultados if not r['sucesso']]
+    
+    def _migrar_entidade(self, tipo: str, rotulo: str, tabela: str, total: int,
+                         converter: Callable[[Dict[str, Any]], Tuple[str, Dict[str, Any]]]) -> Tuple[bool, int, int]:
+        """
+        Migra uma tabela de entidade comparando o hash de cada linha com o checkpoint.
+        No modo completo tudo é enviado; no incremental, só linhas novas ou alteradas,
+        e IDs que não existem mais no MySQL são removidos do Firestore.
+        """
+        antigos = self.checkpoint.hashes(tipo) if self.incremental else {}
+        atuais: Dict[str, str] = {}
+        falhas = set()
+        
+        def filtro(doc_id, linha):
+            atuais[doc_id] = hash_linha(linha)
+            return antigos.get(doc_id) != atuais[doc_id]
+        
+        def ao_gravar(resultados):
+            falhas.update(r['id'] for r in resultados if not r['sucesso'])
+        
+        linhas = mysql_db.stream(f"SELECT * FROM {tabela}", batch_size=STREAM_BATCH_SIZE)
+        sucesso, migrados, erros, completo = self._migrar(tipo, rotulo, linhas, total, converter,
+                                                           filtro=filtro, ao_gravar=ao_gravar)
+        if not completo:
+            # leitura interrompida: sem a lista completa não dá para saber o que foi removido
+            return sucesso, migrados, erros
+        if total and not atuais:
+            # nada lido com a tabela não vazia apagaria tudo no Firestore: trate como falha de leitura
+            logger.error(f"✗ Nenhuma linha lida de {tabela} ({total} no MySQL); remoções canceladas")
+            erros = max(erros, 1)
+            MySQLToFirestoreMigration._shared_progress[tipo]['erros'] = erros
+            self.stats[tipo]['erros'] = erros
+            return False, migrados, erros
+        
+        nao_removidos = self._remover(tipo, [doc_id for doc_id in antigos if doc_id not in atuais])
+        
+        # falhas ficam com o hash antigo (ou sem hash) para serem reenviadas na próxima execução
+        for doc_id in falhas:
+            if doc_id in antigos:
+                atuais[doc_id] = antigos[doc_id]
+            else:
+                atuais.pop(doc_id, None)
+        for doc_id in nao_removidos:
+            atuais[doc_id] = antigos[doc_id]
+        self.checkpoint.set_hashes(tipo, atuais)
+        self._salvar_checkpoint()
+        
+        erros += len(nao_removidos)
+        self.stats[tipo]['erros'] = erros
+        return erros == 0, migrados, erros
+    
+    def _salvar_checkpoint(self):
+        try:
+            self.checkpoint.save()
+        except Exception as e:
+            logger.error(f"✗ Erro ao gravar checkpoint {self.checkpoint.path}: {e}")
+    
+    @staticmethod
+    def _contar(tabela: str) -> int:
+        contagem = mysql_db.fetch_one(f"SELECT COUNT(*) as total FROM {tabela}")
+        return contagem['total'] if contagem else 0
+    
+    def _garantir_lookups(self):
+        """
+        Carrega do MySQL os lookups de etapas que não rodaram nesta instância
+        (ex.: migrar_consultas chamado sozinho, com as entidades já migradas antes).
+        """
+        fontes = {
+            'pacientes': ("SELECT * FROM tabelapaciente", self._paciente_doc),
+            'medicos': ("SELECT * FROM tabelamedico", self._medico_doc),
+            'clinicas': ("SELECT * FROM tabelaclinica", self._clinica_doc),
         }
+        for tipo, (query, converter) in fontes.items():
+            if tipo in self._lookup_carregado:
+                continue
+            lookup = self._lookup[tipo]
+            for linha in mysql_db.stream(query, batch_size=STREAM_BATCH_SIZE):
+                doc_id, data = converter(linha)
+                lookup[doc_id] = data
+            self._lookup_carregado.add(tipo)
+            logger.info(f"Lookup de {tipo} carregado do MySQL ({len(lookup)} registros)")
     
     def migrar_pacientes(self) -> Tuple[bool, int, int]:
         """
@@ -63,195 +326,222 @@ class MySQLToFirestoreMigration:
         MySQLToFirestoreMigration._shared_progress['status'] = 'running'
         logger.info("=== Migrando Pacientes ===")
         
-        # Buscar pacientes do MySQL
-        pacientes = mysql_db.fetch_all("SELECT * FROM tabelapaciente")
-        
-        if not pacientes:
+        total = self._contar('tabelapaciente')
+        if not total:
             logger.warning("Nenhum paciente encontrado no MySQL")
             return True, 0, 0
         
-        MySQLToFirestoreMigration._shared_progress['pacientes']['total'] = len(pacientes)
-        logger.info(f"Encontrados {len(pacientes)} pacientes no MySQL")
-        
-        migrados = 0
-        erros = 0
-        
-        for pac in pacientes:
-            cpf = pac.get('CpfPaciente')
-            nome = pac.get('NomePac', '')
-            data_nasc = str(pac.get('DataNascimento', ''))
-            genero = pac.get('Genero', 'M')
-            telefone = pac.get('Telefone', '')
-            email = pac.get('Email', '')
-            
-            sucesso, msg = crud.criar_paciente(cpf, nome, data_nasc, genero, telefone, email)
-            
-            if sucesso:
-                migrados += 1
-                MySQLToFirestoreMigration._shared_progress['pacientes']['migrados'] = migrados
-                logger.debug(f"✓ Paciente {cpf} migrado")
-            else:
-                erros += 1
-                MySQLToFirestoreMigration._shared_progress['pacientes']['erros'] = erros
-                logger.error(f"✗ Erro ao migrar paciente {cpf}: {msg}")
-        
-        self.stats['pacientes']['migrados'] = migrados
-        self.stats['pacientes']['erros'] = erros
-        
-        logger.info(f"Pacientes: {migrados} migrados, {erros} erros")
-        return erros == 0, migrados, erros
+        return self._migrar_entidade('pacientes', 'pacientes', 'tabelapaciente', total, self._paciente_doc)
     
     def migrar_medicos(self) -> Tuple[bool, int, int]:
         """Migra médicos do MySQL para Firestore"""
         MySQLToFirestoreMigration._shared_progress['current_step'] = 'Migrando Médicos...'
         logger.info("=== Migrando Médicos ===")
         
-        medicos = mysql_db.fetch_all("SELECT * FROM tabelamedico")
-        
-        if not medicos:
+        total = self._contar('tabelamedico')
+        if not total:
             logger.warning("Nenhum médico encontrado no MySQL")
             return True, 0, 0
         
-        MySQLToFirestoreMigration._shared_progress['medicos']['total'] = len(medicos)
-        logger.info(f"Encontrados {len(medicos)} médicos no MySQL")
-        
-        migrados = 0
-        erros = 0
-        
-        for med in medicos:
-            codigo = med.get('CodMed')
-            nome = med.get('NomeMed', '')
-            genero = med.get('Genero', 'M')
-            telefone = med.get('Telefone', '')
-            email = med.get('Email', '')
-            especialidade = med.get('Especialidade', '')
-            
-            sucesso, msg = crud.criar_medico(codigo, nome, genero, telefone, email, especialidade)
-            
-            if sucesso:
-                migrados += 1
-                MySQLToFirestoreMigration._shared_progress['medicos']['migrados'] = migrados
-                logger.debug(f"✓ Médico {codigo} migrado")
-            else:
-                erros += 1
-                MySQLToFirestoreMigration._shared_progress['medicos']['erros'] = erros
-                logger.error(f"✗ Erro ao migrar médico {codigo}: {msg}")
-        
-        self.stats['medicos']['migrados'] = migrados
-        self.stats['medicos']['erros'] = erros
-        
-        logger.info(f"Médicos: {migrados} migrados, {erros} erros")
-        return erros == 0, migrados, erros
+        return self._migrar_entidade('medicos', 'médicos', 'tabelamedico', total, self._medico_doc)
     
     def migrar_clinicas(self) -> Tuple[bool, int, int]:
         """Migra clínicas do MySQL para Firestore"""
         MySQLToFirestoreMigration._shared_progress['current_step'] = 'Migrando Clínicas...'
         logger.info("=== Migrando Clínicas ===")
         
-        clinicas = mysql_db.fetch_all("SELECT * FROM tabelaclinica")
-        
-        if not clinicas:
+        total = self._contar('tabelaclinica')
+        if not total:
             logger.warning("Nenhuma clínica encontrada no MySQL")
             return True, 0, 0
         
-        MySQLToFirestoreMigration._shared_progress['clinicas']['total'] = len(clinicas)
-        logger.info(f"Encontradas {len(clinicas)} clínicas no MySQL")
-        
-        migrados = 0
-        erros = 0
-        
-        for cli in clinicas:
-            codigo = cli.get('CodCli')
-            nome = cli.get('NomeCli', '')
-            endereco = cli.get('Endereco', '')
-            telefone = cli.get('Telefone', '')
-            email = cli.get('Email', '')
-            
-            sucesso, msg = crud.criar_clinica(codigo, nome, endereco, telefone, email)
-            
-            if sucesso:
-                migrados += 1
-                MySQLToFirestoreMigration._shared_progress['clinicas']['migrados'] = migrados
-                logger.debug(f"✓ Clínica {codigo} migrada")
-            else:
-                erros += 1
-                MySQLToFirestoreMigration._shared_progress['clinicas']['erros'] = erros
-                logger.error(f"✗ Erro ao migrar clínica {codigo}: {msg}")
-        
-        self.stats['clinicas']['migrados'] = migrados
-        self.stats['clinicas']['erros'] = erros
-        
-        logger.info(f"Clínicas: {migrados} migradas, {erros} erros")
-        return erros == 0, migrados, erros
+        return self._migrar_entidade('clinicas', 'clínicas', 'tabelaclinica', total, self._clinica_doc)
     
     def migrar_consultas(self, limit: int = None) -> Tuple[bool, int, int]:
         """
         Migra consultas do MySQL para Firestore.
         
+        Sem ``limit``, compara o resumo por dia (quantidade + XOR dos CRC32 das PKs) com
+        o checkpoint: no modo incremental só os dias alterados são relidos e enviados, e
+        consultas que sumiram do MySQL são removidas do Firestore; no modo completo todos
+        os dias são enviados. Com ``limit``, migra as mais recentes e não altera o
+        checkpoint de consultas.
+        
         Args:
             limit: Limite de consultas a migrar (None = todas)
         """
         MySQLToFirestoreMigration._shared_progress['current_step'] = 'Migrando Consultas...'
         logger.info("=== Migrando Consultas ===")
         
-        query = "SELECT * FROM tabelaconsulta ORDER BY Data_Hora DESC"
+        total = self._contar('tabelaconsulta')
         if limit:
-            query += f" LIMIT {limit}"
-        
-        consultas = mysql_db.fetch_all(query)
+            total = min(total, limit)
         
-        if not consultas:
+        if not total and not (self.incremental and self.checkpoint.dias()):
             logger.warning("Nenhuma consulta encontrada no MySQL")
             return True, 0, 0
         
-        MySQLToFirestoreMigration._shared_progress['consultas']['total'] = len(consultas)
-        logger.info(f"Encontradas {len(consultas)} consultas no MySQL")
+        try:
+            self._garantir_lookups()
+        except Exception as e:
+            logger.error(f"✗ Erro ao carregar pacientes/médicos/clínicas do MySQL: {e}")
+            MySQLToFirestoreMigration._shared_progress['consultas']['erros'] = 1
+            self.stats['consultas']['erros'] = 1
+            return False, 0, 1
         
-        migrados = 0
-        erros = 0
+        if limit:
+            query = f"SELECT * FROM tabelaconsulta ORDER BY Data_Hora DESC LIMIT {int(limit)}"
+            linhas = mysql_db.stream(query, batch_size=STREAM_BATCH_SIZE)
+            sucesso, migrados, erros, _ = self._migrar('consultas', 'consultas', linhas, total, self._consulta_doc)
+            return sucesso, migrados, erros
         
-        for cons in consultas:
-            cpf = cons.get('CpfPaciente')
-            cod_med = cons.get('CodMed')
-            cod_cli = cons.get('CodCli')
-            data_hora = str(cons.get('Data_Hora', ''))
-            
-            sucesso, msg, doc_id = crud.criar_consulta(
-                cpf, cod_med, cod_cli, data_hora, 
-                observacoes="Migrado do MySQL", status="realizada"
+        return self._migrar_consultas_por_dia(total)
+    
+    @staticmethod
+    def _resumo_consultas_por_dia() -> Dict[str, list]:
+        """dia ('YYYY-MM-DD') -> [quantidade, XOR dos CRC32 de chave_consulta] no MySQL"""
+        if not mysql_db.use_sqlite:
+            # calculado no servidor: só uma linha por dia trafega
+            linhas = mysql_db.fetch_all(
+                "SELECT DATE(Data_Hora) AS dia, COUNT(*) AS n, "
+                "BIT_XOR(CRC32(CONCAT_WS('|', CodCli, CodMed, CpfPaciente, CAST(Data_Hora AS CHAR)))) AS h "
+                "FROM tabelaconsulta GROUP BY DATE(Data_Hora)"
             )
-            
-            if sucesso:
-                migrados += 1
-                MySQLToFirestoreMigration._shared_progress['consultas']['migrados'] = migrados
-                logger.debug(f"✓ Consulta migrada: {doc_id}")
-            else:
-                erros += 1
-                MySQLToFirestoreMigration._shared_progress['consultas']['erros'] = erros
-                logger.error(f"✗ Erro ao migrar consulta: {msg}")
+            return {str(l['dia']): [int(l['n']), int(l['h'])] for l in linhas}
+        
+        resumo: Dict[str, list] = {}
+        query = "SELECT CodCli, CodMed, CpfPaciente, Data_Hora FROM tabelaconsulta"
+        for l in mysql_db.stream(query, batch_size=STREAM_BATCH_SIZE):
+            chave = chave_consulta(l['CodCli'], l['CodMed'], l['CpfPaciente'], l['Data_Hora'])
+            dia = chave.rsplit('|', 1)[1][:10]
+            item = resumo.setdefault(dia, [0, 0])
+            item[0] += 1
+            item[1] ^= crc_chave(chave)
+        return resumo
+    
+    @staticmethod
+    def _dia_do_id(doc_id: str) -> str:
+        instante = doc_id.rsplit('_', 1)[-1]
+        return f"{instante[:4]}-{instante[4:6]}-{instante[6:8]}"
+    
+    @staticmethod
+    def _ids_consultas_do_dia(dia: str) -> List[str]:
+        seguinte = (date.fromisoformat(dia) + timedelta(days=1)).isoformat()
+        return firebase_db.query_ids('consultas', [('data_hora', '>=', f"{dia} 00:00:00"),
+                                                   ('data_hora', '<', f"{seguinte} 00:00:00")])
+    
+    def _migrar_consultas_por_dia(self, total_tabela: int) -> Tuple[bool, int, int]:
+        etapa = MySQLToFirestoreMigration._shared_progress['consultas']
+        try:
+            atuais = self._resumo_consultas_por_dia()
+            if total_tabela and not atuais:
+                # um resumo vazio apagaria tudo no Firestore: trate como falha de leitura
+                raise RuntimeError("resumo por dia vazio com a tabela não vazia")
+        except Exception as e:
+            logger.error(f"✗ Erro ao resumir consultas por dia: {e}")
+            etapa['erros'] = 1
+            self.stats['consultas']['erros'] = 1
+            return False, 0, 1
+        
+        if self.incremental:
+            antigos = dict(self.checkpoint.dias())
+        else:
+            antigos = {}
+            self.checkpoint.clear_dias()
+        alterados = sorted(d for d, r in atuais.items() if antigos.get(d) != r)
+        removidos = sorted(d for d in antigos if d not in atuais)
+        a_enviar = sum(atuais[d][0] for d in alterados)
+        logger.info(f"{len(alterados)} de {len(atuais)} dias com consultas novas/alteradas "
+                    f"({a_enviar} consultas), {len(removidos)} dias removidos")
+        
+        gravados: Dict[str, int] = {}      # dia -> documentos confirmados no Firestore
+        lidos = set()                      # dias com leitura no MySQL concluída
+        obsoletos: Dict[str, List[str]] = {}  # dia -> IDs no Firestore que não existem mais no MySQL
+        maior = {'chave': self.checkpoint.ultimo()}
+        ultimo_save = {'t': time.monotonic()}
+        
+        def confirmar(dia):
+            # o dia só entra no checkpoint quando tudo que o MySQL tem foi gravado
+            # (falhas, linhas inválidas ou alterações concorrentes o deixam para a próxima execução)
+            if dia in lidos and not obsoletos.get(dia) and gravados.get(dia, 0) == atuais[dia][0]:
+                self.checkpoint.set_dia(dia, atuais[dia])
+        
+        def linhas():
+            for dia in alterados:
+                existentes = set(self._ids_consultas_do_dia(dia)) if dia in antigos else set()
+                seguinte = (date.fromisoformat(dia) + timedelta(days=1)).isoformat()
+                for linha in mysql_db.stream(
+                        "SELECT * FROM tabelaconsulta WHERE Data_Hora >= %s AND Data_Hora < %s",
+                        (f"{dia} 00:00:00", f"{seguinte} 00:00:00"), batch_size=STREAM_BATCH_SIZE):
+                    existentes.discard(FirestoreModels.consulta_document_id(
+                        linha.get('CodCli'), linha.get('CodMed'), linha.get('CpfPaciente'), linha.get('Data_Hora')))
+                    yield linha
+                if existentes:
+                    obsoletos[dia] = sorted(existentes)
+                lidos.add(dia)
+                confirmar(dia)
+        
+        def ao_gravar(resultados):
+            for r in resultados:
+                if not r['sucesso']:
+                    continue
+                dia = self._dia_do_id(r['id'])
+                gravados[dia] = gravados.get(dia, 0) + 1
+                confirmar(dia)
+                cli, med, cpf, instante = r['id'].split('_')
+                chave = f"{instante}|{cli}|{med}|{cpf}"
+                if maior['chave'] is None or chave > maior['chave']:
+                    maior['chave'] = chave
+            if time.monotonic() - ultimo_save['t'] >= CHECKPOINT_SAVE_INTERVAL:
+                # permite retomar uma execução interrompida sem reenviar os dias já concluídos
+                self.checkpoint.set_ultimo(maior['chave'])
+                self._salvar_checkpoint()
+                ultimo_save['t'] = time.monotonic()
+        
+        sucesso, migrados, erros, completo = self._migrar('consultas', 'consultas', linhas(), a_enviar,
+                                                           self._consulta_doc, ao_gravar=ao_gravar)
+        etapa['ignorados'] = total_tabela - a_enviar
+        
+        if completo:
+            for dia in sorted(obsoletos):
+                falhas = self._remover('consultas', obsoletos[dia])
+                erros += len(falhas)
+                obsoletos[dia] = falhas
+                confirmar(dia)
+            for dia in removidos:
+                try:
+                    falhas = self._remover('consultas', self._ids_consultas_do_dia(dia))
+                except Exception as e:
+                    logger.error(f"✗ Erro ao listar consultas de {dia} no Firestore: {e}")
+                    falhas = [dia]
+                erros += len(falhas)
+                if not falhas:
+                    self.checkpoint.set_dia(dia, None)
+        
+        self.checkpoint.set_ultimo(maior['chave'])
+        self._salvar_checkpoint()
         
-        self.stats['consultas']['migrados'] = migrados
         self.stats['consultas']['erros'] = erros
-        
-        logger.info(f"Consultas: {migrados} migradas, {erros} erros")
         return erros == 0, migrados, erros
     
-    def migrar_tudo(self, limite_consultas: int = 100) -> bool:
+    def migrar_tudo(self, limite_consultas: Optional[int] = None) -> bool:
         """
         Migra todos os dados do MySQL para Firestore.
         
         Args:
-            limite_consultas: Limite de consultas a migrar (para evitar sobrecarga)
+            limite_consultas: Limite de consultas a migrar (None = todas)
         
         Returns:
             bool: True se tudo foi migrado com sucesso
         """
         MySQLToFirestoreMigration.reset_progress()
         MySQLToFirestoreMigration._shared_progress['status'] = 'running'
+        MySQLToFirestoreMigration._shared_progress['started_at'] = time.time()
+        MySQLToFirestoreMigration._shared_progress['incremental'] = self.incremental
         MySQLToFirestoreMigration._shared_progress['current_step'] = 'Conectando aos bancos...'
         
         logger.info("\n" + "="*60)
-        logger.info("INICIANDO MIGRAÇÃO MYSQL → FIRESTORE")
+        logger.info("INICIANDO MIGRAÇÃO MYSQL → FIRESTORE" + (" (INCREMENTAL)" if self.incremental else ""))
         logger.info("="*60 + "\n")
         
         # Conectar ao MySQL
@@ -286,12 +576,27 @@ class MySQLToFirestoreMigration:
         sucesso_total = sucesso_total and sucesso
         
         # 4. Consultas (com limite)
+        if limite_consultas and self.incremental:
+            logger.warning("Limite de consultas ignorado no modo incremental")
+            limite_consultas = None
         if limite_consultas:
             logger.info(f"Migrando apenas {limite_consultas} consultas mais recentes")
         sucesso, mig, err = self.migrar_consultas(limit=limite_consultas)
         sucesso_total = sucesso_total and sucesso
         
+        # 5. Contadores agregados (gravações em lote não passam pelos incrementos do CRUD)
+        progresso_consultas = MySQLToFirestoreMigration._shared_progress['consultas']
+        if progresso_consultas['migrados'] or progresso_consultas['removidos']:
+            MySQLToFirestoreMigration._shared_progress['current_step'] = 'Recalculando contadores agregados...'
+            try:
+                aggregates.reconstruir()
+            except Exception as e:
+                logger.error(f"✗ Erro ao recalcular contadores agregados: {e}")
+                sucesso_total = False
+        
         # Resumo final
+        MySQLToFirestoreMigration._shared_progress['elapsed'] = (
+            time.time() - MySQLToFirestoreMigration._shared_progress['started_at'])
         MySQLToFirestoreMigration._shared_progress['current_step'] = 'Concluído!'
         MySQLToFirestoreMigration._shared_progress['status'] = 'completed' if sucesso_total else 'completed_with_errors'
         self.print_resumo()
@@ -314,10 +619,17 @@ class MySQLToFirestoreMigration:
             total_erros += err
             
             status = "✓" if err == 0 else "✗"
-            logger.info(f"{status} {tipo.capitalize()}: {mig} migrados, {err} erros")
+            etapa = MySQLToFirestoreMigration._shared_progress.get(tipo, {})
+            extras = ""
+            if etapa.get('ignorados') or etapa.get('removidos'):
+                extras = f", {etapa.get('ignorados', 0)} sem alteração, {etapa.get('removidos', 0)} removidos"
+            logger.info(f"{status} {tipo.capitalize()}: {mig} migrados, {err} erros{extras}")
         
         logger.info("-" * 60)
         logger.info(f"TOTAL: {total_migrados} registros migrados, {total_erros} erros")
+        progresso = MySQLToFirestoreMigration._shared_progress
+        if progresso.get('elapsed'):
+            logger.info(f"Tempo: {progresso['elapsed']:.1f}s ({total_migrados / progresso['elapsed']:.0f} docs/s)")
         logger.info("="*60 + "\n")
 
 
@@ -326,8 +638,14 @@ def main():
     import argparse
     
     parser = argparse.ArgumentParser(description='Migrar dados MySQL para Firebase Firestore')
-    parser.add_argument('--limite-consultas', type=int, default=100,
-                       help='Limite de consultas a migrar (padrão: 100)')
+    parser.add_argument('--limite-consultas', type=int, default=None,
+                       help='Limite de consultas a migrar (padrão: todas)')
+    parser.add_argument('--incremental', action='store_true',
+                       help='Enviar só o que mudou desde o último checkpoint (e remover o que sumiu do MySQL)')
+    parser.add_argument('--checkpoint', default=None,
+                       help=f'Arquivo de checkpoint (padrão: {FirebaseConfig.MIGRATION_CHECKPOINT_PATH})')
+    parser.add_argument('--reset-checkpoint', action='store_true',
+                       help='Apagar o checkpoint antes de migrar')
     parser.add_argument('--debug', action='store_true',
                        help='Ativar modo debug com logs detalhados')
     
@@ -336,7 +654,9 @@ def main():
     if args.debug:
         logger.setLevel(logging.DEBUG)
     
-    migration = MySQLToFirestoreMigration()
+    migration = MySQLToFirestoreMigration(incremental=args.incremental, checkpoint_path=args.checkpoint)
+    if args.reset_checkpoint:
+        migration.checkpoint.reset()
     
     try:
         sucesso = migration.migrar_tudo(limite_consultas=args.limite_consultas)
@@ -197,6 +197,19 @@ class FirestoreModels:
             'updated_at': datetime.now()
         }
     
+    @staticmethod
+    def consulta_document_id(cod_clinica: Any, cod_medico: Any, cpf_paciente: Any, data_hora: Any) -> str:
+        """
+        ID determinístico da consulta a partir da PK composta do MySQL
+        (CodCli, CodMed, CpfPaciente, Data_Hora), ex.: '12_1234567_12345678901_20250101083000'.
+        Regravar a mesma consulta sobrescreve o documento em vez de duplicá-lo.
+        """
+        if isinstance(data_hora, datetime):
+            instante = data_hora.strftime('%Y%m%d%H%M%S')
+        else:
+            instante = ''.join(c for c in str(data_hora)[:19] if c.isdigit())
+        return f"{cod_clinica}_{cod_medico}_{cpf_paciente}_{instante}"
+    
     @staticmethod
     def get_consulta_model(cpf_paciente: str, cod_medico: str, cod_clinica: str,
                           data_hora: str, paciente_data: Optional[Dict] = None,
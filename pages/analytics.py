@@ -5,18 +5,18 @@ from dash.dependencies import Input, Output, State
 import plotly.graph_objs as go
 import plotly.express as px
 from db import db
+from cache import get_cache, make_key
+from filtros_sql import filtros_consultas
 import pandas as pd
 from datetime import datetime, timedelta
 import logging
 
 logger = logging.getLogger("consultorio.analytics")
 
-# Cache simples para dados
-_cache = {
-    'data': None,
-    'timestamp': None,
-    'ttl': 300  # 5 minutos
-}
+# Resultados por combinação de filtros (LRU + TTL, ver cache.py)
+_cache = get_cache('analytics', ttl=300)
+# tabelas lidas pela consulta do analytics (escritas nelas invalidam o cache)
+TABELAS = ('tabelaconsulta', 'tabelaclinica', 'tabelamedico', 'tabelapaciente')
 
 
 def build_layout():
@@ -233,6 +233,26 @@ def build_layout():
     ], fluid=True)
 
 
+def carregar_consultas(clinica=None, medico=None, start_date=None, end_date=None):
+    """Consultas do filtro (até 5000, mais recentes primeiro); período inclusivo em dias"""
+    filtros = filtros_consultas(start_date, end_date, medico=medico, clinica=clinica)
+    # Query otimizada: seleciona apenas colunas necessárias
+    sql = ("SELECT c.CodCli, c.CodMed, c.CpfPaciente, c.Data_Hora, "
+           "cl.NomeCli, m.NomeMed, p.DataNascimento, p.Genero as GeneroPac "
+           "FROM tabelaconsulta c "
+           "INNER JOIN tabelaclinica cl ON c.CodCli=cl.CodCli "
+           "INNER JOIN tabelamedico m ON c.CodMed=m.CodMed "
+           "INNER JOIN tabelapaciente p ON c.CpfPaciente=p.CpfPaciente"
+           f"{filtros.where()}")
+
+    # Busca dados com limite
+    logger.info(f"Buscando dados com filtros: clinica={clinica}, medico={medico}, período={start_date} a {end_date}")
+    # erros propagam: um DataFrame vazio de uma falha não pode ir para o cache
+    resultado = db.fetch_frame(sql + ' ORDER BY c.Data_Hora DESC LIMIT 5000', filtros.params, raise_errors=True)
+    logger.info(f"Cache atualizado com {len(resultado)} registros")
+    return resultado
+
+
 # Callback será o mesmo que o antigo, mas agora separado nesta página
 def register_callbacks(app):
     @app.callback(
@@ -252,57 +272,19 @@ def register_callbacks(app):
         prevent_initial_call=True
     )
     def update_all(n_clicks, clinica, medico, start_date, end_date):
-        # Verifica cache
-        cache_key = f"{clinica}_{medico}_{start_date}_{end_date}"
-        now = datetime.now()
-        
-        if (_cache['data'] is not None and 
-            _cache['timestamp'] and 
-            (now - _cache['timestamp']).seconds < _cache['ttl'] and
-            _cache.get('key') == cache_key):
-            logger.info("Usando dados em cache")
-            df = _cache['data']
-        else:
-            # Monta query otimizada com filtros
-            # Se não houver filtros de data, limita aos últimos 90 dias por padrão
-            if not start_date and not end_date:
-                default_start = (datetime.now() - timedelta(days=90)).strftime('%Y-%m-%d')
-                start_date = default_start
-                logger.info(f"Aplicando filtro padrão: últimos 90 dias desde {start_date}")
-            
-            # Query otimizada: seleciona apenas colunas necessárias
-            sql = ("SELECT c.CodCli, c.CodMed, c.CpfPaciente, c.Data_Hora, "
-                   "cl.NomeCli, m.NomeMed, p.DataNascimento, p.Genero as GeneroPac "
-                   "FROM tabelaconsulta c "
-                   "INNER JOIN tabelaclinica cl ON c.CodCli=cl.CodCli "
-                   "INNER JOIN tabelamedico m ON c.CodMed=m.CodMed "
-                   "INNER JOIN tabelapaciente p ON c.CpfPaciente=p.CpfPaciente "
-                   "WHERE 1=1 ")
-            params = []
-            
-            if clinica:
-                sql += ' AND c.CodCli = %s'
-                params.append(clinica)
-            if medico:
-                sql += ' AND c.CodMed = %s'
-                params.append(medico)
-            if start_date:
-                sql += ' AND c.Data_Hora >= %s'
-                params.append(start_date)
-            if end_date:
-                sql += ' AND c.Data_Hora <= %s'
-                params.append(end_date)
+        # Se não houver filtros de data, limita aos últimos 90 dias por padrão
+        if not start_date and not end_date:
+            start_date = (datetime.now() - timedelta(days=90)).strftime('%Y-%m-%d')
+            logger.info(f"Aplicando filtro padrão: últimos 90 dias desde {start_date}")
 
-            # Busca dados com limite
-            logger.info(f"Buscando dados com filtros: clinica={clinica}, medico={medico}, período={start_date} a {end_date}")
-            rows = db.fetch_all_paginated(sql + ' ORDER BY c.Data_Hora DESC', params, limit=5000)
-            df = pd.DataFrame(rows) if rows else pd.DataFrame()
-            
-            # Atualiza cache
-            _cache['data'] = df
-            _cache['timestamp'] = now
-            _cache['key'] = cache_key
-            logger.info(f"Cache atualizado com {len(df)} registros")
+        # O DataFrame em cache é compartilhado: as colunas derivadas vão numa cópia
+        chave = make_key('consultas', clinica=clinica, medico=medico, inicio=start_date, fim=end_date)
+        try:
+            df = _cache.get_or_set(chave, lambda: carregar_consultas(clinica, medico, start_date, end_date),
+                                   tables=TABELAS).copy()
+        except Exception:
+            # erro já registrado por db: figuras vazias nesta chamada, a próxima tenta de novo
+            df = pd.DataFrame()
 
         # Figuras vazias por padrão
         empty_fig = go.Figure().update_layout(
@@ -322,26 +304,14 @@ def register_callbacks(app):
         fig_scatter = empty_fig
 
         if not df.empty:
-            try:
-                df['Data_Hora'] = pd.to_datetime(df['Data_Hora'])
-            except Exception:
-                df['Data_Hora'] = pd.to_datetime(df['Data_Hora'], errors='coerce')
-            
+            # fetch_frame já entrega Data_Hora/DataNascimento como datetime64
             df['date'] = df['Data_Hora'].dt.date
             df['hour'] = df['Data_Hora'].dt.hour
             df['weekday'] = df['Data_Hora'].dt.day_name()
 
-            # Idade
-            def compute_age(dob):
-                try:
-                    d = pd.to_datetime(dob)
-                    today = pd.Timestamp.now()
-                    return int((today - d).days / 365.25)
-                except Exception:
-                    return None
-
+            # Idade (vetorizada; NaN quando a data de nascimento é desconhecida)
             if 'DataNascimento' in df.columns:
-                df['age'] = df['DataNascimento'].apply(compute_age)
+                df['age'] = ((pd.Timestamp.now() - df['DataNascimento']).dt.days // 365.25)
 
             # Série temporal
             ts = df.groupby('date').size().reset_index(name='count')
@@ -364,7 +334,7 @@ def register_callbacks(app):
 
             # Gênero
             if 'GeneroPac' in df.columns:
-                gender = df['GeneroPac'].fillna('Desconhecido').value_counts().reset_index()
+                gender = df['GeneroPac'].astype(object).fillna('Desconhecido').value_counts().reset_index()
                 gender.columns = ['Genero', 'count']
                 fig_gender = px.pie(
                     gender, names='Genero', values='count',
@@ -1,18 +1,38 @@
 # -*- coding: utf-8 -*-
-from dash import html, dcc, callback, callback_context
+from dash import html, dcc, callback, callback_context, dash_table
+from dash.exceptions import PreventUpdate
 import dash_bootstrap_components as dbc
-from dash.dependencies import Input, Output, State, ALL
-import pandas as pd
+from dash.dependencies import Input, Output, State
 from db import db
+from cache import get_cache, make_key
+from datatable_sql import buscar_pagina
+from filtros_sql import filtros_consultas
+import search
 from datetime import datetime
-import json
+
+# Linhas por página da listagem (só a página visível sai do banco)
+PAGE_SIZE = 20
+
+# Ordem da listagem: mais recentes primeiro, desempatando pela chave primária; com
+# direção única o índice de Data_Hora (que no InnoDB já inclui a PK) serve a paginação
+ORDEM = ['Data_Hora DESC', 'CodCli DESC', 'CodMed DESC', 'CpfPaciente DESC']
+
+# Busca de paciente no cadastro de consulta: mínimo de caracteres e resultados exibidos
+MIN_BUSCA_PACIENTE = 2
+LIMITE_BUSCA_PACIENTE = 20
+
+# Totais por filtro e opções de médico (escritas nas tabelas invalidam, ver cache.py)
+_cache = get_cache('listagens', ttl=300)
 
 layout = dbc.Container([
     html.H2("Gerenciamento de Consultas", className="mb-4"),
     
     dbc.Row([
         dbc.Col([
-            dbc.Button("➕ Nova Consulta", id="btn-nova-consulta", color="warning", className="mb-3")
+            dbc.Button("➕ Nova Consulta", id="btn-nova-consulta", color="warning", className="mb-3"),
+            html.Span(className="ms-2 action-buttons", children=[
+                dbc.Button([html.Img(src='/assets/icons/icon-delete.svg', height='18'), " Excluir selecionada"], id='btn-delete-selected-cons', color='danger', size='sm')
+            ])
         ])
     ]),
     
@@ -35,7 +55,29 @@ layout = dbc.Container([
         ], md=3)
     ], className="mb-3"),
     
-    html.Div(id="tabela-consultas"),
+    html.Div(className='data-table-container', children=[
+        dash_table.DataTable(
+            id='consultas-datatable',
+            columns=[
+                {"name": "Data/Hora", "id": "DataHoraFmt"},
+                {"name": "Paciente", "id": "NomePac"},
+                {"name": "Médico", "id": "NomeMed"},
+                {"name": "Clínica", "id": "NomeCli"},
+            ],
+            data=[],
+            # paginação feita no banco, por chave (atualizar_tabela)
+            page_action='custom',
+            page_current=0,
+            page_size=PAGE_SIZE,
+            page_count=1,
+            style_table={'overflowX': 'auto'},
+            row_selectable='single',
+            selected_rows=[],
+            style_cell={'textAlign': 'left', 'padding': '6px'},
+            style_header={'fontWeight': 'bold'},
+        )
+    ]),
+    html.Div(id="tabela-consultas", className="text-muted small mt-2"),
     
     dbc.Modal([
         dbc.ModalHeader(dbc.ModalTitle(id="modal-consulta-titulo")),
@@ -52,7 +94,9 @@ layout = dbc.Container([
                     ], md=4),
                     dbc.Col([
                         dbc.Label("Paciente *"),
-                        dcc.Dropdown(id="input-paciente-cons", placeholder="Selecione o paciente")
+                        # opções vêm da busca conforme o usuário digita (buscar_pacientes_consulta)
+                        dcc.Dropdown(id="input-paciente-cons", placeholder="Digite o nome ou CPF",
+                                     search_order='original')
                     ], md=4)
                 ], className="mb-3"),
                 
@@ -100,83 +144,114 @@ layout = dbc.Container([
     dcc.Store(id='store-consulta-acao'),
     dcc.Store(id='store-consulta-delete'),
     dcc.Store(id='store-refresh-trigger-cons', data=0),
+    # cursores da paginação por chave (ver datatable_sql.buscar_pagina)
+    dcc.Store(id='store-consultas-cursores', data={}),
     html.Div(id="alert-consulta")
 ], fluid=True)
 
+def _opcoes_medicos():
+    try:
+        return _cache.get_or_set(
+            make_key('opcoes_medicos'),
+            lambda: [{"label": f"{m['CodMed']} - {m['NomeMed']}", "value": m['CodMed']}
+                     for m in db.fetch_all("SELECT CodMed, NomeMed FROM tabelamedico", raise_errors=True)],
+            tables=('tabelamedico',))
+    except Exception:
+        # erro já registrado por db; a lista vazia vale só para esta chamada (não vai para o cache)
+        return []
+
+
+def _total_consultas(where, params):
+    """Total de consultas do filtro atual (sem filtro, vem de db.table_counts)"""
+    if not where:
+        return db.table_counts(('tabelaconsulta',)).get('tabelaconsulta', 0)
+    # os JOINs da listagem seguem FKs, então não mudam a contagem
+    try:
+        return _cache.get_or_set(
+            make_key('consultas_total', where, tuple(params)),
+            lambda: (db.fetch_one(f"SELECT COUNT(*) as total FROM tabelaconsulta c{where}", params,
+                                  raise_errors=True) or {}).get('total', 0),
+            tables=('tabelaconsulta',))
+    except Exception:
+        # erro já registrado por db; o zero não vai para o cache
+        return 0
+
+
+def carregar_pagina(page_current, data_ini, data_fim, medico_filtro, estado):
+    """
+    Página ``page_current`` da listagem com os filtros da tela (período como intervalo
+    semiaberto sobre Data_Hora, ver filtros_sql.py).
+
+    Returns:
+        Tuple: (linhas, total, page_count, página efetiva, novo estado dos cursores)
+    """
+    filtros = filtros_consultas(data_ini, data_fim, medico=medico_filtro)
+    where = filtros.where()
+
+    total = _total_consultas(where, filtros.params)
+    page_count = max(1, -(-total // PAGE_SIZE))
+    page_current = min(page_current or 0, page_count - 1)
+
+    query = f"""
+    SELECT 
+        c.CodCli, c.CodMed, c.CpfPaciente, c.Data_Hora,
+        cl.NomeCli, m.NomeMed, p.NomePac
+    FROM tabelaconsulta c
+    JOIN tabelaclinica cl ON c.CodCli = cl.CodCli
+    JOIN tabelamedico m ON c.CodMed = m.CodMed
+    JOIN tabelapaciente p ON c.CpfPaciente = p.CpfPaciente{where}
+    """
+    consultas, estado = buscar_pagina(query, filtros.params, ORDEM, page_current, PAGE_SIZE, estado)
+    return consultas, total, page_count, page_current, estado
+
+
 @callback(
+    Output('consultas-datatable', 'data'),
+    Output('consultas-datatable', 'page_count'),
+    Output('consultas-datatable', 'page_current'),
+    Output('consultas-datatable', 'selected_rows'),
     Output("tabela-consultas", "children"),
+    Output('store-consultas-cursores', 'data'),
     Output("filtro-medico-cons", "options"),
+    Input('consultas-datatable', 'page_current'),
     Input("btn-aplicar-filtros", "n_clicks"),
     Input("store-refresh-trigger-cons", "data"),
     State("filtro-data-inicio", "value"),
     State("filtro-data-fim", "value"),
-    State("filtro-medico-cons", "value")
+    State("filtro-medico-cons", "value"),
+    State('store-consultas-cursores', 'data')
 )
-def atualizar_tabela(apply_click, refresh_trigger, data_ini, data_fim, medico_filtro):
+def atualizar_tabela(page_current, apply_click, refresh_trigger, data_ini, data_fim, medico_filtro, estado):
     # proteção: se sem conexão, retornar alerta e opções vazias
     if not db.ensure_connected():
-        return dbc.Alert("Sem conexão com o banco de dados. Verifique o arquivo .env e o serviço MySQL.", color="danger"), []
+        return [], 1, 0, [], dbc.Alert("Sem conexão com o banco de dados. Verifique o arquivo .env e o serviço MySQL.", color="danger"), {}, []
 
-    query = """
-    SELECT 
-        c.CodCli, c.CodMed, c.CpfPaciente, c.Data_Hora,
-        cl.NomeCli, m.NomeMed, p.NomePac
-    FROM tabelaconsulta c
-    JOIN tabelaclinica cl ON c.CodCli = cl.CodCli
-    JOIN tabelamedico m ON c.CodMed = m.CodMed
-    JOIN tabelapaciente p ON c.CpfPaciente = p.CpfPaciente
-    WHERE 1=1
-    """
-    params = []
-    
-    if data_ini:
-        query += " AND DATE(c.Data_Hora) >= %s"
-        params.append(data_ini)
-    
-    if data_fim:
-        query += " AND DATE(c.Data_Hora) <= %s"
-        params.append(data_fim)
-    
-    if medico_filtro:
-        query += " AND c.CodMed = %s"
-        params.append(medico_filtro)
-    
-    query += " ORDER BY c.Data_Hora DESC"
+    # filtros novos voltam à primeira página
+    if 'btn-aplicar-filtros.n_clicks' in callback_context.triggered_prop_ids:
+        page_current = 0
+    consultas, total, page_count, page_current, estado = carregar_pagina(
+        page_current, data_ini, data_fim, medico_filtro, estado)
     
-    consultas = db.fetch_all(query, tuple(params) if params else None)
-    
-    medicos = db.fetch_all("SELECT CodMed, NomeMed FROM tabelamedico")
-    medico_options = [{"label": f"{m['CodMed']} - {m['NomeMed']}", "value": m['CodMed']} for m in medicos]
+    medico_options = _opcoes_medicos()
     
     if not consultas:
-        return dbc.Alert("Nenhuma consulta encontrada", color="info"), medico_options
-    
-    df = pd.DataFrame(consultas)
+        return [], page_count, page_current, [], dbc.Alert("Nenhuma consulta encontrada", color="info"), estado, medico_options
     
-    table_header = [html.Thead(html.Tr([
-        html.Th("Data/Hora"), html.Th("Paciente"), html.Th("Médico"),
-        html.Th("Clínica"), html.Th("Ações")
-    ]))]
-    
-    rows = []
-    for _, row in df.iterrows():
-        data_hora_str = row['Data_Hora'].strftime('%d/%m/%Y %H:%M') if isinstance(row['Data_Hora'], datetime) else str(row['Data_Hora'])
-        
-        rows.append(html.Tr([
-            html.Td(data_hora_str),
-            html.Td(row['NomePac']),
-            html.Td(row['NomeMed']),
-            html.Td(row['NomeCli']),
-            html.Td([
-                dbc.Button("\U0001f5d1\ufe0f", 
-                          id={'type': 'btn-delete-cons', 
-                              'index': f"{row['CodCli']}|{row['CodMed']}|{row['CpfPaciente']}|{row['Data_Hora']}"}, 
-                          color="danger", size="sm")
-            ])
-        ]))
+    for row in consultas:
+        data_hora = row['Data_Hora']
+        if isinstance(data_hora, str):
+            # SQLite devolve texto ISO
+            try:
+                data_hora = datetime.fromisoformat(data_hora)
+            except ValueError:
+                pass
+        row['DataHoraFmt'] = data_hora.strftime('%d/%m/%Y %H:%M') if isinstance(data_hora, datetime) else str(data_hora)
+        # texto exato usado na exclusão
+        row['Data_Hora'] = str(row['Data_Hora'])
     
-    table_body = [html.Tbody(rows)]
-    return dbc.Table(table_header + table_body, bordered=True, hover=True, responsive=True, striped=True), medico_options
+    inicio = page_current * PAGE_SIZE
+    info = f"Exibindo {inicio + 1}–{inicio + len(consultas)} de {total} consulta(s)"
+    return consultas, page_count, page_current, [], info, estado, medico_options
 
 @callback(
     Output("modal-consulta", "is_open"),
@@ -208,11 +283,11 @@ def toggle_modal(novo_click, fechar_click):
     
     clinicas = db.fetch_all("SELECT CodCli, NomeCli FROM tabelaclinica")
     medicos = db.fetch_all("SELECT CodMed, NomeMed FROM tabelamedico")
-    pacientes = db.fetch_all("SELECT CpfPaciente, NomePac FROM tabelapaciente")
     
     cli_opts = [{"label": f"{c['CodCli']} - {c['NomeCli']}", "value": c['CodCli']} for c in clinicas]
     med_opts = [{"label": f"{m['CodMed']} - {m['NomeMed']}", "value": m['CodMed']} for m in medicos]
-    pac_opts = [{"label": f"{p['CpfPaciente']} - {p['NomePac']}", "value": p['CpfPaciente']} for p in pacientes]
+    # pacientes: carregados sob demanda pela busca (podem ser milhões)
+    pac_opts = []
     
     if "btn-nova-consulta" in trigger_id:
         return True, "Nova Consulta", "create", cli_opts, med_opts, pac_opts, None, None, None, "", ""
@@ -222,6 +297,27 @@ def toggle_modal(novo_click, fechar_click):
     
     return False, "", None, cli_opts, med_opts, pac_opts, None, None, None, "", ""
 
+@callback(
+    Output("input-paciente-cons", "options", allow_duplicate=True),
+    Input("input-paciente-cons", "search_value"),
+    State("input-paciente-cons", "value"),
+    State("input-paciente-cons", "options"),
+    prevent_initial_call=True
+)
+def buscar_pacientes_consulta(search_value, selecionado, opcoes):
+    """Type-ahead de pacientes: índice de texto por nome ou prefixo do CPF (ver search.py)"""
+    if not search_value or len(search_value.strip()) < MIN_BUSCA_PACIENTE:
+        raise PreventUpdate
+    
+    pacientes = search.buscar_pacientes(search_value, limit=LIMITE_BUSCA_PACIENTE)
+    # 'search' igual ao texto digitado: o filtro do próprio Dropdown não descarta os resultados
+    # (que já casam sem acento/por prefixo) e search_order='original' mantém a relevância
+    novas = [{"label": f"{p['CpfPaciente']} - {p['NomePac']}", "value": p['CpfPaciente'], "search": search_value}
+             for p in pacientes]
+    # mantém a opção já selecionada, senão o Dropdown perde o rótulo
+    atual = [o for o in (opcoes or []) if o.get('value') == selecionado and selecionado not in {n['value'] for n in novas}]
+    return atual + novas
+
 @callback(
     Output("alert-consulta", "children"),
     Output("modal-consulta", "is_open", allow_duplicate=True),
@@ -296,13 +392,14 @@ def fechar_modal_trigger(n_clicks):
 @callback(
     Output("modal-delete-consulta", "is_open"),
     Output("store-consulta-delete", "data"),
-    Input({'type': 'btn-delete-cons', 'index': ALL}, "n_clicks"),
+    Input('btn-delete-selected-cons', 'n_clicks'),
     Input("btn-confirmar-delete-cons", "n_clicks"),
     Input("btn-cancelar-delete-cons", "n_clicks"),
-    State({'type': 'btn-delete-cons', 'index': ALL}, "id"),
+    State('consultas-datatable', 'selected_rows'),
+    State('consultas-datatable', 'data'),
     prevent_initial_call=True
 )
-def toggle_delete_modal(delete_clicks, confirm_click, cancel_click, delete_ids):
+def toggle_delete_modal(delete_selected_click, confirm_click, cancel_click, selected_rows, table_data):
     ctx = callback_context
     
     if not ctx.triggered:
@@ -314,9 +411,14 @@ def toggle_delete_modal(delete_clicks, confirm_click, cancel_click, delete_ids):
 
     trigger_id = triggered['prop_id'].split('.')[0]
     
-    if "btn-delete-cons" in trigger_id:
-        button_id = json.loads(trigger_id)
-        return True, button_id['index']
+    if 'btn-delete-selected-cons' in trigger_id:
+        if not selected_rows or not table_data:
+            return False, None
+        try:
+            row = table_data[selected_rows[0]]
+        except Exception:
+            return False, None
+        return True, f"{row['CodCli']}|{row['CodMed']}|{row['CpfPaciente']}|{row['Data_Hora']}"
     
     return False, None
 
@@ -4,59 +4,134 @@ import dash_bootstrap_components as dbc
 from dash.dependencies import Input, Output, State
 import plotly.graph_objs as go
 import plotly.express as px
-from db import db, logger
+from db import db, logger, KPI_TABLES
+from fanout import fan_out
+from filtros_sql import Filtros
+import rollups
+from cache import get_cache, make_key
+from config import Config
 import pandas as pd
 from datetime import datetime, timedelta
 
+# Indicadores do dashboard: cada página aberta refazia todas as agregações;
+# agora são servidos do cache até uma escrita nas tabelas envolvidas
+# (ou por no máximo Config.HOME_CACHE_TTL segundos)
+_cache = get_cache('home', ttl=Config.HOME_CACHE_TTL)
+TODAS_TABELAS = ('tabelapaciente', 'tabelamedico', 'tabelaclinica', 'tabelaconsulta')
 
-def build_layout():
-    """Constrói o layout do dashboard principal"""
-    if not db.ensure_connected():
-        return dbc.Container([
-            dbc.Alert([
-                html.H4("⚠️ Sem conexão com o banco de dados", className="alert-heading"),
-                html.P("Não foi possível conectar. Verifique as configurações em .env"),
-            ], color="danger")
-        ], fluid=True)
+# Valores exibidos quando uma consulta não responde dentro de Config.HOME_DEADLINE
+PADROES = {
+    'contagens': {}, 'consultas': '—', 'consultas_hoje': '—',
+    'proximas': [], 'top_medicos': [],
+    'por_especialidade': pd.DataFrame(), 'ultimos_30_dias': pd.DataFrame(),
+}
 
-    # KPIs principais
-    stats = {
-        'pacientes': db.fetch_one("SELECT COUNT(*) as total FROM tabelapaciente")['total'],
-        'medicos': db.fetch_one("SELECT COUNT(*) as total FROM tabelamedico")['total'],
-        'clinicas': db.fetch_one("SELECT COUNT(*) as total FROM tabelaclinica")['total'],
-        'consultas': db.fetch_one("SELECT COUNT(*) as total FROM tabelaconsulta")['total']
+
+def _consultar(nome, tabelas, loader):
+    """
+    Resultado em cache de uma consulta do dashboard (chave inclui o backend e o dia);
+    escritas em ``tabelas`` via db.execute_query invalidam a entrada. Os loaders leem com
+    ``raise_errors=True``: uma falha propaga para fan_out (que usa PADROES) e não vai para o cache.
+    """
+    return _cache.get_or_set(make_key(nome, db.use_sqlite, datetime.now().date()), loader, tables=tabelas)
+
+
+def _tarefas_rollups(hoje):
+    """Consultas de KPIs e séries lidas dos rollups (custo independe do volume de consultas)"""
+    tabelas = ('tabelaconsulta',) + rollups.ROLLUP_TABLES
+    return {
+        'consultas': lambda: _consultar('consultas_total', tabelas, lambda: db.fetch_one(
+            "SELECT COALESCE(SUM(Total), 0) as total FROM consultas_por_medico", raise_errors=True
+        )['total']),
+        'consultas_hoje': lambda: _consultar('consultas_hoje', tabelas, lambda: db.fetch_one(
+            "SELECT COALESCE(SUM(Total), 0) as total FROM consultas_por_dia_medico_clinica WHERE Dia = %s",
+            (hoje.isoformat(),), raise_errors=True
+        )['total']),
+        'top_medicos': lambda: _consultar('top_medicos', tabelas + ('tabelamedico',), lambda: db.fetch_all("""
+            SELECT 
+                m.NomeMed,
+                m.Especialidade,
+                r.Total as total_consultas
+            FROM consultas_por_medico r
+            JOIN tabelamedico m ON r.CodMed = m.CodMed
+            ORDER BY r.Total DESC
+            LIMIT 5
+        """, raise_errors=True)),
+        'por_especialidade': lambda: _consultar('por_especialidade', tabelas + ('tabelamedico',), lambda: db.fetch_frame("""
+            SELECT 
+                m.Especialidade,
+                SUM(r.Total) as total
+            FROM consultas_por_medico r
+            JOIN tabelamedico m ON r.CodMed = m.CodMed
+            GROUP BY m.Especialidade
+            ORDER BY total DESC
+            LIMIT 10
+        """, raise_errors=True)),
+        'ultimos_30_dias': lambda: _consultar('ultimos_30_dias', tabelas, lambda: db.fetch_frame("""
+            SELECT 
+                Dia as data,
+                SUM(Total) as total
+            FROM consultas_por_dia_medico_clinica
+            WHERE Dia >= %s
+            GROUP BY Dia
+            ORDER BY data
+        """, ((hoje - timedelta(days=30)).isoformat(),), raise_errors=True)),
     }
 
-    # Consultas hoje (compatível com SQLite e MySQL)
-    hoje = datetime.now().date()
-    if db.use_sqlite:
-        consultas_hoje = db.fetch_one(
-            "SELECT COUNT(*) as total FROM tabelaconsulta WHERE DATE(Data_Hora) = DATE('now')"
-        )['total']
-    else:
-        consultas_hoje = db.fetch_one(
-            "SELECT COUNT(*) as total FROM tabelaconsulta WHERE DATE(Data_Hora) = CURDATE()"
-        )['total']
 
-    # Próximas 5 consultas (compatível com SQLite e MySQL)
-    if db.use_sqlite:
-        proximas = db.fetch_all("""
+def _tarefas_agregados(hoje):
+    """
+    As mesmas consultas agregando tabelaconsulta (quando os rollups não estão instalados);
+    o total de consultas vem de db.table_counts junto com os demais KPIs
+    """
+    # Consultas hoje e últimos 30 dias: intervalos sobre Data_Hora (usam idx_consulta_data)
+    filtro_hoje = Filtros().dia('Data_Hora', hoje)
+    filtro_30_dias = Filtros().desde('Data_Hora', hoje - timedelta(days=30))
+
+    return {
+        'consultas_hoje': lambda: _consultar('consultas_hoje', ('tabelaconsulta',), lambda: db.fetch_one(
+            f"SELECT COUNT(*) as total FROM tabelaconsulta{filtro_hoje.where()}", filtro_hoje.params, raise_errors=True
+        )['total']),
+        # Top 5 médicos com mais consultas
+        'top_medicos': lambda: _consultar('top_medicos', ('tabelaconsulta', 'tabelamedico'), lambda: db.fetch_all("""
             SELECT 
-                c.Data_Hora,
-                p.NomePac,
                 m.NomeMed,
                 m.Especialidade,
-                cl.NomeCli
+                COUNT(*) as total_consultas
             FROM tabelaconsulta c
-            JOIN tabelapaciente p ON c.CpfPaciente = p.CpfPaciente
             JOIN tabelamedico m ON c.CodMed = m.CodMed
-            JOIN tabelaclinica cl ON c.CodCli = cl.CodCli
-            WHERE c.Data_Hora >= datetime('now')
-            ORDER BY c.Data_Hora
+            GROUP BY m.CodMed, m.NomeMed, m.Especialidade
+            ORDER BY total_consultas DESC
             LIMIT 5
-        """)
-    else:
-        proximas = db.fetch_all("""
+        """, raise_errors=True)),
+        # Consultas por especialidade (para gráfico)
+        'por_especialidade': lambda: _consultar('por_especialidade', ('tabelaconsulta', 'tabelamedico'), lambda: db.fetch_frame("""
+            SELECT 
+                m.Especialidade,
+                COUNT(*) as total
+            FROM tabelaconsulta c
+            JOIN tabelamedico m ON c.CodMed = m.CodMed
+            GROUP BY m.Especialidade
+            ORDER BY total DESC
+            LIMIT 10
+        """, raise_errors=True)),
+        # Consultas nos últimos 30 dias (série temporal)
+        'ultimos_30_dias': lambda: _consultar('ultimos_30_dias', ('tabelaconsulta',), lambda: db.fetch_frame(f"""
+            SELECT 
+                DATE(Data_Hora) as data,
+                COUNT(*) as total
+            FROM tabelaconsulta{filtro_30_dias.where()}
+            GROUP BY DATE(Data_Hora)
+            ORDER BY data
+        """, filtro_30_dias.params, raise_errors=True)),
+    }
+
+
+def _tarefas_proximas():
+    """Próximas 5 consultas (compatível com SQLite e MySQL)"""
+    agora_sql = "datetime('now')" if db.use_sqlite else "NOW()"
+    return {
+        'proximas': lambda: _consultar('proximas', TODAS_TABELAS, lambda: db.fetch_all(f"""
             SELECT 
                 c.Data_Hora,
                 p.NomePac,
@@ -67,64 +142,54 @@ def build_layout():
             JOIN tabelapaciente p ON c.CpfPaciente = p.CpfPaciente
             JOIN tabelamedico m ON c.CodMed = m.CodMed
             JOIN tabelaclinica cl ON c.CodCli = cl.CodCli
-            WHERE c.Data_Hora >= NOW()
+            WHERE c.Data_Hora >= {agora_sql}
             ORDER BY c.Data_Hora
             LIMIT 5
-        """)
+        """, raise_errors=True)),
+    }
+
+
+def build_layout():
+    """Constrói o layout do dashboard principal"""
+    if not db.ensure_connected():
+        return dbc.Container([
+            dbc.Alert([
+                html.H4("⚠️ Sem conexão com o banco de dados", className="alert-heading"),
+                html.P("Não foi possível conectar. Verifique as configurações em .env"),
+            ], color="danger")
+        ], fluid=True)
 
-    # Top 5 médicos com mais consultas
-    top_medicos = db.fetch_all("""
-        SELECT 
-            m.NomeMed,
-            m.Especialidade,
-            COUNT(*) as total_consultas
-        FROM tabelaconsulta c
-        JOIN tabelamedico m ON c.CodMed = m.CodMed
-        GROUP BY m.CodMed, m.NomeMed, m.Especialidade
-        ORDER BY total_consultas DESC
-        LIMIT 5
-    """)
+    # Consultas: dos rollups quando instalados (ver rollups.py)
+    usa_rollups = rollups.disponivel()
+    hoje = datetime.now().date()
 
-    # Consultas por especialidade (para gráfico)
-    por_especialidade = db.fetch_all("""
-        SELECT 
-            m.Especialidade,
-            COUNT(*) as total
-        FROM tabelaconsulta c
-        JOIN tabelamedico m ON c.CodMed = m.CodMed
-        GROUP BY m.Especialidade
-        ORDER BY total DESC
-        LIMIT 10
-    """)
+    # KPIs principais: todas as contagens numa só consulta (em cache em db.table_counts);
+    # com rollups, o total de consultas vem deles em vez de COUNT(*) em tabelaconsulta
+    tabelas_kpi = KPI_TABLES if not usa_rollups else tuple(t for t in KPI_TABLES if t != 'tabelaconsulta')
+    tarefas = {'contagens': lambda: db.table_counts(tabelas_kpi)}
+    tarefas.update(_tarefas_rollups(hoje) if usa_rollups else _tarefas_agregados(hoje))
+    tarefas.update(_tarefas_proximas())
 
-    # Consultas nos últimos 30 dias (série temporal)
-    # Query compatível com SQLite e MySQL
-    if db.use_sqlite:
-        ultimos_30_dias = db.fetch_all("""
-            SELECT 
-                DATE(Data_Hora) as data,
-                COUNT(*) as total
-            FROM tabelaconsulta
-            WHERE Data_Hora >= datetime('now', '-30 days')
-            GROUP BY DATE(Data_Hora)
-            ORDER BY data
-        """)
-    else:
-        ultimos_30_dias = db.fetch_all("""
-            SELECT 
-                DATE(Data_Hora) as data,
-                COUNT(*) as total
-            FROM tabelaconsulta
-            WHERE Data_Hora >= DATE_SUB(NOW(), INTERVAL 30 DAY)
-            GROUP BY DATE(Data_Hora)
-            ORDER BY data
-        """)
+    # Consultas independentes em paralelo; o que estourar o prazo aparece como indisponível
+    dados, pendentes = fan_out(tarefas, timeout=Config.HOME_DEADLINE, defaults=PADROES)
+    contagens = dados['contagens']
+    stats = {
+        'pacientes': contagens.get('tabelapaciente', '—'),
+        'medicos': contagens.get('tabelamedico', '—'),
+        'clinicas': contagens.get('tabelaclinica', '—'),
+        'consultas': dados['consultas'] if usa_rollups else contagens.get('tabelaconsulta', '—'),
+    }
+    consultas_hoje = dados['consultas_hoje']
+    proximas = dados['proximas']
+    top_medicos = dados['top_medicos']
+    por_especialidade = dados['por_especialidade']
+    ultimos_30_dias = dados['ultimos_30_dias']
 
     # Gráfico de especialidades
     fig_especialidades = go.Figure()
-    if por_especialidade:
+    if not por_especialidade.empty:
         fig_especialidades = px.bar(
-            pd.DataFrame(por_especialidade),
+            por_especialidade,
             x='Especialidade',
             y='total',
             title='Consultas por Especialidade',
@@ -139,10 +204,9 @@ def build_layout():
 
     # Gráfico temporal
     fig_timeline = go.Figure()
-    if ultimos_30_dias:
-        df_timeline = pd.DataFrame(ultimos_30_dias)
+    if not ultimos_30_dias.empty:
         fig_timeline = px.area(
-            df_timeline,
+            ultimos_30_dias,
             x='data',
             y='total',
             title='Consultas nos Últimos 30 Dias',
@@ -170,6 +234,13 @@ def build_layout():
             ], md=4)
         ], className="mb-4 align-items-center"),
 
+        # Aviso de indicadores que estouraram o prazo ou falharam
+        dbc.Alert(
+            f"⏳ Alguns indicadores estão indisponíveis no momento ({', '.join(pendentes)}); "
+            "recarregue a página em instantes.",
+            color="warning", className="py-2"
+        ) if pendentes else html.Div(),
+
         # KPI Cards
         dbc.Row([
             dbc.Col([
@@ -2,10 +2,16 @@
 from dash import html, dcc, callback, callback_context
 import dash_bootstrap_components as dbc
 from dash.dependencies import Input, Output, State, ALL
-import pandas as pd
 from db import db
+from cache import get_cache, make_key
+import search
 import json
 
+# Máximo de médicos listados numa busca (os mais relevantes)
+LIMITE_BUSCA = 200
+
+_cache = get_cache('listagens', ttl=300)
+
 layout = dbc.Container([
     html.H2("Gerenciamento de Médicos", className="mb-4"),
     
@@ -18,7 +24,7 @@ layout = dbc.Container([
     dbc.Row([
         dbc.Col([
             dbc.Input(id="filtro-medico", placeholder="Filtrar por nome ou especialidade...", 
-                     type="text", className="mb-3")
+                     type="text", className="mb-3", debounce=300)
         ], md=6)
     ]),
     
@@ -105,14 +111,12 @@ def atualizar_tabela(filtro, refresh_trigger):
     if not db.ensure_connected():
         return dbc.Alert("Sem conexão com o banco de dados. Verifique o arquivo .env e o serviço MySQL.", color="danger"), "Nenhuma consulta registrada"
 
-    query = "SELECT * FROM tabelamedico"
-    params = None
-    
-    if filtro:
-        query += " WHERE NomeMed LIKE %s OR Especialidade LIKE %s"
-        params = (f"%{filtro}%", f"%{filtro}%")
-    
-    medicos = db.fetch_all(query, params)
+    if search.palavras(filtro):
+        # busca por nome/especialidade no índice de texto, mais relevantes primeiro (ver search.py)
+        medicos = search.buscar('medicos', filtro, limit=LIMITE_BUSCA, colunas_resultado=(
+            'CodMed', 'NomeMed', 'Especialidade', 'Genero', 'Telefone', 'Email'))
+    else:
+        medicos = db.fetch_all("SELECT * FROM tabelamedico")
     
     # Consulta não trivial: média de consultas por médico
     query_media = """
@@ -124,21 +128,27 @@ def atualizar_tabela(filtro, refresh_trigger):
         GROUP BY CodMed
     ) as subconsulta
     """
-    media_result = db.fetch_one(query_media)
+    # não depende do filtro: em cache até a próxima escrita em tabelaconsulta
+    # (uma falha de leitura não vai para o cache: a próxima atualização tenta de novo)
+    try:
+        media_result = _cache.get_or_set(make_key('media_consultas_medico'),
+                                         lambda: db.fetch_one(query_media, raise_errors=True),
+                                         tables=('tabelaconsulta',))
+    except Exception:
+        media_result = None
     media_txt = f"Média: {media_result['media_consultas']:.2f} consultas por médico" if media_result and media_result['media_consultas'] else "Nenhuma consulta registrada"
     
     if not medicos:
         return dbc.Alert("Nenhum m�dico encontrado", color="info"), media_txt
     
-    df = pd.DataFrame(medicos)
-    
     table_header = [html.Thead(html.Tr([
         html.Th("Código"), html.Th("Nome"), html.Th("Especialidade"),
         html.Th("Gênero"), html.Th("Telefone"), html.Th("Email"), html.Th("Ações")
     ]))]
     
     rows = []
-    for _, row in df.iterrows():
+    # linhas renderizadas direto dos dicts: montar um DataFrame só para iterrows() custa caro
+    for row in medicos:
         rows.append(html.Tr([
             html.Td(row['CodMed']),
             html.Td(row['NomeMed']),
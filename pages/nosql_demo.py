@@ -398,67 +398,40 @@ def register_callbacks(app):
         if active_tab != "tab-comparacao":
             return [], [], {}
         
-        # MySQL Stats
+        rotulos = ['Pacientes', 'Médicos', 'Clínicas', 'Consultas']
+        
+        # MySQL Stats (as quatro contagens numa só consulta, em cache por alguns segundos)
+        mysql_counts = None
         try:
-            from db import db
+            from db import db, KPI_TABLES
+            contagens = db.table_counts(KPI_TABLES)
+            mysql_counts = [contagens[tabela] for tabela in KPI_TABLES]
             mysql_stats = dbc.ListGroup([
-                dbc.ListGroupItem([
-                    html.Strong("Pacientes: "),
-                    str(db.fetch_one("SELECT COUNT(*) as total FROM tabelapaciente")['total'])
-                ]),
-                dbc.ListGroupItem([
-                    html.Strong("Médicos: "),
-                    str(db.fetch_one("SELECT COUNT(*) as total FROM tabelamedico")['total'])
-                ]),
-                dbc.ListGroupItem([
-                    html.Strong("Clínicas: "),
-                    str(db.fetch_one("SELECT COUNT(*) as total FROM tabelaclinica")['total'])
-                ]),
-                dbc.ListGroupItem([
-                    html.Strong("Consultas: "),
-                    str(db.fetch_one("SELECT COUNT(*) as total FROM tabelaconsulta")['total'])
-                ])
+                dbc.ListGroupItem([html.Strong(f"{rotulo}: "), str(total)])
+                for rotulo, total in zip(rotulos, mysql_counts)
             ], flush=True)
         except Exception:
             mysql_stats = dbc.Alert("MySQL não disponível", color="warning")
         
-        # Firebase Stats
+        # Firebase Stats (agregações count, em cache por alguns segundos)
         try:
-            from nosql.db_nosql import FirebaseDatabase
-            firebase_db = FirebaseDatabase()
-            firebase_db.connect()
+            from nosql.crud_operations import crud
+            from nosql.db_nosql import firebase_db
+            if not firebase_db.connect():
+                raise ConnectionError("Firebase não conectado")
             
+            stats = crud.estatisticas_gerais()
+            firebase_counts = [stats['total_pacientes'], stats['total_medicos'],
+                               stats['total_clinicas'], stats['total_consultas']]
             firebase_stats = dbc.ListGroup([
-                dbc.ListGroupItem([
-                    html.Strong("Pacientes: "),
-                    str(firebase_db.count_documents('pacientes'))
-                ]),
-                dbc.ListGroupItem([
-                    html.Strong("Médicos: "),
-                    str(firebase_db.count_documents('medicos'))
-                ]),
-                dbc.ListGroupItem([
-                    html.Strong("Clínicas: "),
-                    str(firebase_db.count_documents('clinicas'))
-                ]),
-                dbc.ListGroupItem([
-                    html.Strong("Consultas: "),
-                    str(firebase_db.count_documents('consultas'))
-                ])
+                dbc.ListGroupItem([html.Strong(f"{rotulo}: "), str(total)])
+                for rotulo, total in zip(rotulos, firebase_counts)
             ], flush=True)
             
             # Gráfico comparativo
             fig = go.Figure(data=[
-                go.Bar(name='MySQL', x=['Pacientes', 'Médicos', 'Clínicas', 'Consultas'],
-                       y=[db.fetch_one("SELECT COUNT(*) as total FROM tabelapaciente")['total'],
-                          db.fetch_one("SELECT COUNT(*) as total FROM tabelamedico")['total'],
-                          db.fetch_one("SELECT COUNT(*) as total FROM tabelaclinica")['total'],
-                          db.fetch_one("SELECT COUNT(*) as total FROM tabelaconsulta")['total']]),
-                go.Bar(name='Firebase', x=['Pacientes', 'Médicos', 'Clínicas', 'Consultas'],
-                       y=[firebase_db.count_documents('pacientes'),
-                          firebase_db.count_documents('medicos'),
-                          firebase_db.count_documents('clinicas'),
-                          firebase_db.count_documents('consultas')])
+                go.Bar(name='MySQL', x=rotulos, y=mysql_counts or [0, 0, 0, 0]),
+                go.Bar(name='Firebase', x=rotulos, y=firebase_counts)
             ])
             fig.update_layout(title="Comparação de Dados: MySQL vs Firebase", barmode='group')
             
@@ -693,8 +666,9 @@ def register_callbacks(app):
             
             # Iniciar migração em thread separada
             def run_migration():
+                from nosql.config_nosql import FirebaseConfig
                 migration = MySQLToFirestoreMigration()
-                migration.migrar_tudo(limite_consultas=100)
+                migration.migrar_tudo(limite_consultas=FirebaseConfig.MIGRATION_LIMIT)
             
             thread = threading.Thread(target=run_migration, daemon=True)
             thread.start()
@@ -772,7 +746,10 @@ def register_callbacks(app):
                     ], flush=True, className="mt-3"),
                     html.Hr(),
                     html.P([
-                        html.Strong(f"Total: {pacientes['migrados'] + medicos['migrados'] + clinicas['migrados'] + consultas['migrados']} registros migrados")
+                        html.Strong(f"Total: {pacientes['migrados'] + medicos['migrados'] + clinicas['migrados'] + consultas['migrados']} registros migrados"),
+                        html.Br(),
+                        html.Small(f"{progress.get('elapsed', 0):.1f}s · {progress.get('throughput', 0):.0f} docs/s",
+                                   className="text-muted")
                     ], className="mb-0")
                 ], color="success" if sucesso else "warning")
                 
@@ -856,6 +833,9 @@ def register_callbacks(app):
                     html.P([
                         html.Strong(f"Total migrado: {total_migrado} registros"),
                         html.Br(),
+                        html.Small(f"{progress.get('elapsed', 0):.0f}s decorridos · "
+                                   f"{progress.get('throughput', 0):.0f} docs/s", className="text-muted"),
+                        html.Br(),
                         html.Small("Aguarde enquanto os dados são transferidos...", className="text-muted")
                     ], className="mb-0")
                 ])
@@ -2,10 +2,31 @@
 from dash import html, dcc, callback, callback_context, dash_table
 import dash_bootstrap_components as dbc
 from dash.dependencies import Input, Output, State, ALL
-import pandas as pd
 from db import db
+import search
+from cache import get_cache, make_key
+from datatable_sql import buscar_pagina, filtro_para_sql, ordenacao_para_sql, where_sql
 import json
 
+# Linhas por página da tabela (só a página visível sai do banco)
+PAGE_SIZE = 10
+
+# Colunas da tabela e expressões SQL aceitas em filtro/ordenação
+COLUNAS = {
+    'CpfPaciente': 'CpfPaciente',
+    'NomePac': 'NomePac',
+    'DataNascimento': 'DataNascimento',
+    'Genero': 'Genero',
+    'Telefone': 'Telefone',
+    'Email': 'Email',
+}
+
+# Colunas que admitem NULL (a paginação por chave precisa saber)
+ANULAVEIS = ('DataNascimento', 'Genero', 'Telefone', 'Email')
+
+# Totais por filtro (a escrita em tabelapaciente invalida, ver cache.py)
+_cache = get_cache('listagens', ttl=300)
+
 layout = dbc.Container([
     html.H2("Gerenciamento de Pacientes", className="mb-4"),
     
@@ -21,11 +42,40 @@ layout = dbc.Container([
     
     dbc.Row([
         dbc.Col([
-            dbc.Input(id="filtro-paciente", placeholder="Filtrar por nome...", type="text", className="mb-3 table-search", debounce=True)
+            dbc.Input(id="filtro-paciente", placeholder="Filtrar por nome...", type="text", className="mb-3 table-search", debounce=300)
         ], md=6)
     ]),
     
-    html.Div(id="tabela-pacientes"),
+    html.Div(className='data-table-container', children=[
+        dash_table.DataTable(
+            id='pacientes-datatable',
+            columns=[
+                {"name": "CPF", "id": "CpfPaciente"},
+                {"name": "Nome", "id": "NomePac"},
+                {"name": "Data Nasc.", "id": "DataNascimento"},
+                {"name": "Gênero", "id": "Genero"},
+                {"name": "Telefone", "id": "Telefone"},
+                {"name": "Email", "id": "Email"},
+            ],
+            data=[],
+            # filtro, ordenação e paginação feitos no banco (atualizar_tabela)
+            page_action='custom',
+            page_current=0,
+            page_size=PAGE_SIZE,
+            page_count=1,
+            sort_action='custom',
+            sort_mode='single',
+            sort_by=[],
+            filter_action='custom',
+            filter_query='',
+            style_table={'overflowX': 'auto'},
+            row_selectable='single',
+            selected_rows=[],
+            style_cell={'textAlign': 'left', 'padding': '6px'},
+            style_header={'fontWeight': 'bold'},
+        )
+    ]),
+    html.Div(id="tabela-pacientes", className="text-muted small mt-2"),
     
     dbc.Modal([
         dbc.ModalHeader(dbc.ModalTitle(id="modal-paciente-titulo")),
@@ -86,57 +136,86 @@ layout = dbc.Container([
     dcc.Store(id='store-paciente-acao'),
     dcc.Store(id='store-cpf-delete'),
     dcc.Store(id='store-refresh-trigger', data=0),
+    # cursores da paginação por chave: {'assinatura': filtro+ordem, 'cursores': {página: token}}
+    dcc.Store(id='store-pacientes-cursores', data={}),
     html.Div(id="alert-paciente")
 ], fluid=True)
 
+def _total_pacientes(where, params):
+    """Total de pacientes do filtro atual (sem filtro, vem de db.table_counts)"""
+    if not where:
+        return db.table_counts(('tabelapaciente',)).get('tabelapaciente', 0)
+    try:
+        return _cache.get_or_set(
+            make_key('pacientes_total', where, tuple(params)),
+            lambda: (db.fetch_one(f"SELECT COUNT(*) as total FROM tabelapaciente{where}", params,
+                                  raise_errors=True) or {}).get('total', 0),
+            tables=('tabelapaciente',))
+    except Exception:
+        # erro já registrado por db; o zero não vai para o cache
+        return 0
+
+
+def carregar_pagina(page_current, page_size, sort_by, filter_query, filtro, estado):
+    """
+    Página ``page_current`` com o filtro do DataTable, a busca por nome e a ordenação.
+
+    Returns:
+        Tuple: (linhas, total, page_count, página efetiva, novo estado dos cursores)
+    """
+    condicoes, params = filtro_para_sql(filter_query, COLUNAS)
+    # busca por nome no índice de texto (FULLTEXT/FTS5, ver search.py)
+    busca, busca_params = search.condicao('pacientes', filtro)
+    if busca:
+        condicoes.insert(0, busca)
+        params[:0] = busca_params
+    where = where_sql(condicoes)
+
+    total = _total_pacientes(where, params)
+    page_count = max(1, -(-total // page_size))
+    page_current = min(page_current or 0, page_count - 1)
+
+    ordem = ordenacao_para_sql(sort_by, COLUNAS, desempate=('CpfPaciente',)) if sort_by else ['NomePac ASC', 'CpfPaciente ASC']
+    query = f"SELECT {', '.join(COLUNAS.values())} FROM tabelapaciente{where}"
+    pacientes, estado = buscar_pagina(query, params, ordem, page_current, page_size, estado, nullable=ANULAVEIS)
+    return pacientes, total, page_count, page_current, estado
+
+
 @callback(
+    Output('pacientes-datatable', 'data'),
+    Output('pacientes-datatable', 'page_count'),
+    Output('pacientes-datatable', 'page_current'),
+    Output('pacientes-datatable', 'selected_rows'),
     Output("tabela-pacientes", "children"),
+    Output('store-pacientes-cursores', 'data'),
+    Input('pacientes-datatable', 'page_current'),
+    Input('pacientes-datatable', 'page_size'),
+    Input('pacientes-datatable', 'sort_by'),
+    Input('pacientes-datatable', 'filter_query'),
     Input("filtro-paciente", "value"),
-    Input("store-refresh-trigger", "data")
+    Input("store-refresh-trigger", "data"),
+    State('store-pacientes-cursores', 'data')
 )
-def atualizar_tabela(filtro, refresh_trigger):
+def atualizar_tabela(page_current, page_size, sort_by, filter_query, filtro, refresh_trigger, estado):
     # Se não conectado, retornar alerta informativo
     if not db.ensure_connected():
-        return dbc.Alert("Sem conexão com o banco de dados. Verifique o arquivo .env e o serviço MySQL.", color="danger")
-    query = "SELECT * FROM tabelapaciente"
-    params = None
-    
-    if filtro:
-        query += " WHERE NomePac LIKE %s"
-        params = (f"%{filtro}%",)
-    
-    pacientes = db.fetch_all(query, params)
-    
-    if not pacientes:
-        return dbc.Alert("Nenhum paciente encontrado", color="info")
-    
-    df = pd.DataFrame(pacientes)
+        return [], 1, 0, [], dbc.Alert("Sem conexão com o banco de dados. Verifique o arquivo .env e o serviço MySQL.", color="danger"), {}
 
-    # DataTable provides native filtering/sorting for a friendlier search experience
-    columns = [
-        {"name": "CPF", "id": "CpfPaciente"},
-        {"name": "Nome", "id": "NomePac"},
-        {"name": "Data Nasc.", "id": "DataNascimento"},
-        {"name": "Gênero", "id": "Genero"},
-        {"name": "Telefone", "id": "Telefone"},
-        {"name": "Email", "id": "Email"},
-    ]
+    page_size = page_size or PAGE_SIZE
+    # filtro ou ordenação novos voltam à primeira página
+    disparos = callback_context.triggered_prop_ids
+    if any(p in disparos for p in ('filtro-paciente.value', 'pacientes-datatable.sort_by',
+                                   'pacientes-datatable.filter_query')):
+        page_current = 0
+    pacientes, total, page_count, page_current, estado = carregar_pagina(
+        page_current, page_size, sort_by, filter_query, filtro, estado)
 
-    table = dash_table.DataTable(
-        id='pacientes-datatable',
-        columns=columns,
-        data=df.to_dict('records'),
-        filter_action='native',
-        sort_action='native',
-        page_size=10,
-        style_table={'overflowX': 'auto'},
-        row_selectable='single',
-        selected_rows=[],
-        style_cell={'textAlign': 'left', 'padding': '6px'},
-        style_header={'fontWeight': 'bold'},
-    )
+    if not pacientes:
+        return [], page_count, page_current, [], dbc.Alert("Nenhum paciente encontrado", color="info"), estado
 
-    return html.Div(className='data-table-container', children=[table])
+    inicio = page_current * page_size
+    info = f"Exibindo {inicio + 1}–{inicio + len(pacientes)} de {total} paciente(s)"
+    return pacientes, page_count, page_current, [], info, estado
 
 @callback(
     Output("modal-paciente", "is_open"),
@@ -1,12 +1,29 @@
 # -*- coding: utf-8 -*-
 """
 Script otimizado para popular MySQL com validação de integridade
+
+Uso:
+    python populate_mysql.py                                   # volume de demonstração
+    python populate_mysql.py --pacientes 1_000_000 --consultas 10_000_000 --batch-size 5000
+    python populate_mysql.py --pacientes 1_000_000 --load-data # LOAD DATA LOCAL INFILE
+    python populate_mysql.py --workers 8 --seed 7 --data-referencia 2025-01-01   # dataset reproduzível
+    python populate_mysql.py --sqlite                          # grava no SQLite de fallback
+
+A geração roda num pool de processos (um chunk por tarefa, semente determinística
+por chunk) e um único escritor grava os chunks em ordem no banco.
 """
 from faker import Faker
+import argparse
+import multiprocessing
+import os
 import random
-from datetime import datetime, timedelta
+import tempfile
+import time
+from collections import deque
+from datetime import date, datetime, timedelta
 import mysql.connector
 from config import Config
+import rollups
 import logging
 
 logging.basicConfig(level=logging.INFO)
@@ -27,7 +44,13 @@ CLINICAS_NOMES = [
     'Clínica Bem Estar', 'Hospital Coração de Jesus', 'Centro Médico Excellence'
 ]
 
-def get_connection():
+# Tamanhos padrão de lote: linhas por INSERT multi-VALUES e linhas por COMMIT
+BATCH_SIZE = 1000
+COMMIT_EVERY = 10000
+# Linhas geradas por tarefa do pool de processos
+CHUNK_SIZE = 10000
+
+def get_connection(allow_local_infile=False):
     """Conecta ao MySQL"""
     try:
         conn = mysql.connector.connect(
@@ -36,7 +59,8 @@ def get_connection():
             user=Config.DB_USER,
             password=Config.DB_PASSWORD,
             database=Config.DB_NAME,
-            autocommit=False
+            autocommit=False,
+            allow_local_infile=allow_local_infile
         )
         logger.info(f"✅ Conectado ao MySQL {Config.DB_NAME}")
         return conn
@@ -44,17 +68,32 @@ def get_connection():
         logger.error(f"❌ Erro ao conectar: {e}")
         return None
 
-def limpar_banco(conn):
+def get_sqlite_connection():
+    """Abre o SQLite de fallback (Config.SQLITE_PATH) com o esquema de demonstração do app"""
+    from db import Database
+    conn = Database()._connect_sqlite()
+    conn.row_factory = None
+    # carga em massa: durabilidade de cada COMMIT não importa aqui
+    conn.execute("PRAGMA synchronous = OFF")
+    return conn
+
+def limpar_banco(conn, sqlite=False):
     """Limpa todas as tabelas"""
     logger.info("🗑️  Limpando banco de dados...")
     cursor = conn.cursor()
     try:
-        cursor.execute("SET FOREIGN_KEY_CHECKS = 0")
-        cursor.execute("TRUNCATE TABLE tabelaconsulta")
-        cursor.execute("TRUNCATE TABLE tabelapaciente")
-        cursor.execute("TRUNCATE TABLE tabelamedico")
-        cursor.execute("TRUNCATE TABLE tabelaclinica")
-        cursor.execute("SET FOREIGN_KEY_CHECKS = 1")
+        if sqlite:
+            for tabela in ('tabelaconsulta', 'tabelapaciente', 'tabelamedico', 'tabelaclinica'):
+                cursor.execute(f"DELETE FROM {tabela}")
+        else:
+            cursor.execute("SET FOREIGN_KEY_CHECKS = 0")
+            cursor.execute("TRUNCATE TABLE tabelaconsulta")
+            cursor.execute("TRUNCATE TABLE tabelapaciente")
+            cursor.execute("TRUNCATE TABLE tabelamedico")
+            cursor.execute("TRUNCATE TABLE tabelaclinica")
+            cursor.execute("SET FOREIGN_KEY_CHECKS = 1")
+        # TRUNCATE não dispara os triggers de rollup; a carga a seguir os repõe
+        rollups.limpar(conn, sqlite)
         conn.commit()
         logger.info("✅ Banco limpo")
     except Exception as e:
@@ -63,183 +102,400 @@ def limpar_banco(conn):
     finally:
         cursor.close()
 
-def generate_cpf():
-    return ''.join([str(random.randint(0, 9)) for _ in range(11)])
+def codigo_unico(indice, digitos, seed):
+    """
+    Código de ``digitos`` dígitos para o ``indice``-ésimo registro.
 
-def generate_cod_medico():
-    return ''.join([str(random.randint(0, 9)) for _ in range(7)])
+    (indice * A + B) mod 10^digitos é uma permutação quando A é primo com 10,
+    então índices distintos nunca colidem e cada worker gera seus códigos sem
+    coordenação nem conjunto de já-vistos.
+    """
+    modulo = 10 ** digitos
+    deslocamento = (seed * 2654435761 + digitos) % modulo
+    return f"{(indice * 7654321123 + deslocamento) % modulo:0{digitos}d}"
 
-def generate_cod_clinica():
-    return ''.join([str(random.randint(0, 9)) for _ in range(6)])
+def generate_cpf(indice, seed):
+    return codigo_unico(indice, 11, seed)
 
-def popular_pacientes(conn, quantidade=200):
-    """Popula pacientes"""
-    logger.info(f"👥 Inserindo {quantidade} pacientes...")
-    cursor = conn.cursor()
-    cpfs = []
-    sucesso = 0
-    
-    for i in range(quantidade):
-        cpf = generate_cpf()
-        while cpf in cpfs:
-            cpf = generate_cpf()
-        
-        nome = fake.name()
-        data_nasc = fake.date_of_birth(minimum_age=1, maximum_age=95)
-        genero = random.choice(['M', 'F'])
-        telefone = fake.phone_number()[:20]  # Limita tamanho
-        email = fake.email()[:100]
-        
-        try:
-            cursor.execute("""
-                INSERT INTO tabelapaciente (CpfPaciente, NomePac, DataNascimento, Genero, Telefone, Email)
-                VALUES (%s, %s, %s, %s, %s, %s)
-            """, (cpf, nome, data_nasc, genero, telefone, email))
-            cpfs.append(cpf)
-            sucesso += 1
-        except Exception as e:
-            logger.warning(f"Erro ao inserir paciente {cpf}: {e}")
-        
-        if (i + 1) % 50 == 0:
-            conn.commit()
-            logger.info(f"  {i + 1}/{quantidade} pacientes processados...")
-    
-    conn.commit()
-    cursor.close()
-    logger.info(f"✅ {sucesso}/{quantidade} pacientes inseridos")
-    return cpfs
+def generate_cod_medico(indice, seed):
+    return codigo_unico(indice, 7, seed)
 
-def popular_medicos(conn, quantidade=80):
-    """Popula médicos"""
-    logger.info(f"⚕️  Inserindo {quantidade} médicos...")
-    cursor = conn.cursor()
-    codigos = []
-    sucesso = 0
-    
-    for i in range(quantidade):
-        cod = generate_cod_medico()
-        while cod in codigos:
-            cod = generate_cod_medico()
-        
-        nome = fake.name()
-        genero = random.choice(['M', 'F'])
-        telefone = fake.phone_number()[:20]
-        email = fake.email()[:100]
-        especialidade = random.choice(ESPECIALIDADES)
-        
-        try:
-            cursor.execute("""
-                INSERT INTO tabelamedico (CodMed, NomeMed, Genero, Telefone, Email, Especialidade)
-                VALUES (%s, %s, %s, %s, %s, %s)
-            """, (cod, nome, genero, telefone, email, especialidade))
-            codigos.append(cod)
-            sucesso += 1
-        except Exception as e:
-            logger.warning(f"Erro ao inserir médico {cod}: {e}")
-        
-        if (i + 1) % 20 == 0:
-            conn.commit()
-            logger.info(f"  {i + 1}/{quantidade} médicos processados...")
-    
-    conn.commit()
-    cursor.close()
-    logger.info(f"✅ {sucesso}/{quantidade} médicos inseridos")
-    return codigos
+def generate_cod_clinica(indice, seed):
+    return codigo_unico(indice, 6, seed)
 
-def popular_clinicas(conn, quantidade=12):
-    """Popula clínicas"""
-    logger.info(f"🏥 Inserindo {quantidade} clínicas...")
+def _insert_sql(tabela, colunas, ignorar_duplicados=False, sqlite=False):
+    placeholders = ', '.join(['?' if sqlite else '%s'] * len(colunas))
+    if sqlite:
+        ignore = 'OR IGNORE ' if ignorar_duplicados else ''
+    else:
+        ignore = 'IGNORE ' if ignorar_duplicados else ''
+    return f"INSERT {ignore}INTO {tabela} ({', '.join(colunas)}) VALUES ({placeholders})"
+
+def inserir_em_lote(conn, tabela, colunas, linhas, total, batch_size=BATCH_SIZE,
+                    commit_every=COMMIT_EVERY, ignorar_duplicados=False, rotulo='linhas',
+                    sqlite=False):
+    """
+    Insere ``linhas`` (iterável de tuplas) em lotes com executemany, que o driver
+    reescreve como um único INSERT multi-VALUES por lote.
+
+    Se um lote falhar (ex.: trigger rejeitando uma linha), ele é refeito linha a
+    linha para que só as linhas inválidas fiquem de fora.
+
+    Returns:
+        int: linhas inseridas
+    """
+    sql = _insert_sql(tabela, colunas, ignorar_duplicados, sqlite)
     cursor = conn.cursor()
-    codigos = []
     sucesso = 0
-    
-    for i in range(min(quantidade, len(CLINICAS_NOMES))):
-        cod = generate_cod_clinica()
-        while cod in codigos:
-            cod = generate_cod_clinica()
-        
-        nome = CLINICAS_NOMES[i]
-        endereco = fake.address().replace('\n', ', ')[:200]
-        telefone = fake.phone_number()[:20]
-        email = fake.company_email()[:100]
-        
+    processadas = 0
+    desde_commit = 0
+    lote = []
+
+    def enviar(lote):
         try:
-            cursor.execute("""
-                INSERT INTO tabelaclinica (CodCli, NomeCli, Endereco, Telefone, Email)
-                VALUES (%s, %s, %s, %s, %s)
-            """, (cod, nome, endereco, telefone, email))
-            codigos.append(cod)
-            sucesso += 1
+            cursor.executemany(sql, lote)
+            return cursor.rowcount if cursor.rowcount >= 0 else len(lote)
         except Exception as e:
-            logger.warning(f"Erro ao inserir clínica {cod}: {e}")
-    
+            logger.warning(f"Lote de {len(lote)} {rotulo} falhou ({e}); inserindo linha a linha")
+            inseridas = 0
+            for linha in lote:
+                try:
+                    cursor.execute(sql, linha)
+                    inseridas += cursor.rowcount
+                except Exception as e_linha:
+                    if "Duplicate entry" not in str(e_linha) and "UNIQUE constraint" not in str(e_linha):
+                        logger.warning(f"Erro ao inserir em {tabela}: {e_linha}")
+            return inseridas
+
+    inicio = time.perf_counter()
+    for linha in linhas:
+        lote.append(linha)
+        if len(lote) >= batch_size:
+            sucesso += enviar(lote)
+            processadas += len(lote)
+            desde_commit += len(lote)
+            lote = []
+            if desde_commit >= commit_every:
+                conn.commit()
+                desde_commit = 0
+                taxa = processadas / max(time.perf_counter() - inicio, 1e-9)
+                logger.info(f"  {processadas}/{total} {rotulo} processados ({taxa:,.0f}/s)...")
+    if lote:
+        sucesso += enviar(lote)
+        processadas += len(lote)
     conn.commit()
     cursor.close()
-    logger.info(f"✅ {sucesso}/{quantidade} clínicas inseridas")
-    return codigos
+    return sucesso
 
-def popular_consultas(conn, cpfs, codigos_med, codigos_cli, quantidade=1500):
-    """Popula consultas"""
-    logger.info(f"📅 Inserindo {quantidade} consultas...")
+def carregar_via_arquivo(conn, tabela, colunas, linhas, ignorar_duplicados=False):
+    """
+    Grava ``linhas`` num arquivo temporário TSV e carrega com LOAD DATA LOCAL INFILE
+    (requer ``local_infile=ON`` no servidor e conexão com allow_local_infile=True).
+
+    Returns:
+        int: linhas inseridas
+    """
+    with tempfile.NamedTemporaryFile('w', suffix='.tsv', delete=False, encoding='utf-8', newline='') as f:
+        caminho = f.name
+        for linha in linhas:
+            f.write('\t'.join('\\N' if v is None else str(v).replace('\\', '\\\\').replace('\t', ' ').replace('\n', ' ')
+                              for v in linha))
+            f.write('\n')
     cursor = conn.cursor()
-    data_inicial = datetime.now() - timedelta(days=60)
-    sucesso = 0
-    
-    for i in range(quantidade):
-        cpf = random.choice(cpfs)
-        cod_med = random.choice(codigos_med)
-        cod_cli = random.choice(codigos_cli)
+    try:
+        ignore = 'IGNORE ' if ignorar_duplicados else ''
+        cursor.execute(
+            f"LOAD DATA LOCAL INFILE %s {ignore}INTO TABLE {tabela} "
+            f"CHARACTER SET utf8mb4 FIELDS TERMINATED BY '\\t' LINES TERMINATED BY '\\n' "
+            f"({', '.join(colunas)})",
+            (caminho,)
+        )
+        inseridas = cursor.rowcount
+        conn.commit()
+        return inseridas
+    finally:
+        cursor.close()
+        os.unlink(caminho)
+
+def _colunas_sqlite(conn, tabela):
+    return {linha[1] for linha in conn.execute(f"PRAGMA table_info({tabela})")}
+
+def _gravar(conn, tabela, colunas, linhas, total, opcoes, rotulo, ignorar_duplicados=False):
+    sqlite = opcoes.get('sqlite', False)
+    if sqlite:
+        # o esquema de demonstração do SQLite tem menos colunas (ex.: clínica sem contato)
+        existentes = _colunas_sqlite(conn, tabela)
+        indices = [i for i, c in enumerate(colunas) if c in existentes]
+        if len(indices) < len(colunas):
+            colunas = tuple(colunas[i] for i in indices)
+            linhas = (tuple(linha[i] for i in indices) for linha in linhas)
+    elif opcoes.get('via_arquivo'):
+        return carregar_via_arquivo(conn, tabela, colunas, linhas, ignorar_duplicados)
+    return inserir_em_lote(conn, tabela, colunas, linhas, total,
+                           batch_size=opcoes.get('batch_size', BATCH_SIZE),
+                           commit_every=opcoes.get('commit_every', COMMIT_EVERY),
+                           ignorar_duplicados=ignorar_duplicados, rotulo=rotulo, sqlite=sqlite)
+
+# ---------------------------------------------------------------------------
+# Geradores por chunk (executados nos workers)
+#
+# Cada tarefa é (seed, chunk, inicio, fim, referencia). O gerador do chunk é
+# semeado com (seed, estágio, chunk), então o dataset depende só de --seed,
+# --chunk-size e --data-referencia, nunca do número de workers.
+# ---------------------------------------------------------------------------
+
+def _geradores(seed, estagio, chunk):
+    semente = f"{seed}:{estagio}:{chunk}"
+    fake.seed_instance(semente)
+    return random.Random(semente), fake
+
+def gerar_pacientes(tarefa):
+    seed, chunk, inicio, fim, referencia = tarefa
+    t0 = time.perf_counter()
+    rnd, fk = _geradores(seed, 'pacientes', chunk)
+    linhas = []
+    for i in range(inicio, fim):
+        cpf = generate_cpf(i, seed)
+        nome = fk.name()
+        data_nasc = referencia - timedelta(days=rnd.randint(365, 95 * 365))
+        genero = rnd.choice(['M', 'F'])
+        telefone = fk.phone_number()[:20]  # Limita tamanho
+        email = fk.email()[:100]
+        linhas.append((cpf, nome, data_nasc, genero, telefone, email))
+    return linhas, time.perf_counter() - t0
+
+def gerar_medicos(tarefa):
+    seed, chunk, inicio, fim, referencia = tarefa
+    t0 = time.perf_counter()
+    rnd, fk = _geradores(seed, 'medicos', chunk)
+    linhas = []
+    for i in range(inicio, fim):
+        cod = generate_cod_medico(i, seed)
+        nome = fk.name()
+        genero = rnd.choice(['M', 'F'])
+        telefone = fk.phone_number()[:20]
+        email = fk.email()[:100]
+        especialidade = rnd.choice(ESPECIALIDADES)
+        linhas.append((cod, nome, genero, telefone, email, especialidade))
+    return linhas, time.perf_counter() - t0
+
+def nome_clinica(i):
+    """Nomes da lista fixa; acima dela, numera as repetições"""
+    base = CLINICAS_NOMES[i % len(CLINICAS_NOMES)]
+    rodada = i // len(CLINICAS_NOMES)
+    return base if rodada == 0 else f"{base} {rodada + 1}"
+
+def gerar_clinicas(tarefa):
+    seed, chunk, inicio, fim, referencia = tarefa
+    t0 = time.perf_counter()
+    rnd, fk = _geradores(seed, 'clinicas', chunk)
+    linhas = []
+    for i in range(inicio, fim):
+        cod = generate_cod_clinica(i, seed)
+        nome = nome_clinica(i)
+        endereco = fk.address().replace('\n', ', ')[:200]
+        telefone = fk.phone_number()[:20]
+        email = fk.company_email()[:100]
+        linhas.append((cod, nome, endereco, telefone, email))
+    return linhas, time.perf_counter() - t0
+
+def gerar_consultas(tarefa):
+    """Consultas referenciam pacientes/médicos/clínicas pelo índice, sem consultar o banco"""
+    seed, chunk, inicio, fim, referencia, n_pacientes, n_medicos, n_clinicas = tarefa
+    t0 = time.perf_counter()
+    rnd, _ = _geradores(seed, 'consultas', chunk)
+    data_inicial = datetime.combine(referencia, datetime.min.time()) - timedelta(days=60)
+    linhas = []
+    for _ in range(inicio, fim):
+        cpf = generate_cpf(rnd.randrange(n_pacientes), seed)
+        cod_med = generate_cod_medico(rnd.randrange(n_medicos), seed)
+        cod_cli = generate_cod_clinica(rnd.randrange(n_clinicas), seed)
         
-        dias_offset = random.randint(0, 120)
+        dias_offset = rnd.randint(0, 120)
         data = data_inicial + timedelta(days=dias_offset)
         
-        if random.random() < 0.7:
+        if rnd.random() < 0.7:
             while data.weekday() >= 5:
                 data += timedelta(days=1)
         
-        hora = random.randint(8, 17)
-        minuto = random.choice([0, 15, 30, 45])
-        data_hora = data.replace(hour=hora, minute=minuto, second=0, microsecond=0)
-        
-        try:
-            cursor.execute("""
-                INSERT INTO tabelaconsulta (CodCli, CodMed, CpfPaciente, Data_Hora)
-                VALUES (%s, %s, %s, %s)
-            """, (cod_cli, cod_med, cpf, data_hora))
-            sucesso += 1
-        except Exception as e:
-            if "Duplicate entry" not in str(e):
-                logger.warning(f"Erro ao inserir consulta: {e}")
-        
-        if (i + 1) % 100 == 0:
-            conn.commit()
-            logger.info(f"  {i + 1}/{quantidade} consultas processadas...")
-    
-    conn.commit()
-    cursor.close()
-    logger.info(f"✅ {sucesso}/{quantidade} consultas inseridas")
+        hora = rnd.randint(8, 17)
+        minuto = rnd.choice([0, 15, 30, 45])
+        data_hora = data.replace(hour=hora, minute=minuto)
+        linhas.append((cod_cli, cod_med, cpf, data_hora))
+    return linhas, time.perf_counter() - t0
+
+def _tarefas(total, opcoes, *extra):
+    chunk_size = opcoes.get('chunk_size', CHUNK_SIZE)
+    seed = opcoes.get('seed', 42)
+    referencia = opcoes.get('referencia') or date.today()
+    return [(seed, chunk, inicio, min(inicio + chunk_size, total), referencia) + extra
+            for chunk, inicio in enumerate(range(0, total, chunk_size))]
+
+def _em_ordem(pool, func, tarefas, max_pendentes):
+    """
+    Resultados na ordem das tarefas, com no máximo ``max_pendentes`` chunks em voo,
+    para o gerador não acumular memória quando a escrita é o gargalo.
+    """
+    if pool is None:
+        for tarefa in tarefas:
+            yield func(tarefa)
+        return
+    pendentes = deque()
+    for tarefa in tarefas:
+        pendentes.append(pool.apply_async(func, (tarefa,)))
+        if len(pendentes) >= max_pendentes:
+            yield pendentes.popleft().get()
+    while pendentes:
+        yield pendentes.popleft().get()
+
+def executar_estagio(conn, pool, rotulo, tabela, colunas, func, tarefas, total, opcoes,
+                     ignorar_duplicados=False):
+    """
+    Gera os chunks no pool e os grava pelo escritor único (esta conexão).
+
+    Returns:
+        dict: linhas, tempos e throughput (linhas/s) de geração e de escrita
+    """
+    medidas = {'geracao': 0.0, 'espera': 0.0}
+
+    def linhas():
+        resultados = _em_ordem(pool, func, tarefas, opcoes.get('max_pendentes', 4))
+        while True:
+            t0 = time.perf_counter()
+            try:
+                chunk, duracao = next(resultados)
+            except StopIteration:
+                return
+            medidas['espera'] += time.perf_counter() - t0
+            medidas['geracao'] += duracao
+            yield from chunk
+
+    inicio = time.perf_counter()
+    sucesso = _gravar(conn, tabela, colunas, linhas(), total, opcoes, rotulo, ignorar_duplicados)
+    parede = time.perf_counter() - inicio
+    # tempo de escrita = tempo total menos o tempo parado esperando chunks do pool
+    escrita = max(parede - medidas['espera'], 1e-9)
+    stats = {
+        'estagio': rotulo,
+        'linhas': sucesso,
+        'geradas': total,
+        'tempo': parede,
+        'geracao_linhas_s': total / medidas['geracao'] if medidas['geracao'] else 0.0,
+        'escrita_linhas_s': sucesso / escrita,
+        'total_linhas_s': sucesso / parede if parede else 0.0,
+    }
+    logger.info(f"✅ {sucesso}/{total} {rotulo} inseridos em {parede:.1f}s "
+                f"(geração {stats['geracao_linhas_s']:,.0f}/s por worker, "
+                f"escrita {stats['escrita_linhas_s']:,.0f}/s, total {stats['total_linhas_s']:,.0f}/s)")
+    return stats
+
+def popular_pacientes(conn, quantidade=200, pool=None, **opcoes):
+    """Popula pacientes"""
+    logger.info(f"👥 Inserindo {quantidade} pacientes...")
+    tarefas = _tarefas(quantidade, opcoes)
+    return executar_estagio(conn, pool, 'pacientes', 'tabelapaciente',
+                            ('CpfPaciente', 'NomePac', 'DataNascimento', 'Genero', 'Telefone', 'Email'),
+                            gerar_pacientes, tarefas, quantidade, opcoes)
+
+def popular_medicos(conn, quantidade=80, pool=None, **opcoes):
+    """Popula médicos"""
+    logger.info(f"⚕️  Inserindo {quantidade} médicos...")
+    tarefas = _tarefas(quantidade, opcoes)
+    return executar_estagio(conn, pool, 'médicos', 'tabelamedico',
+                            ('CodMed', 'NomeMed', 'Genero', 'Telefone', 'Email', 'Especialidade'),
+                            gerar_medicos, tarefas, quantidade, opcoes)
+
+def popular_clinicas(conn, quantidade=12, pool=None, **opcoes):
+    """Popula clínicas"""
+    logger.info(f"🏥 Inserindo {quantidade} clínicas...")
+    tarefas = _tarefas(quantidade, opcoes)
+    return executar_estagio(conn, pool, 'clínicas', 'tabelaclinica',
+                            ('CodCli', 'NomeCli', 'Endereco', 'Telefone', 'Email'),
+                            gerar_clinicas, tarefas, quantidade, opcoes)
+
+def popular_consultas(conn, n_pacientes, n_medicos, n_clinicas, quantidade=1500, pool=None, **opcoes):
+    """Popula consultas (duplicatas da PK composta são ignoradas pelo INSERT IGNORE)"""
+    logger.info(f"📅 Inserindo {quantidade} consultas...")
+    tarefas = _tarefas(quantidade, opcoes, n_pacientes, n_medicos, n_clinicas)
+    return executar_estagio(conn, pool, 'consultas', 'tabelaconsulta',
+                            ('CodCli', 'CodMed', 'CpfPaciente', 'Data_Hora'),
+                            gerar_consultas, tarefas, quantidade, opcoes, ignorar_duplicados=True)
+
+def _data(valor):
+    return datetime.strptime(valor, '%Y-%m-%d').date()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Popular MySQL com dados artificiais')
+    parser.add_argument('--pacientes', type=int, default=200, help='Quantidade de pacientes (padrão: 200)')
+    parser.add_argument('--medicos', type=int, default=80, help='Quantidade de médicos (padrão: 80)')
+    parser.add_argument('--clinicas', type=int, default=12, help='Quantidade de clínicas (padrão: 12)')
+    parser.add_argument('--consultas', type=int, default=1500, help='Quantidade de consultas (padrão: 1500)')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                        help=f'Linhas por INSERT multi-VALUES (padrão: {BATCH_SIZE})')
+    parser.add_argument('--commit-every', type=int, default=COMMIT_EVERY,
+                        help=f'Linhas entre COMMITs (padrão: {COMMIT_EVERY})')
+    parser.add_argument('--load-data', action='store_true',
+                        help='Carregar via LOAD DATA LOCAL INFILE a partir de arquivo temporário')
+    parser.add_argument('--sem-limpar', action='store_true', help='Não truncar as tabelas antes de popular')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='Processos geradores (padrão: nº de CPUs; 1 = sem pool)')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                        help=f'Linhas geradas por tarefa do pool (padrão: {CHUNK_SIZE})')
+    parser.add_argument('--seed', type=int, default=42, help='Semente base do dataset (padrão: 42)')
+    parser.add_argument('--data-referencia', type=_data, default=None,
+                        help='Data "hoje" usada na geração (YYYY-MM-DD), para datasets reproduzíveis')
+    parser.add_argument('--sqlite', action='store_true', help='Gravar no SQLite de fallback (Config.SQLITE_PATH)')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
 
-def main():
     logger.info("=" * 70)
     logger.info("🚀 POPULANDO MYSQL COM DADOS ARTIFICIAIS")
     logger.info("=" * 70)
     
-    conn = get_connection()
+    sqlite = args.sqlite
+    conn = None if sqlite else get_connection(allow_local_infile=args.load_data)
+    if conn is None and (sqlite or Config.DB_USE_SQLITE_FALLBACK):
+        if not sqlite:
+            logger.warning("⚠️  MySQL indisponível; usando o fallback SQLite")
+        sqlite = True
+        conn = get_sqlite_connection()
     if not conn:
         logger.error("❌ Falha na conexão. Encerrando.")
         return
+    if sqlite and args.load_data:
+        logger.warning("⚠️  --load-data não se aplica ao SQLite; usando INSERT em lote")
+
+    opcoes = {
+        'batch_size': args.batch_size,
+        'commit_every': args.commit_every,
+        'via_arquivo': args.load_data and not sqlite,
+        'sqlite': sqlite,
+        'chunk_size': max(1, args.chunk_size),
+        'seed': args.seed,
+        'referencia': args.data_referencia or date.today(),
+        'max_pendentes': max(2, args.workers * 2),
+    }
+    pool = multiprocessing.Pool(args.workers) if args.workers > 1 else None
     
     try:
-        limpar_banco(conn)
+        if not args.sem_limpar:
+            limpar_banco(conn, sqlite)
         
-        cpfs = popular_pacientes(conn, 200)
-        codigos_med = popular_medicos(conn, 80)
-        codigos_cli = popular_clinicas(conn, 12)
+        inicio = time.perf_counter()
+        estagios = [
+            popular_pacientes(conn, args.pacientes, pool, **opcoes),
+            popular_medicos(conn, args.medicos, pool, **opcoes),
+            popular_clinicas(conn, args.clinicas, pool, **opcoes),
+        ]
         
-        if cpfs and codigos_med and codigos_cli:
-            popular_consultas(conn, cpfs, codigos_med, codigos_cli, 1500)
+        if args.pacientes and args.medicos and args.clinicas:
+            estagios.append(popular_consultas(conn, args.pacientes, args.medicos, args.clinicas,
+                                              args.consultas, pool, **opcoes))
         else:
             logger.error("❌ Falha ao obter dados base para consultas")
+        duracao = time.perf_counter() - inicio
         
         # Estatísticas finais
         cursor = conn.cursor()
@@ -262,12 +518,20 @@ def main():
         logger.info(f"   🏥 Clínicas:   {cli}")
         logger.info(f"   📅 Consultas:  {con}")
         logger.info(f"\n   Total de registros: {pac + med + cli + con}")
+        logger.info(f"   Tempo total: {duracao:.1f}s")
+        logger.info(f"\n⏱️  Throughput por estágio ({args.workers} worker(s), seed {args.seed}):")
+        for st in estagios:
+            logger.info(f"   {st['estagio']:<10} geração {st['geracao_linhas_s']:>10,.0f}/s por worker   "
+                        f"escrita {st['escrita_linhas_s']:>10,.0f}/s   total {st['total_linhas_s']:>10,.0f}/s")
         logger.info("=" * 70)
         
     except Exception as e:
         logger.error(f"❌ Erro durante população: {e}")
         conn.rollback()
     finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
         conn.close()
         logger.info("🔒 Conexão fechada")
 
@@ -0,0 +1,311 @@
+"""
+Registro das formas de consulta executadas (carga real do banco)
+Sistema de Consultório Médico
+
+Cada comando feito por Database.fetch_all/fetch_one/fetch_frame/execute_query é reduzido
+à sua forma normalizada (literais e placeholders viram ``?``, listas ``IN (?, ?, ...)``
+viram ``IN (...)``, espaços colapsados) e acumulado com:
+
+- frequência, latência total/máxima e histograma de latência (LIMITES_MS);
+- linhas devolvidas (afetadas, nas escritas) e bytes aproximados do resultado;
+- o callback do Dash que fez a chamada (definir_origem, ligado em app.py por requisição;
+  tarefas de fanout.fan_out herdam a origem porque copiam o contexto).
+
+Um exemplo real (SQL + parâmetros) de cada forma é guardado para o EXPLAIN do
+index_advisor.py.
+
+- Em memória, por processo: QUERY_LOG.formas() (acumulado desde o início) e
+  QUERY_LOG.exportar() (o mesmo sem exemplos/parâmetros, para a rota de exportação).
+- Em disco (Config.QUERY_LOG_PATH): a cada Config.QUERY_LOG_FLUSH_SECONDS e na saída do
+  processo o que mudou desde a última gravação é anexado ao arquivo como JSON Lines (uma
+  forma por linha); vários workers do gunicorn podem escrever no mesmo arquivo.
+  carregar() soma as linhas de volta.
+
+    QUERY_LOG_PATH=/var/log/consultorio/queries.jsonl python app.py
+    python index_advisor.py --log /var/log/consultorio/queries.jsonl
+"""
+
+import atexit
+import bisect
+import json
+import logging
+import os
+import re
+import threading
+import time
+from contextvars import ContextVar
+from datetime import date, datetime
+from decimal import Decimal
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from config import Config
+
+logger = logging.getLogger("consultorio.query_log")
+
+_COMENTARIO = re.compile(r'--[^\n]*|/\*.*?\*/', re.DOTALL)
+_TEXTO = re.compile(r"'(?:[^'\\]|\\.|'')*'")
+_NUMERO = re.compile(r'(?<![\w.])-?\d+(?:\.\d+)?\b')
+_PLACEHOLDER = re.compile(r'%s|\?')
+_LISTA_IN = re.compile(r'\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)', re.IGNORECASE)
+_ESPACOS = re.compile(r'\s+')
+
+# Formas distintas guardadas por processo; as demais são somadas em OUTRAS
+OUTRAS = '(outras formas)'
+# Limites superiores (ms) das faixas do histograma de latência; a última faixa é "acima de 10 s"
+LIMITES_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+# Linhas amostradas para estimar os bytes de um resultado
+_AMOSTRA_LINHAS = 20
+
+# Callback (ou tarefa) que está executando as consultas neste contexto
+_origem = ContextVar('consultorio_query_origem', default=None)
+
+
+def definir_origem(nome: Optional[str]):
+    """Marca as consultas seguintes deste contexto como feitas por ``nome``; devolve o token para restaurar_origem"""
+    return _origem.set(nome)
+
+
+def restaurar_origem(token):
+    try:
+        _origem.reset(token)
+    except ValueError:
+        # token de outro contexto (ex.: teardown em outra thread): só limpa
+        _origem.set(None)
+
+
+def origem_atual() -> Optional[str]:
+    return _origem.get()
+
+
+@lru_cache(maxsize=1024)
+def normalizar(query: str) -> str:
+    """
+    Forma da consulta: ``SELECT ... WHERE c.CodMed = %s AND c.Data_Hora >= '2024-01-01'``
+    -> ``SELECT ... WHERE c.CodMed = ? AND c.Data_Hora >= ?``
+    """
+    texto = _COMENTARIO.sub(' ', query)
+    texto = _TEXTO.sub('?', texto)
+    texto = _NUMERO.sub('?', texto)
+    texto = _PLACEHOLDER.sub('?', texto)
+    texto = _LISTA_IN.sub('IN (...)', texto)
+    return _ESPACOS.sub(' ', texto).strip().rstrip(';').rstrip()
+
+
+def _bytes_valor(valor: Any) -> int:
+    if valor is None:
+        return 0
+    if isinstance(valor, (str, bytes, bytearray)):
+        return len(valor)
+    if isinstance(valor, (datetime, date, Decimal)):
+        return len(str(valor))
+    return 8
+
+
+def tamanho_resultado(resultado: Any) -> Optional[tuple]:
+    """
+    (linhas, bytes aproximados) do resultado de uma leitura: lista de dicts, dict (uma
+    linha), None (nenhuma) ou DataFrame. Os bytes somam o tamanho dos valores (texto pelo
+    comprimento, números como 8) de até _AMOSTRA_LINHAS linhas, extrapolado para o total.
+    """
+    if resultado is None:
+        return 0, 0
+    if isinstance(resultado, dict):
+        return 1, sum(_bytes_valor(v) for v in resultado.values())
+    if isinstance(resultado, list):
+        if not resultado:
+            return 0, 0
+        amostra = resultado[:_AMOSTRA_LINHAS]
+        medio = sum(_bytes_valor(v) for linha in amostra for v in linha.values()) / len(amostra)
+        return len(resultado), int(medio * len(resultado))
+    memoria = getattr(resultado, 'memory_usage', None)
+    if memoria is not None:
+        return len(resultado), int(memoria(index=False, deep=False).sum())
+    return None
+
+
+def _serializavel(params: Sequence[Any]) -> list:
+    """Parâmetros como JSON (datas e Decimal viram texto, que os dois bancos aceitam no EXPLAIN)"""
+    return [p if p is None or isinstance(p, (str, int, float, bool)) else str(p) for p in params]
+
+
+class Forma:
+    """Acumulado de uma forma de consulta"""
+
+    __slots__ = ('sql', 'contagem', 'total_ms', 'max_ms', 'linhas', 'bytes', 'histograma',
+                 'origens', 'exemplo', 'params')
+
+    def __init__(self, sql: str, exemplo: str, params: Sequence[Any]):
+        self.sql = sql
+        self.contagem = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.linhas = 0
+        self.bytes = 0
+        self.histograma = [0] * (len(LIMITES_MS) + 1)
+        self.origens: Dict[str, List[float]] = {}  # callback -> [contagem, total_ms]
+        self.exemplo = exemplo
+        self.params = list(params)
+
+    @property
+    def media_ms(self) -> float:
+        return self.total_ms / self.contagem if self.contagem else 0.0
+
+    def observar(self, ms: float, linhas: int = 0, tamanho: int = 0, origem: Optional[str] = None):
+        """Soma uma execução"""
+        self.contagem += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+        self.linhas += linhas
+        self.bytes += tamanho
+        self.histograma[bisect.bisect_left(LIMITES_MS, ms)] += 1
+        if origem:
+            acumulado = self.origens.setdefault(origem, [0, 0.0])
+            acumulado[0] += 1
+            acumulado[1] += ms
+
+    def juntar(self, item: Dict[str, Any]):
+        """Soma um acumulado no formato de como_dict (arquivo ou outra Forma)"""
+        self.contagem += int(item['contagem'])
+        self.total_ms += float(item['total_ms'])
+        self.max_ms = max(self.max_ms, float(item['max_ms']))
+        self.linhas += int(item.get('linhas', 0))
+        self.bytes += int(item.get('bytes', 0))
+        histograma = item.get('histograma') or ()
+        if len(histograma) == len(self.histograma):
+            self.histograma = [a + int(b) for a, b in zip(self.histograma, histograma)]
+        for origem, dados in (item.get('callbacks') or {}).items():
+            acumulado = self.origens.setdefault(origem, [0, 0.0])
+            acumulado[0] += int(dados['contagem'])
+            acumulado[1] += float(dados['total_ms'])
+
+    def como_dict(self, exemplo: bool = True) -> Dict[str, Any]:
+        dados = {'sql': self.sql, 'contagem': self.contagem, 'total_ms': round(self.total_ms, 3),
+                 'media_ms': round(self.media_ms, 3), 'max_ms': round(self.max_ms, 3),
+                 'linhas': self.linhas, 'bytes': self.bytes, 'histograma': list(self.histograma),
+                 'callbacks': {o: {'contagem': int(c), 'total_ms': round(t, 3)}
+                               for o, (c, t) in sorted(self.origens.items(), key=lambda i: -i[1][1])}}
+        if exemplo:
+            dados.update(exemplo=self.exemplo, params=self.params)
+        return dados
+
+
+class QueryLog:
+    """Formas de consulta deste processo, seguro entre threads"""
+
+    def __init__(self, ativo: bool = True, max_formas: int = 500, caminho: Optional[str] = None,
+                 intervalo: float = 300.0):
+        self.ativo = ativo
+        self.max_formas = max_formas
+        self.caminho = caminho
+        self.intervalo = intervalo
+        self._formas: Dict[str, Forma] = {}      # desde o início do processo
+        self._pendentes: Dict[str, Forma] = {}   # desde a última gravação em disco
+        self._lock = threading.Lock()
+        self._ultimo_envio = time.monotonic()
+
+    def _forma(self, formas: Dict[str, Forma], sql: str, query: str, params) -> Forma:
+        forma = formas.get(sql)
+        if forma is None:
+            if len(formas) >= self.max_formas:
+                sql, query, params = OUTRAS, '', ()
+                forma = formas.get(sql)
+            if forma is None:
+                forma = formas[sql] = Forma(sql, query, _serializavel(params or ()))
+        return forma
+
+    def registrar(self, query: str, params: Optional[Sequence[Any]], duracao: float,
+                  linhas: int = 0, tamanho: int = 0, origem: Optional[str] = None) -> Optional[Forma]:
+        """
+        Soma uma execução de ``query`` (``duracao`` em segundos; ``origem`` padrão: a do
+        contexto) e devolve a forma acumulada (None com o registro desligado).
+        """
+        if not self.ativo:
+            return None
+        sql = normalizar(query)
+        ms = duracao * 1000
+        origem = origem or _origem.get()
+        with self._lock:
+            forma = self._forma(self._formas, sql, query, params)
+            forma.observar(ms, linhas, tamanho, origem)
+            if self.caminho:
+                self._forma(self._pendentes, sql, query, params).observar(ms, linhas, tamanho, origem)
+            enviar = self.caminho and time.monotonic() - self._ultimo_envio >= self.intervalo
+        if enviar:
+            self.salvar()
+        return forma
+
+    def formas(self) -> Dict[str, Forma]:
+        """Cópia do acumulado: {sql normalizado: Forma}"""
+        with self._lock:
+            copia = {}
+            for sql, forma in self._formas.items():
+                copia[sql] = Forma(sql, forma.exemplo, forma.params)
+                copia[sql].juntar(forma.como_dict(exemplo=False))
+            return copia
+
+    def exportar(self, top: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Acumulado para exportação (sem exemplos nem parâmetros, que podem ter dados de
+        pacientes), das formas mais custosas para as menos.
+        """
+        formas = sorted(self.formas().values(), key=lambda f: -f.total_ms)
+        return {'gerado_em': datetime.now().isoformat(timespec='seconds'), 'pid': os.getpid(),
+                'limites_ms': list(LIMITES_MS), 'formas': [f.como_dict(exemplo=False) for f in formas[:top]]}
+
+    def limpar(self):
+        with self._lock:
+            self._formas.clear()
+            self._pendentes.clear()
+
+    def salvar(self, caminho: Optional[str] = None) -> int:
+        """Anexa a ``caminho`` (padrão: Config.QUERY_LOG_PATH) o que mudou desde a última gravação; devolve as formas gravadas"""
+        caminho = caminho or self.caminho
+        if not caminho:
+            return 0
+        with self._lock:
+            # sem caminho configurado não há pendentes: grava o acumulado (ex.: carga dos cenários)
+            formas = self._pendentes if self.caminho else dict(self._formas)
+            self._pendentes = {}
+            self._ultimo_envio = time.monotonic()
+        if not formas:
+            return 0
+        instante = time.strftime('%Y-%m-%dT%H:%M:%S')
+        try:
+            diretorio = os.path.dirname(caminho)
+            if diretorio:
+                os.makedirs(diretorio, exist_ok=True)
+            # uma única escrita em modo append por lote: linhas de workers diferentes não se misturam
+            linhas = ''.join(json.dumps(dict(f.como_dict(), pid=os.getpid(), ate=instante), ensure_ascii=False) + '\n'
+                             for f in formas.values())
+            with open(caminho, 'a', encoding='utf-8') as arquivo:
+                arquivo.write(linhas)
+            return len(formas)
+        except OSError as e:
+            logger.warning(f"Não foi possível gravar o registro de consultas em {caminho}: {e}")
+            return 0
+
+
+def carregar(caminhos: Iterable[str]) -> Dict[str, Forma]:
+    """Soma os arquivos JSON Lines gravados por QueryLog.salvar: {sql normalizado: Forma}"""
+    formas: Dict[str, Forma] = {}
+    for caminho in caminhos:
+        with open(caminho, encoding='utf-8') as arquivo:
+            for numero, linha in enumerate(arquivo, 1):
+                if not linha.strip():
+                    continue
+                try:
+                    item = json.loads(linha)
+                    sql = item['sql']
+                    forma = formas.get(sql)
+                    if forma is None:
+                        forma = formas[sql] = Forma(sql, item.get('exemplo', ''), item.get('params') or [])
+                    forma.juntar(item)
+                except (ValueError, KeyError, TypeError) as e:
+                    logger.warning(f"{caminho}:{numero}: linha ignorada ({e})")
+    return formas
+
+
+QUERY_LOG = QueryLog(ativo=Config.QUERY_LOG_ENABLED, max_formas=Config.QUERY_LOG_MAX_SHAPES,
+                     caminho=Config.QUERY_LOG_PATH, intervalo=Config.QUERY_LOG_FLUSH_SECONDS)
+atexit.register(QUERY_LOG.salvar)
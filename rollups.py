@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+"""
+Rollups de consultas para o dashboard
+
+Tabelas de resumo mantidas por triggers (MySQL: rollups.sql; SQLite: SQLITE_DDL abaixo):
+
+- consultas_por_dia_medico_clinica (Dia, CodMed, CodCli, Total)
+- consultas_por_medico (CodMed, Total)
+
+O dashboard lê estas tabelas (algumas centenas/milhares de linhas) em vez de agregar
+tabelaconsulta a cada carregamento. No SQLite de demonstração as tabelas e triggers são
+criados automaticamente; no MySQL, instale uma vez:
+
+    python rollups.py --install     # tabelas + triggers + totais
+    python rollups.py --rebuild     # recalcula os totais do zero (após cargas/TRUNCATE)
+    python rollups.py --check       # compara os rollups com as contagens reais
+"""
+
+import argparse
+import logging
+import re
+import sys
+import threading
+from pathlib import Path
+
+from db import db
+
+logger = logging.getLogger("consultorio.rollups")
+
+ROLLUP_TABLES = ('consultas_por_dia_medico_clinica', 'consultas_por_medico')
+ROLLUP_TRIGGERS = ('rollup_consulta_insert', 'rollup_consulta_delete', 'rollup_consulta_update',
+                   'rollup_paciente_delete', 'rollup_medico_delete', 'rollup_medico_update',
+                   'rollup_clinica_delete', 'rollup_clinica_update')
+SQL_FILE = Path(__file__).parent / 'rollups.sql'
+
+# O esquema SQLite de demonstração não tem FKs com cascata; bastam os triggers de tabelaconsulta
+SQLITE_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS consultas_por_dia_medico_clinica (
+        Dia TEXT NOT NULL,
+        CodMed TEXT NOT NULL,
+        CodCli TEXT NOT NULL,
+        Total INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (Dia, CodMed, CodCli)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS consultas_por_medico (
+        CodMed TEXT PRIMARY KEY,
+        Total INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS rollup_consulta_insert
+    AFTER INSERT ON tabelaconsulta
+    BEGIN
+        INSERT INTO consultas_por_dia_medico_clinica (Dia, CodMed, CodCli, Total)
+        VALUES (DATE(NEW.Data_Hora), NEW.CodMed, NEW.CodCli, 1)
+        ON CONFLICT (Dia, CodMed, CodCli) DO UPDATE SET Total = Total + 1;
+        INSERT INTO consultas_por_medico (CodMed, Total) VALUES (NEW.CodMed, 1)
+        ON CONFLICT (CodMed) DO UPDATE SET Total = Total + 1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS rollup_consulta_delete
+    AFTER DELETE ON tabelaconsulta
+    BEGIN
+        UPDATE consultas_por_dia_medico_clinica SET Total = Total - 1
+        WHERE Dia = DATE(OLD.Data_Hora) AND CodMed = OLD.CodMed AND CodCli = OLD.CodCli;
+        UPDATE consultas_por_medico SET Total = Total - 1 WHERE CodMed = OLD.CodMed;
+        DELETE FROM consultas_por_dia_medico_clinica
+        WHERE Dia = DATE(OLD.Data_Hora) AND CodMed = OLD.CodMed AND CodCli = OLD.CodCli AND Total <= 0;
+        DELETE FROM consultas_por_medico WHERE CodMed = OLD.CodMed AND Total <= 0;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS rollup_consulta_update
+    AFTER UPDATE OF CodCli, CodMed, Data_Hora ON tabelaconsulta
+    BEGIN
+        UPDATE consultas_por_dia_medico_clinica SET Total = Total - 1
+        WHERE Dia = DATE(OLD.Data_Hora) AND CodMed = OLD.CodMed AND CodCli = OLD.CodCli;
+        UPDATE consultas_por_medico SET Total = Total - 1 WHERE CodMed = OLD.CodMed;
+        INSERT INTO consultas_por_dia_medico_clinica (Dia, CodMed, CodCli, Total)
+        VALUES (DATE(NEW.Data_Hora), NEW.CodMed, NEW.CodCli, 1)
+        ON CONFLICT (Dia, CodMed, CodCli) DO UPDATE SET Total = Total + 1;
+        INSERT INTO consultas_por_medico (CodMed, Total) VALUES (NEW.CodMed, 1)
+        ON CONFLICT (CodMed) DO UPDATE SET Total = Total + 1;
+        DELETE FROM consultas_por_dia_medico_clinica
+        WHERE Dia = DATE(OLD.Data_Hora) AND CodMed = OLD.CodMed AND CodCli = OLD.CodCli AND Total <= 0;
+        DELETE FROM consultas_por_medico WHERE CodMed = OLD.CodMed AND Total <= 0;
+    END
+    """,
+]
+
+REBUILD_SQL = [
+    "DELETE FROM consultas_por_dia_medico_clinica",
+    "DELETE FROM consultas_por_medico",
+    """
+    INSERT INTO consultas_por_dia_medico_clinica (Dia, CodMed, CodCli, Total)
+    SELECT DATE(Data_Hora), CodMed, CodCli, COUNT(*)
+    FROM tabelaconsulta
+    GROUP BY DATE(Data_Hora), CodMed, CodCli
+    """,
+    """
+    INSERT INTO consultas_por_medico (CodMed, Total)
+    SELECT CodMed, SUM(Total)
+    FROM consultas_por_dia_medico_clinica
+    GROUP BY CodMed
+    """,
+]
+
+_disponivel = None
+_disponivel_lock = threading.Lock()
+
+
+def mysql_statements(sql_text):
+    """Separa um script no formato do MySQL client (com DELIMITER) em comandos"""
+    comandos = []
+    delimitador = ';'
+    atual = []
+    for linha in sql_text.splitlines():
+        if not atual and (not linha.strip() or linha.strip().startswith('--')):
+            continue
+        trocar = re.match(r'^\s*DELIMITER\s+(\S+)\s*$', linha, re.IGNORECASE)
+        if trocar:
+            delimitador = trocar.group(1)
+            continue
+        atual.append(linha)
+        if linha.rstrip().endswith(delimitador):
+            comando = '\n'.join(atual).rstrip()[:-len(delimitador)].strip()
+            if comando:
+                comandos.append(comando)
+            atual = []
+    return comandos
+
+
+def instalar(conn, sqlite=False):
+    """Cria tabelas e triggers de rollup e calcula os totais a partir de tabelaconsulta"""
+    comandos = SQLITE_DDL if sqlite else mysql_statements(SQL_FILE.read_text(encoding='utf-8'))
+    cursor = conn.cursor()
+    try:
+        for comando in comandos:
+            cursor.execute(comando)
+        conn.commit()
+    finally:
+        cursor.close()
+    logger.info(f"Tabelas e triggers de rollup instalados ({'SQLite' if sqlite else 'MySQL'})")
+    reconstruir(conn)
+
+
+def reconstruir(conn):
+    """
+    Recalcula os rollups do zero numa única transação. No MySQL o INSERT ... SELECT
+    bloqueia inserções concorrentes em tabelaconsulta até o commit, então nenhum
+    incremento de trigger se perde durante a reconstrução.
+    """
+    cursor = conn.cursor()
+    try:
+        for comando in REBUILD_SQL:
+            cursor.execute(comando)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    logger.info("Rollups de consultas recalculados")
+    db.notify_tables_changed(ROLLUP_TABLES)
+
+
+def limpar(conn, sqlite=False):
+    """Esvazia os rollups (usado junto com TRUNCATE de tabelaconsulta, que não dispara triggers)"""
+    cursor = conn.cursor()
+    try:
+        for tabela in ROLLUP_TABLES:
+            if existe(cursor, tabela, sqlite):
+                cursor.execute(f"DELETE FROM {tabela}" if sqlite else f"TRUNCATE TABLE {tabela}")
+    finally:
+        cursor.close()
+
+
+def existe(cursor, tabela, sqlite=False):
+    if sqlite:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (tabela,))
+    else:
+        cursor.execute("SELECT 1 FROM information_schema.TABLES "
+                       "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s", (tabela,))
+    return cursor.fetchone() is not None
+
+
+def _triggers_mysql(cursor):
+    cursor.execute("SELECT TRIGGER_NAME FROM information_schema.TRIGGERS WHERE TRIGGER_SCHEMA = DATABASE()")
+    return {linha[0] for linha in cursor.fetchall()}
+
+
+def disponivel():
+    """
+    True se o dashboard pode ler os rollups. No SQLite instala tudo na primeira chamada;
+    no MySQL apenas verifica (tabelas e triggers) e, se faltar algo, o dashboard continua
+    com as agregações sobre tabelaconsulta.
+    """
+    global _disponivel
+    with _disponivel_lock:
+        if _disponivel is not None:
+            return _disponivel
+        try:
+            with db.raw_connection() as conn:
+                cursor = conn.cursor()
+                try:
+                    if db.use_sqlite:
+                        instalado = all(existe(cursor, t, sqlite=True) for t in ROLLUP_TABLES)
+                    else:
+                        instalado = (all(existe(cursor, t) for t in ROLLUP_TABLES)
+                                     and set(ROLLUP_TRIGGERS) <= _triggers_mysql(cursor))
+                finally:
+                    cursor.close()
+                if not instalado and db.use_sqlite:
+                    instalar(conn, sqlite=True)
+                    instalado = True
+            if not instalado:
+                logger.warning("Rollups não instalados no MySQL (python rollups.py --install); "
+                               "dashboard usando agregações sobre tabelaconsulta")
+            _disponivel = instalado
+        except Exception as e:
+            logger.error(f"Erro ao verificar rollups: {e}")
+            return False
+        return _disponivel
+
+
+def verificar(conn):
+    """Diferenças entre consultas_por_medico e COUNT(*) real por médico: {CodMed: (rollup, real)}"""
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT CodMed, COUNT(*) FROM tabelaconsulta GROUP BY CodMed")
+        reais = {str(cod): int(n) for cod, n in cursor.fetchall()}
+        cursor.execute("SELECT CodMed, Total FROM consultas_por_medico")
+        rollup = {str(cod): int(n) for cod, n in cursor.fetchall()}
+    finally:
+        cursor.close()
+    return {cod: (rollup.get(cod, 0), reais.get(cod, 0))
+            for cod in set(reais) | set(rollup) if rollup.get(cod, 0) != reais.get(cod, 0)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Rollups de consultas para o dashboard')
+    parser.add_argument('--install', action='store_true', help='Cria tabelas/triggers e calcula os totais')
+    parser.add_argument('--rebuild', action='store_true', help='Recalcula os totais do zero')
+    parser.add_argument('--check', action='store_true', help='Compara os rollups com as contagens reais')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
+
+    if not (args.install or args.rebuild or args.check):
+        parser.print_help()
+        return 1
+    if not db.ensure_connected():
+        logger.error("Sem conexão com o banco de dados")
+        return 1
+
+    with db.raw_connection() as conn:
+        if args.install:
+            instalar(conn, sqlite=db.use_sqlite)
+        elif args.rebuild:
+            reconstruir(conn)
+        if args.check:
+            divergencias = verificar(conn)
+            if divergencias:
+                for cod, (rollup, real) in sorted(divergencias.items())[:20]:
+                    logger.warning(f"   Médico {cod}: rollup={rollup} real={real}")
+                logger.error(f"✗ {len(divergencias)} médico(s) com rollup divergente")
+                return 2
+            logger.info("✓ Rollups consistentes com tabelaconsulta")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,206 @@
+-- ============================================================
+-- Rollups do Sistema de Consultório Médico
+-- Tabelas de resumo de consultas lidas pelo dashboard
+-- ============================================================
+-- Mantidas por triggers a cada INSERT/UPDATE/DELETE em tabelaconsulta, então o
+-- custo do dashboard não cresce com o volume de consultas.
+--
+-- Exclusões/alterações em cascata (ON DELETE/UPDATE CASCADE das FKs de
+-- tabelaconsulta) NÃO disparam triggers no MySQL; por isso há também triggers
+-- em tabelapaciente, tabelamedico e tabelaclinica que ajustam os rollups antes
+-- da cascata.
+--
+-- TRUNCATE também não dispara triggers: após cargas em massa ou para corrigir
+-- divergências, recalcule com: python rollups.py --rebuild
+-- ============================================================
+
+CREATE TABLE IF NOT EXISTS `consultas_por_dia_medico_clinica` (
+  `Dia` date NOT NULL,
+  `CodMed` char(7) NOT NULL,
+  `CodCli` char(6) NOT NULL,
+  `Total` int NOT NULL DEFAULT 0,
+  PRIMARY KEY (`Dia`, `CodMed`, `CodCli`),
+  KEY `idx_rollup_dia_medico` (`CodMed`),
+  KEY `idx_rollup_dia_clinica` (`CodCli`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+
+CREATE TABLE IF NOT EXISTS `consultas_por_medico` (
+  `CodMed` char(7) NOT NULL,
+  `Total` bigint NOT NULL DEFAULT 0,
+  PRIMARY KEY (`CodMed`),
+  KEY `idx_rollup_medico_total` (`Total`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+
+DELIMITER $$
+
+-- ============================================================
+-- TRIGGER 1: Nova consulta
+-- ============================================================
+DROP TRIGGER IF EXISTS rollup_consulta_insert$$
+
+CREATE TRIGGER rollup_consulta_insert
+AFTER INSERT ON tabelaconsulta
+FOR EACH ROW
+BEGIN
+    INSERT INTO consultas_por_dia_medico_clinica (Dia, CodMed, CodCli, Total)
+    VALUES (DATE(NEW.Data_Hora), NEW.CodMed, NEW.CodCli, 1)
+    ON DUPLICATE KEY UPDATE Total = Total + 1;
+
+    INSERT INTO consultas_por_medico (CodMed, Total)
+    VALUES (NEW.CodMed, 1)
+    ON DUPLICATE KEY UPDATE Total = Total + 1;
+END$$
+
+-- ============================================================
+-- TRIGGER 2: Consulta removida
+-- ============================================================
+DROP TRIGGER IF EXISTS rollup_consulta_delete$$
+
+CREATE TRIGGER rollup_consulta_delete
+AFTER DELETE ON tabelaconsulta
+FOR EACH ROW
+BEGIN
+    UPDATE consultas_por_dia_medico_clinica
+    SET Total = Total - 1
+    WHERE Dia = DATE(OLD.Data_Hora) AND CodMed = OLD.CodMed AND CodCli = OLD.CodCli;
+
+    UPDATE consultas_por_medico SET Total = Total - 1 WHERE CodMed = OLD.CodMed;
+
+    DELETE FROM consultas_por_dia_medico_clinica
+    WHERE Dia = DATE(OLD.Data_Hora) AND CodMed = OLD.CodMed AND CodCli = OLD.CodCli AND Total <= 0;
+    DELETE FROM consultas_por_medico WHERE CodMed = OLD.CodMed AND Total <= 0;
+END$$
+
+-- ============================================================
+-- TRIGGER 3: Consulta remarcada (data, médico ou clínica alterados)
+-- ============================================================
+DROP TRIGGER IF EXISTS rollup_consulta_update$$
+
+CREATE TRIGGER rollup_consulta_update
+AFTER UPDATE ON tabelaconsulta
+FOR EACH ROW
+BEGIN
+    IF DATE(OLD.Data_Hora) <> DATE(NEW.Data_Hora) OR OLD.CodMed <> NEW.CodMed OR OLD.CodCli <> NEW.CodCli THEN
+        UPDATE consultas_por_dia_medico_clinica
+        SET Total = Total - 1
+        WHERE Dia = DATE(OLD.Data_Hora) AND CodMed = OLD.CodMed AND CodCli = OLD.CodCli;
+        DELETE FROM consultas_por_dia_medico_clinica
+        WHERE Dia = DATE(OLD.Data_Hora) AND CodMed = OLD.CodMed AND CodCli = OLD.CodCli AND Total <= 0;
+
+        INSERT INTO consultas_por_dia_medico_clinica (Dia, CodMed, CodCli, Total)
+        VALUES (DATE(NEW.Data_Hora), NEW.CodMed, NEW.CodCli, 1)
+        ON DUPLICATE KEY UPDATE Total = Total + 1;
+    END IF;
+
+    IF OLD.CodMed <> NEW.CodMed THEN
+        UPDATE consultas_por_medico SET Total = Total - 1 WHERE CodMed = OLD.CodMed;
+        DELETE FROM consultas_por_medico WHERE CodMed = OLD.CodMed AND Total <= 0;
+        INSERT INTO consultas_por_medico (CodMed, Total)
+        VALUES (NEW.CodMed, 1)
+        ON DUPLICATE KEY UPDATE Total = Total + 1;
+    END IF;
+END$$
+
+-- ============================================================
+-- TRIGGER 4: Paciente removido (consultas apagadas em cascata)
+-- ============================================================
+DROP TRIGGER IF EXISTS rollup_paciente_delete$$
+
+CREATE TRIGGER rollup_paciente_delete
+BEFORE DELETE ON tabelapaciente
+FOR EACH ROW
+BEGIN
+    UPDATE consultas_por_dia_medico_clinica r
+    JOIN (
+        SELECT DATE(Data_Hora) AS Dia, CodMed, CodCli, COUNT(*) AS n
+        FROM tabelaconsulta
+        WHERE CpfPaciente = OLD.CpfPaciente
+        GROUP BY DATE(Data_Hora), CodMed, CodCli
+    ) x ON r.Dia = x.Dia AND r.CodMed = x.CodMed AND r.CodCli = x.CodCli
+    SET r.Total = r.Total - x.n;
+
+    UPDATE consultas_por_medico r
+    JOIN (
+        SELECT CodMed, COUNT(*) AS n
+        FROM tabelaconsulta
+        WHERE CpfPaciente = OLD.CpfPaciente
+        GROUP BY CodMed
+    ) x ON r.CodMed = x.CodMed
+    SET r.Total = r.Total - x.n;
+
+    DELETE r FROM consultas_por_dia_medico_clinica r
+    JOIN tabelaconsulta c
+      ON c.CpfPaciente = OLD.CpfPaciente
+     AND r.Dia = DATE(c.Data_Hora) AND r.CodMed = c.CodMed AND r.CodCli = c.CodCli
+    WHERE r.Total <= 0;
+    DELETE r FROM consultas_por_medico r
+    JOIN tabelaconsulta c ON c.CpfPaciente = OLD.CpfPaciente AND r.CodMed = c.CodMed
+    WHERE r.Total <= 0;
+END$$
+
+-- ============================================================
+-- TRIGGER 5: Médico removido ou com código alterado
+-- ============================================================
+DROP TRIGGER IF EXISTS rollup_medico_delete$$
+
+CREATE TRIGGER rollup_medico_delete
+BEFORE DELETE ON tabelamedico
+FOR EACH ROW
+BEGIN
+    DELETE FROM consultas_por_dia_medico_clinica WHERE CodMed = OLD.CodMed;
+    DELETE FROM consultas_por_medico WHERE CodMed = OLD.CodMed;
+END$$
+
+DROP TRIGGER IF EXISTS rollup_medico_update$$
+
+CREATE TRIGGER rollup_medico_update
+AFTER UPDATE ON tabelamedico
+FOR EACH ROW
+BEGIN
+    IF OLD.CodMed <> NEW.CodMed THEN
+        UPDATE consultas_por_dia_medico_clinica SET CodMed = NEW.CodMed WHERE CodMed = OLD.CodMed;
+        UPDATE consultas_por_medico SET CodMed = NEW.CodMed WHERE CodMed = OLD.CodMed;
+    END IF;
+END$$
+
+-- ============================================================
+-- TRIGGER 6: Clínica removida ou com código alterado
+-- ============================================================
+DROP TRIGGER IF EXISTS rollup_clinica_delete$$
+
+CREATE TRIGGER rollup_clinica_delete
+BEFORE DELETE ON tabelaclinica
+FOR EACH ROW
+BEGIN
+    UPDATE consultas_por_medico r
+    JOIN (
+        SELECT CodMed, SUM(Total) AS n
+        FROM consultas_por_dia_medico_clinica
+        WHERE CodCli = OLD.CodCli
+        GROUP BY CodMed
+    ) x ON r.CodMed = x.CodMed
+    SET r.Total = r.Total - x.n;
+
+    DELETE FROM consultas_por_dia_medico_clinica WHERE CodCli = OLD.CodCli;
+    DELETE FROM consultas_por_medico WHERE Total <= 0;
+END$$
+
+DROP TRIGGER IF EXISTS rollup_clinica_update$$
+
+CREATE TRIGGER rollup_clinica_update
+AFTER UPDATE ON tabelaclinica
+FOR EACH ROW
+BEGIN
+    IF OLD.CodCli <> NEW.CodCli THEN
+        UPDATE consultas_por_dia_medico_clinica SET CodCli = NEW.CodCli WHERE CodCli = OLD.CodCli;
+    END IF;
+END$$
+
+DELIMITER ;
+
+-- ============================================================
+-- Como aplicar:
+-- 1. Por Python (cria tabelas, triggers e calcula os totais): python rollups.py --install
+-- 2. Por terminal: mysql -u root -p consultoriomedico < rollups.sql
+--    e depois: python rollups.py --rebuild
+-- ============================================================
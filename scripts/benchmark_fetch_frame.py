@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Benchmark: pd.DataFrame(db.fetch_all(...)) vs db.fetch_frame(...)
+Mede linhas/segundo dos dois caminhos sobre a mesma consulta de consultas.
+
+Uso:
+    python scripts/benchmark_fetch_frame.py              # SQLite temporário com 200k linhas
+    python scripts/benchmark_fetch_frame.py --linhas 1000000
+    python scripts/benchmark_fetch_frame.py --mysql      # banco configurado no .env
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# Adiciona o diretório raiz ao path
+root_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(root_dir))
+
+QUERY = """
+    SELECT c.CodCli, c.CodMed, c.CpfPaciente, c.Data_Hora, m.Especialidade, p.Genero
+    FROM tabelaconsulta c
+    JOIN tabelamedico m ON c.CodMed = m.CodMed
+    JOIN tabelapaciente p ON c.CpfPaciente = p.CpfPaciente
+"""
+
+ESPECIALIDADES = ['Cardiologia', 'Dermatologia', 'Neurologia', 'Ortopedia', 'Pediatria', 'Urologia']
+
+
+def preparar_sqlite(linhas):
+    """Cria um SQLite temporário com dados sintéticos e aponta o Config para ele"""
+    path = os.path.join(tempfile.mkdtemp(prefix='bench_frame_'), 'bench.sqlite')
+    os.environ['DEMO'] = 'true'
+    os.environ['DB_USE_SQLITE_FALLBACK'] = 'true'
+    os.environ['SQLITE_PATH'] = path
+
+    from db import Database
+    bench_db = Database()
+    bench_db.ensure_connected()
+    conn = bench_db.sqlite_conn
+
+    rnd = random.Random(42)
+    pacientes = [f"{i:011d}" for i in range(max(1, linhas // 10))]
+    medicos = [f"{i:07d}" for i in range(200)]
+    conn.executemany("INSERT INTO tabelapaciente (CpfPaciente, NomePac, Genero) VALUES (?, ?, ?)",
+                     [(cpf, f"Paciente {cpf}", rnd.choice('MF')) for cpf in pacientes])
+    conn.executemany("INSERT INTO tabelamedico (CodMed, NomeMed, Especialidade) VALUES (?, ?, ?)",
+                     [(cod, f"Médico {cod}", rnd.choice(ESPECIALIDADES)) for cod in medicos])
+    inicio = datetime(2024, 1, 1, 8, 0)
+    conn.executemany("INSERT OR IGNORE INTO tabelaconsulta (CodCli, CodMed, CpfPaciente, Data_Hora) VALUES (?, ?, ?, ?)",
+                     ((rnd.randint(1, 12), rnd.choice(medicos), rnd.choice(pacientes),
+                       (inicio + timedelta(minutes=15 * i)).strftime('%Y-%m-%d %H:%M:%S'))
+                      for i in range(linhas)))
+    conn.commit()
+    return bench_db
+
+
+def caminho_atual(bench_db):
+    """Como as páginas faziam: lista de dicts -> DataFrame -> conversões"""
+    import pandas as pd
+    df = pd.DataFrame(bench_db.fetch_all(QUERY))
+    df['Data_Hora'] = pd.to_datetime(df['Data_Hora'])
+    df['Genero'] = df['Genero'].astype('category')
+    df['Especialidade'] = df['Especialidade'].astype('category')
+    return df
+
+
+def caminho_colunar(bench_db):
+    return bench_db.fetch_frame(QUERY)
+
+
+def medir(nome, func, bench_db, repeticoes):
+    melhor = None
+    linhas = 0
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        df = func(bench_db)
+        duracao = time.perf_counter() - inicio
+        linhas = len(df)
+        melhor = duracao if melhor is None else min(melhor, duracao)
+    taxa = linhas / melhor if melhor else 0
+    print(f"   {nome:<28} {linhas:>10} linhas  {melhor:8.3f}s  {taxa:>12,.0f} linhas/s")
+    return taxa
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de fetch_frame vs fetch_all + DataFrame')
+    parser.add_argument('--linhas', type=int, default=200_000, help='Linhas sintéticas no SQLite (padrão: 200000)')
+    parser.add_argument('--repeticoes', type=int, default=3, help='Repetições por caminho (usa a melhor)')
+    parser.add_argument('--mysql', action='store_true', help='Usar o MySQL configurado no .env em vez de SQLite')
+    args = parser.parse_args()
+
+    print("=" * 70)
+    print("⏱️  BENCHMARK fetch_frame")
+    print("=" * 70)
+
+    if args.mysql:
+        from db import db as bench_db
+        if not bench_db.ensure_connected():
+            print("❌ Sem conexão com o MySQL")
+            return 1
+    else:
+        print(f"\n⏳ Gerando {args.linhas} consultas sintéticas em SQLite...")
+        bench_db = preparar_sqlite(args.linhas)
+
+    print()
+    atual = medir("fetch_all + pd.DataFrame", caminho_atual, bench_db, args.repeticoes)
+    colunar = medir("fetch_frame", caminho_colunar, bench_db, args.repeticoes)
+    if atual:
+        print(f"\n📊 fetch_frame: {colunar / atual:.2f}x linhas/s do caminho atual")
+    print("=" * 70)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+"""
+Busca textual de pacientes e médicos
+Sistema de Consultório Médico
+
+Substitui os filtros ``LIKE '%termo%'`` (que não usam índice) por índices de texto:
+
+- MySQL: índices FULLTEXT em tabelapaciente(NomePac) e tabelamedico(NomeMed, Especialidade),
+  consultados em BOOLEAN MODE com prefixo (``+joa* +silv*``). A collation
+  utf8mb4_0900_ai_ci das tabelas torna a busca insensível a acentos e maiúsculas.
+- SQLite: tabelas FTS5 de conteúdo externo (busca_pacientes, busca_medicos) com
+  ``tokenize='unicode61 remove_diacritics 2'`` e índices de prefixo de 2 e 3 letras,
+  mantidas por triggers. São criadas automaticamente na primeira busca.
+
+Cada palavra digitada é tratada como prefixo e todas precisam aparecer; os resultados da
+busca direta (buscar_pacientes/buscar_medicos) vêm ordenados por relevância. Sem os índices
+(MySQL sem ``python search.py --install``) a busca volta ao LIKE.
+
+    python search.py --install     # cria os índices (MySQL: FULLTEXT; SQLite: FTS5)
+    python search.py --rebuild     # reindexa (SQLite, ex.: após VACUUM, que pode mudar rowids)
+    python search.py --check "joao silva"
+"""
+
+import argparse
+import logging
+import re
+import sys
+import threading
+import time
+
+from db import db
+
+logger = logging.getLogger("consultorio.search")
+
+# Menor palavra indexada pelo InnoDB (innodb_ft_min_token_size); menores viram LIKE 'x%'
+MYSQL_MIN_TOKEN = 3
+
+# SQLite: a relevância (bm25) é calculada só sobre os primeiros N resultados do índice;
+# termos muito comuns ("da", "jo") casam com boa parte da tabela e ordenar todos custa caro
+CANDIDATOS_RANKING = 1000
+
+# {entidade: (tabela, chave, colunas pesquisadas, índice FULLTEXT, tabela FTS5)}
+ENTIDADES = {
+    'pacientes': ('tabelapaciente', 'CpfPaciente', ('NomePac',), 'ft_paciente_nome', 'busca_pacientes'),
+    'medicos': ('tabelamedico', 'CodMed', ('NomeMed', 'Especialidade'), 'ft_medico_nome_especialidade',
+                'busca_medicos'),
+}
+
+_PALAVRA = re.compile(r'\w+', re.UNICODE)
+
+_disponivel = None
+_disponivel_lock = threading.Lock()
+
+
+def _sqlite_ddl(entidade):
+    """Tabela FTS5 de conteúdo externo e triggers que a mantêm em dia com a tabela base"""
+    tabela, _, colunas, _, fts = ENTIDADES[entidade]
+    cols = ', '.join(colunas)
+    novos = ', '.join(f"NEW.{c}" for c in colunas)
+    antigos = ', '.join(f"OLD.{c}" for c in colunas)
+    return [
+        f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+            {cols}, content='{tabela}', content_rowid='rowid',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {tabela} BEGIN
+            INSERT INTO {fts} (rowid, {cols}) VALUES (NEW.rowid, {novos});
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {tabela} BEGIN
+            INSERT INTO {fts} ({fts}, rowid, {cols}) VALUES ('delete', OLD.rowid, {antigos});
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE ON {tabela} BEGIN
+            INSERT INTO {fts} ({fts}, rowid, {cols}) VALUES ('delete', OLD.rowid, {antigos});
+            INSERT INTO {fts} (rowid, {cols}) VALUES (NEW.rowid, {novos});
+        END
+        """,
+    ]
+
+
+def palavras(termo):
+    """Palavras do termo digitado (letras/dígitos; pontuação e operadores são descartados)"""
+    return _PALAVRA.findall(termo or '')
+
+
+def _expressao_fts5(termos):
+    # cada palavra entre aspas (sem operadores do usuário) e como prefixo; espaço = AND
+    return ' '.join(f'"{p}"*' for p in termos)
+
+
+def _expressao_boolean(termos):
+    return ' '.join(f'+{p}*' for p in termos)
+
+
+def instalar(conn, sqlite=False):
+    """Cria os índices de texto (MySQL: FULLTEXT; SQLite: FTS5 + triggers, já populadas)"""
+    cursor = conn.cursor()
+    try:
+        for entidade, (tabela, _, colunas, indice, fts) in ENTIDADES.items():
+            if sqlite:
+                for comando in _sqlite_ddl(entidade):
+                    cursor.execute(comando)
+                cursor.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+            elif not _indice_mysql(cursor, tabela, indice):
+                logger.info(f"Criando índice FULLTEXT {indice} em {tabela}...")
+                cursor.execute(f"ALTER TABLE {tabela} ADD FULLTEXT INDEX {indice} ({', '.join(colunas)})")
+        conn.commit()
+    finally:
+        cursor.close()
+    logger.info(f"Índices de busca instalados ({'SQLite FTS5' if sqlite else 'MySQL FULLTEXT'})")
+
+
+def reconstruir(conn):
+    """Reindexa as tabelas FTS5 a partir das tabelas base (SQLite)"""
+    cursor = conn.cursor()
+    try:
+        for _, _, _, _, fts in ENTIDADES.values():
+            cursor.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+        conn.commit()
+    finally:
+        cursor.close()
+    logger.info("Índices de busca reconstruídos")
+
+
+def _indice_mysql(cursor, tabela, indice):
+    cursor.execute("SELECT 1 FROM information_schema.STATISTICS WHERE TABLE_SCHEMA = DATABASE() "
+                   "AND TABLE_NAME = %s AND INDEX_NAME = %s AND INDEX_TYPE = 'FULLTEXT' LIMIT 1",
+                   (tabela, indice))
+    return cursor.fetchone() is not None
+
+
+def _tabela_sqlite(cursor, nome):
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (nome,))
+    return cursor.fetchone() is not None
+
+
+def disponivel():
+    """
+    True se os índices de texto existem. No SQLite cria tudo na primeira chamada; no
+    MySQL apenas verifica e, se faltar algo, as buscas usam LIKE.
+    """
+    global _disponivel
+    with _disponivel_lock:
+        if _disponivel is not None:
+            return _disponivel
+        try:
+            with db.raw_connection() as conn:
+                cursor = conn.cursor()
+                try:
+                    if db.use_sqlite:
+                        instalado = all(_tabela_sqlite(cursor, fts) for *_, fts in ENTIDADES.values())
+                    else:
+                        instalado = all(_indice_mysql(cursor, tabela, indice)
+                                        for tabela, _, _, indice, _ in ENTIDADES.values())
+                finally:
+                    cursor.close()
+                if not instalado and db.use_sqlite:
+                    instalar(conn, sqlite=True)
+                    instalado = True
+            if not instalado:
+                logger.warning("Índices FULLTEXT ausentes no MySQL (python search.py --install); "
+                               "buscas usando LIKE")
+            _disponivel = instalado
+        except Exception as e:
+            logger.error(f"Erro ao verificar índices de busca: {e}")
+            return False
+        return _disponivel
+
+
+def condicao(entidade, termo, alias=None):
+    """
+    Condição SQL (para WHERE) que restringe ``entidade`` às linhas que casam com ``termo``.
+
+    Args:
+        entidade: 'pacientes' ou 'medicos'
+        termo: Texto digitado
+        alias: Alias da tabela base na consulta (ex.: 'p')
+
+    Returns:
+        Tuple[str, list]: (condição, parâmetros); ("", []) se o termo não tiver palavras
+    """
+    tabela, _, colunas, _, fts = ENTIDADES[entidade]
+    termos = palavras(termo)
+    if not termos:
+        return "", []
+    prefixo = f"{alias}." if alias else ""
+
+    if disponivel():
+        if db.use_sqlite:
+            return (f"{prefixo}rowid IN (SELECT rowid FROM {fts} WHERE {fts} MATCH %s)",
+                    [_expressao_fts5(termos)])
+        longos = [p for p in termos if len(p) >= MYSQL_MIN_TOKEN]
+        curtos = [p for p in termos if len(p) < MYSQL_MIN_TOKEN]
+        partes, params = [], []
+        if longos:
+            partes.append(f"MATCH ({', '.join(prefixo + c for c in colunas)}) AGAINST (%s IN BOOLEAN MODE)")
+            params.append(_expressao_boolean(longos))
+        for p in curtos:
+            # palavras curtas não entram no índice FULLTEXT: prefixo em qualquer coluna
+            # (a do nome usa o índice B-tree)
+            partes.append('(' + ' OR '.join(f"{prefixo}{c} LIKE %s" for c in colunas) + ')')
+            params += [f"{p}%"] * len(colunas)
+        return ' AND '.join(partes), params
+
+    # sem índice de texto: comportamento antigo (substring em qualquer coluna)
+    partes, params = [], []
+    for p in termos:
+        partes.append('(' + ' OR '.join(f"{prefixo}{c} LIKE %s" for c in colunas) + ')')
+        params += [f"%{p}%"] * len(colunas)
+    return ' AND '.join(partes), params
+
+
+def buscar(entidade, termo, limit=20, colunas_resultado=None):
+    """
+    Linhas de ``entidade`` que casam com ``termo``, das mais relevantes para as menos
+    (type-ahead). Lista vazia se o termo não tiver palavras.
+    """
+    tabela, chave, colunas, _, fts = ENTIDADES[entidade]
+    termos = palavras(termo)
+    if not termos:
+        return []
+    selecao = ', '.join(f"t.{c}" for c in (colunas_resultado or (chave,) + colunas))
+
+    if disponivel() and db.use_sqlite:
+        return db.fetch_all(
+            f"SELECT {selecao} FROM (SELECT rowid, rank FROM {fts} WHERE {fts} MATCH %s LIMIT %s) f "
+            f"JOIN {tabela} t ON t.rowid = f.rowid ORDER BY f.rank LIMIT %s",
+            (_expressao_fts5(termos), max(limit, CANDIDATOS_RANKING), limit))
+
+    where, params = condicao(entidade, termo, alias='t')
+    if disponivel() and any(len(p) >= MYSQL_MIN_TOKEN for p in termos):
+        longos = _expressao_boolean([p for p in termos if len(p) >= MYSQL_MIN_TOKEN])
+        relevancia = f"MATCH ({', '.join('t.' + c for c in colunas)}) AGAINST (%s IN BOOLEAN MODE)"
+        return db.fetch_all(
+            f"SELECT {selecao} FROM {tabela} t WHERE {where} ORDER BY {relevancia} DESC, t.{colunas[0]} LIMIT %s",
+            tuple(params) + (longos, limit))
+    return db.fetch_all(
+        f"SELECT {selecao} FROM {tabela} t WHERE {where} ORDER BY t.{colunas[0]} LIMIT %s",
+        tuple(params) + (limit,))
+
+
+def _proximo_prefixo(digitos):
+    """Menor sequência de dígitos maior que todas as iniciadas por ``digitos`` ('129' -> '13'); None se só 9s"""
+    base = digitos.rstrip('9')
+    if not base:
+        return None
+    return base[:-1] + str(int(base[-1]) + 1)
+
+
+def buscar_pacientes(termo, limit=20):
+    """Pacientes (CpfPaciente, NomePac) por nome, mais relevantes primeiro, ou pelo início do CPF"""
+    digitos = (termo or '').strip().replace('.', '').replace('-', '')
+    if digitos.isdigit():
+        # prefixo da chave primária como intervalo (o LIKE do SQLite ignora maiúsculas e não usa o índice)
+        fim = _proximo_prefixo(digitos)
+        if fim is None:
+            return db.fetch_all("SELECT CpfPaciente, NomePac FROM tabelapaciente WHERE CpfPaciente >= %s "
+                                "ORDER BY CpfPaciente LIMIT %s", (digitos, limit))
+        return db.fetch_all("SELECT CpfPaciente, NomePac FROM tabelapaciente "
+                            "WHERE CpfPaciente >= %s AND CpfPaciente < %s "
+                            "ORDER BY CpfPaciente LIMIT %s", (digitos, fim, limit))
+    return buscar('pacientes', termo, limit)
+
+
+def buscar_medicos(termo, limit=20):
+    """Médicos (CodMed, NomeMed, Especialidade) por nome ou especialidade, mais relevantes primeiro"""
+    return buscar('medicos', termo, limit)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Índices de busca de pacientes e médicos')
+    parser.add_argument('--install', action='store_true', help='Cria os índices de texto')
+    parser.add_argument('--rebuild', action='store_true', help='Reindexa as tabelas FTS5 (SQLite)')
+    parser.add_argument('--check', metavar='TERMO', help='Executa uma busca e mostra o tempo')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
+
+    if not (args.install or args.rebuild or args.check):
+        parser.print_help()
+        return 1
+    if not db.ensure_connected():
+        logger.error("Sem conexão com o banco de dados")
+        return 1
+
+    with db.raw_connection() as conn:
+        if args.install:
+            instalar(conn, sqlite=db.use_sqlite)
+        elif args.rebuild:
+            if not db.use_sqlite:
+                logger.info("No MySQL os índices FULLTEXT são mantidos pelo InnoDB; nada a fazer")
+            else:
+                reconstruir(conn)
+
+    if args.check:
+        for entidade in ENTIDADES:
+            inicio = time.perf_counter()
+            linhas = buscar(entidade, args.check, limit=10)
+            logger.info(f"{entidade}: {len(linhas)} resultado(s) em {(time.perf_counter() - inicio) * 1000:.1f} ms")
+            for linha in linhas:
+                logger.info(f"   {linha}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())